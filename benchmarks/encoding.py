@@ -0,0 +1,91 @@
+"""Benchmark encode time and output size of every output format.
+
+Usage:
+    python -m benchmarks.encoding --img_path test_images/xray.jpg
+
+"""
+import json
+from argparse import ArgumentParser
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.util import time_call
+from synthesis.encoding import SUFFIXES, encode_image, get_save_options
+
+
+# (name, suffix, save options) of every configuration to benchmark
+CONFIGS = [(f'png (compress_level={level})', SUFFIXES['png'],
+            get_save_options(png_compress_level=level))
+           for level in (0, 1, 3, 6, 9)] + \
+          [(f'jpeg (quality={quality}, subsampling={subsampling})',
+            SUFFIXES['jpeg'],
+            get_save_options(jpeg_quality=quality,
+                             jpeg_subsampling=subsampling))
+           for quality in (75, 95) for subsampling in ('4:4:4', '4:2:0')] + \
+          [('webp (lossless)', SUFFIXES['webp'], get_save_options()),
+           ('raw (uint8 .npy)', SUFFIXES['raw'], get_save_options())]
+
+
+def benchmark_encoding(img, repeat):
+    """Time the encoding of an image in every configuration.
+
+    Args:
+        img (Image): PIL image to encode
+        repeat (int): number of timed encodes per configuration
+
+    Returns:
+        (list): one dict of results per configuration
+
+    """
+    results = []
+    for name, suffix, save_options in CONFIGS:
+        data = encode_image(img, suffix, save_options)
+        times = time_call(lambda: encode_image(img, suffix, save_options),
+                          repeat)
+        results.append({'format': name,
+                        'encode_ms': float(np.median(times)) * 1000,
+                        'bytes': len(data),
+                        'ratio': len(data) / len(img.tobytes())})
+    return results
+
+
+def parse_script_args():
+    """Parse command line arguments.
+
+    Returns:
+        args (Namespace): Parsed command line arguments
+
+    """
+    parser = ArgumentParser()
+
+    parser.add_argument('--img_path', type=str,
+                        default='test_images/xray.jpg',
+                        help='Path to image to encode')
+
+    parser.add_argument('--mode', type=str,
+                        choices=('L', 'RGB'), default='L',
+                        help='Mode to convert the image to before encoding')
+
+    parser.add_argument('--repeat', type=int,
+                        default=10, help='Number of timed encodes per format')
+
+    parser.add_argument('--output_json', type=str,
+                        help='Where to save the results as JSON')
+
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_script_args()
+    img = Image.open(args.img_path).convert(args.mode)
+    results = benchmark_encoding(img, args.repeat)
+    print(f'{"format":<40} {"encode ms":>10} {"bytes":>10} {"ratio":>6}')
+    for result in results:
+        print(f'{result["format"]:<40} {result["encode_ms"]:>10.2f} ' +
+              f'{result["bytes"]:>10} {result["ratio"]:>6.3f}')
+    if args.output_json:
+        with open(args.output_json, 'w') as f:
+            json.dump({'img_path': args.img_path, 'mode': args.mode,
+                       'size': img.size, 'results': results}, f, indent=4)
@@ -0,0 +1,264 @@
+"""Check optimized transforms against their reference implementations.
+
+Each case pairs the implementation a perturbation used before it was
+optimized with the one it uses now. Both are run on the same image with the
+same parameters, drawn once per level and seed by the perturbation's
+sample_params, and their outputs are compared by PSNR and maximum and mean
+absolute error against the tolerances of the case. The references for
+transforms that have since been rewritten are pinned in benchmarks.baseline. A faster candidate for any
+perturbation can be checked by adding a case to CASES.
+
+Usage:
+    python -m benchmarks.equivalence --img_path test_images/xray.jpg
+
+"""
+import json
+import sys
+from argparse import ArgumentParser
+from collections import namedtuple
+
+import numpy as np
+from PIL import Image, ImageEnhance
+from skimage import exposure
+
+from benchmarks import baseline
+from benchmarks.util import time_call
+from transforms.constants import LEVELS, PARAMETRIC
+from transforms.photometric import photometric_apply
+from transforms.tilt import tilt_apply
+
+# sample_params (function) draws the parameters shared by reference and
+# candidate, both called as fn(img, params). Outputs pass if their PSNR is at
+# least min_psnr, no pixel differs by more than max_abs_error and pixels
+# differ by no more than max_mean_abs_error on average
+EquivalenceCase = namedtuple('EquivalenceCase', ['sample_params', 'reference',
+                                                 'candidate', 'min_psnr',
+                                                 'max_abs_error',
+                                                 'max_mean_abs_error'],
+                             defaults=(float('inf'),))
+
+
+def reference_moire(img, params):
+    """Apply the baseline Moire mapping, which warps and crops a base mask.
+
+    The baseline always returns RGB, which is converted back to the mode of
+    img. Gray RGB converts to L exactly.
+
+    """
+    return baseline.moire(img, upsample_factor=2,
+                          thickness=params['thickness'], gap=params['gap'],
+                          opacity=params['opacity'], darkness=1.0,
+                          mask_params=params['masks']).convert(img.mode)
+
+
+def reference_glare_matte(img, params):
+    """Apply the baseline glare matte mapping in the mode of img."""
+    return baseline.glare_matte(img, params['masks'],
+                                params['level']).convert(img.mode)
+
+
+def reference_tilt(img, params):
+    """Apply a 3-D tilt with the baseline normal equations solution."""
+    width, height = img.size
+    coeffs = baseline.find_coeffs(params['corners'],
+                                  [(0, 0), (width, 0), (width, height),
+                                   (0, height)])
+    return img.transform((width, height), Image.PERSPECTIVE, coeffs,
+                         Image.BICUBIC)
+
+
+def reference_photometric(img, params):
+    """Apply photometric operations one full pass at a time."""
+    for name, arg in params['ops']:
+        if name == 'brightness':
+            img = ImageEnhance.Brightness(img).enhance(arg)
+        elif name == 'contrast':
+            img = ImageEnhance.Contrast(img).enhance(arg)
+        elif name == 'sigmoid':
+            cutoff, gain = arg
+            img = Image.fromarray(exposure.adjust_sigmoid(
+                np.asarray(img), cutoff=cutoff, gain=gain))
+        else:
+            raise ValueError(f'Unknown photometric operation "{name}"')
+    return img
+
+
+# The analytic Moire masks sample the same mask pixels as the baseline, but
+# solve the perspective warp exactly rather than by the normal equations.
+# Mask pixels whose centres fall within rounding error of a line edge, about
+# 0.02% of them, can therefore land on the other side of it. A run of such
+# pixels along one upsampled row of opacity 127 changes the downsampled
+# image by at most 57, and the whole image stays within a small mean error
+CASES = {
+    'moire': EquivalenceCase(PARAMETRIC['moire'].sample_params,
+                             reference_moire, PARAMETRIC['moire'].apply,
+                             min_psnr=50, max_abs_error=57,
+                             max_mean_abs_error=0.1),
+    'glare_matte': EquivalenceCase(PARAMETRIC['glare_matte'].sample_params,
+                                   reference_glare_matte,
+                                   PARAMETRIC['glare_matte'].apply,
+                                   min_psnr=50, max_abs_error=1),
+    'tilt': EquivalenceCase(PARAMETRIC['tilt'].sample_params, reference_tilt,
+                            tilt_apply, min_psnr=50, max_abs_error=1),
+}
+for _name in ('brightness_up', 'brightness_down', 'contrast_up',
+              'contrast_down', 'exposure', 'random-digital'):
+    CASES[_name] = EquivalenceCase(PARAMETRIC[_name].sample_params,
+                                   reference_photometric, photometric_apply,
+                                   min_psnr=float('inf'), max_abs_error=0)
+
+
+def compare_outputs(reference, candidate):
+    """Compute the PSNR and error between two outputs.
+
+    Args:
+        reference (Image): output of the reference implementation
+        candidate (Image): output of the candidate implementation
+
+    Returns:
+        (dict): PSNR in dB (inf if identical), and maximum and mean absolute
+            error per pixel
+
+    """
+    if reference.size != candidate.size or \
+            reference.mode != candidate.mode:
+        raise ValueError(f'Output mismatch: reference is {reference.mode} '
+                         f'{reference.size}, candidate is {candidate.mode} '
+                         f'{candidate.size}')
+    error = np.abs(np.asarray(reference, dtype=np.float64) -
+                   np.asarray(candidate, dtype=np.float64))
+    mse = float(np.mean(error ** 2))
+    psnr = 10 * np.log10(255 ** 2 / mse) if mse > 0 else float('inf')
+    return {'psnr': float(psnr), 'max_abs_error': float(error.max()),
+            'mean_abs_error': float(error.mean())}
+
+
+def check_equivalence(img, cases, levels, seeds, repeat, min_psnr=None,
+                      max_abs_error=None, max_mean_abs_error=None):
+    """Run every case at every level and seed, and time it.
+
+    Args:
+        img (Image): PIL image to perturb
+        cases (dict): maps name (str) -> EquivalenceCase
+        levels (list): list of each level (int) to check
+        seeds (int): number of parameter draws per case and level
+        repeat (int): number of timed calls per implementation
+        min_psnr (float): overrides the PSNR tolerance of every case
+        max_abs_error (float): overrides the error tolerance of every case
+        max_mean_abs_error (float): overrides the mean error tolerance of
+            every case
+
+    Returns:
+        (list): one dict of results per case and level, with the worst
+            accuracy over the seeds and the speedup of the candidate
+
+    """
+    results = []
+    for name, case in cases.items():
+        case_min_psnr = case.min_psnr if min_psnr is None else min_psnr
+        case_max_error = case.max_abs_error if max_abs_error is None \
+            else max_abs_error
+        case_max_mean_error = case.max_mean_abs_error \
+            if max_mean_abs_error is None else max_mean_abs_error
+        for level in levels:
+            metrics, reference_times, candidate_times = [], [], []
+            for seed in range(seeds):
+                rng = np.random.RandomState(seed)
+                params = case.sample_params(level, rng, img.size)
+                metrics.append(compare_outputs(case.reference(img, params),
+                                               case.candidate(img, params)))
+                reference_times.extend(time_call(
+                    lambda: case.reference(img, params), repeat))
+                candidate_times.extend(time_call(
+                    lambda: case.candidate(img, params), repeat))
+            result = {'case': name, 'level': level,
+                      'psnr': min(m['psnr'] for m in metrics),
+                      'max_abs_error': max(m['max_abs_error']
+                                           for m in metrics),
+                      'mean_abs_error': float(np.mean(
+                          [m['mean_abs_error'] for m in metrics])),
+                      'reference_ms': float(np.median(reference_times))
+                      * 1000,
+                      'candidate_ms': float(np.median(candidate_times))
+                      * 1000}
+            result['speedup'] = result['reference_ms'] / \
+                result['candidate_ms']
+            result['passed'] = result['psnr'] >= case_min_psnr and \
+                result['max_abs_error'] <= case_max_error and \
+                result['mean_abs_error'] <= case_max_mean_error
+            results.append(result)
+    return results
+
+
+def parse_script_args():
+    """Parse command line arguments.
+
+    Returns:
+        args (Namespace): Parsed command line arguments
+
+    """
+    parser = ArgumentParser()
+
+    parser.add_argument('--img_path', type=str,
+                        default='test_images/xray.jpg',
+                        help='Path to image to perturb')
+
+    parser.add_argument('--mode', type=str,
+                        choices=('L', 'RGB'), default='L',
+                        help='Mode to convert the image to before perturbing')
+
+    parser.add_argument('--cases', type=str, nargs='+',
+                        choices=tuple(CASES.keys()),
+                        help='Cases to check. Default: all')
+
+    parser.add_argument('--levels', type=int, nargs='+',
+                        choices=tuple(LEVELS), default=LEVELS,
+                        help='Levels to check. Default: all')
+
+    parser.add_argument('--seeds', type=int, default=3,
+                        help='Number of parameter draws per case and level')
+
+    parser.add_argument('--repeat', type=int,
+                        default=3, help='Number of timed calls per draw')
+
+    parser.add_argument('--min_psnr', type=float,
+                        help='Minimum PSNR in dB. Default: per case')
+
+    parser.add_argument('--max_abs_error', type=float,
+                        help='Maximum absolute error of any pixel. '
+                             'Default: per case')
+
+    parser.add_argument('--max_mean_abs_error', type=float,
+                        help='Maximum mean absolute error per pixel. '
+                             'Default: per case')
+
+    parser.add_argument('--output_json', type=str,
+                        help='Where to save the results as JSON')
+
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_script_args()
+    img = Image.open(args.img_path).convert(args.mode)
+    cases = {name: CASES[name] for name in args.cases or CASES}
+    results = check_equivalence(img, cases, args.levels, args.seeds,
+                                args.repeat, args.min_psnr,
+                                args.max_abs_error, args.max_mean_abs_error)
+    print(f'{"case":<16} {"level":>5} {"PSNR":>7} {"max err":>7} ' +
+          f'{"mean err":>8} {"ref ms":>8} {"cand ms":>8} {"speedup":>7} ' +
+          f'{"result":>6}')
+    for result in results:
+        print(f'{result["case"]:<16} {result["level"]:>5} ' +
+              f'{result["psnr"]:>7.1f} {result["max_abs_error"]:>7.0f} ' +
+              f'{result["mean_abs_error"]:>8.3f} ' +
+              f'{result["reference_ms"]:>8.2f} ' +
+              f'{result["candidate_ms"]:>8.2f} {result["speedup"]:>7.2f} ' +
+              f'{"pass" if result["passed"] else "FAIL":>6}')
+    if args.output_json:
+        with open(args.output_json, 'w') as f:
+            json.dump({'img_path': args.img_path, 'mode': args.mode,
+                       'size': img.size, 'results': results}, f, indent=4)
+    if not all(result['passed'] for result in results):
+        sys.exit(1)
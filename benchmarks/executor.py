@@ -0,0 +1,195 @@
+"""Compare thread and process workers of synthesize.py on every perturbation.
+
+Copies of an image are written as JPEGs to a temporary source tree, which
+synthesize.py's generate_data then perturbs with --executor process and
+--executor thread, writing PNGs to a temporary destination. The whole path
+is measured: starting the pool and its workers, limiting their threads,
+scheduling chunks, decoding, perturbing, encoding and writing. Every run
+starts in a fresh process, so the peak memory is that of the run alone: the
+peak RSS of the parent, which holds the threads, and of the largest worker
+process.
+
+Usage:
+    python -m benchmarks.executor --img_path test_images/xray.jpg
+
+"""
+import json
+import multiprocessing
+import resource
+import tempfile
+import time
+from argparse import ArgumentParser
+from contextlib import redirect_stderr, redirect_stdout
+from io import StringIO
+from pathlib import Path
+
+import pandas as pd
+from PIL import Image
+
+from synthesis.stream import EXECUTORS
+import synthesize
+from transforms.constants import LEVELS, PERTURBATIONS
+
+
+def make_sources(img, num_images, src_root):
+    """Write copies of an image as JPEG sources and their csv.
+
+    Args:
+        img (Image): PIL image to copy
+        num_images (int): number of copies
+        src_root (Path): directory to write them to
+
+    Returns:
+        (Path): source csv listing the copies under 'Path', relative to
+            src_root
+
+    """
+    paths = []
+    for i in range(num_images):
+        path = f'patient{i:05d}/study1/view1_frontal.jpg'
+        (src_root / path).parent.mkdir(parents=True, exist_ok=True)
+        img.save(src_root / path, quality=95)
+        paths.append(path)
+    src_csv = src_root / 'train.csv'
+    pd.DataFrame({'Path': paths}).to_csv(src_csv, index=False)
+    return src_csv
+
+
+def _run_and_report(argv, queue):
+    """Run generate_data and report its time and peak RSS."""
+    args = synthesize.parse_script_args(argv)
+    start = time.perf_counter()
+    # Keep the progress bar and summary out of the results
+    with redirect_stdout(StringIO()), redirect_stderr(StringIO()):
+        synthesize.generate_data(args)
+    seconds = time.perf_counter() - start
+    # ru_maxrss is in kB on Linux
+    queue.put((seconds,
+               resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024))
+
+
+def run_isolated(argv):
+    """Run synthesize.py with the given arguments in a fresh process.
+
+    Returns:
+        seconds (float): wall time of generate_data
+        peak (int): peak RSS of the process holding the pool, in bytes
+        worker_peak (int): peak RSS of the largest worker process, in bytes
+
+    """
+    context = multiprocessing.get_context('fork')
+    queue = context.Queue()
+    process = context.Process(target=_run_and_report, args=(argv, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def benchmark_executors(src_csv, src_root, perturbations, level, num_workers,
+                        chunk_size):
+    """Time synthesize.py on every perturbation with every kind of pool.
+
+    Args:
+        src_csv (Path): source csv
+        src_root (Path): directory relative to which sources are resolved
+        perturbations (list): names (str) of perturbations to benchmark
+        level (int): level of the perturbations
+        num_workers (int): number of threads or processes of each pool
+        chunk_size (int): number of images per task
+
+    Returns:
+        (list): one dict of results per perturbation
+
+    """
+    num_images = len(pd.read_csv(src_csv))
+    results = []
+    for name in perturbations:
+        result = {'perturbation': name, 'level': level}
+        for executor in EXECUTORS:
+            with tempfile.TemporaryDirectory() as dst_dir:
+                seconds, peak, worker_peak = run_isolated([
+                    '--src_csv', str(src_csv), '--src_root', str(src_root),
+                    '--dst_dir', dst_dir, '--split', 'train',
+                    '--chains', f'{name}:{level}', '--format', 'png',
+                    '--num_workers', str(num_workers),
+                    '--chunk_size', str(chunk_size),
+                    '--executor', executor])
+            result[f'{executor}_s'] = seconds
+            result[f'{executor}_images_per_s'] = num_images / seconds
+            result[f'{executor}_peak_mb'] = peak / 2 ** 20
+            if executor == 'process':
+                result['process_worker_peak_mb'] = worker_peak / 2 ** 20
+        result['thread_speedup'] = result['process_s'] / result['thread_s']
+        results.append(result)
+    return results
+
+
+def parse_script_args():
+    """Parse command line arguments.
+
+    Returns:
+        args (Namespace): Parsed command line arguments
+
+    """
+    parser = ArgumentParser()
+
+    parser.add_argument('--img_path', type=str,
+                        default='test_images/xray.jpg',
+                        help='Path to image to copy as sources')
+
+    parser.add_argument('--mode', type=str,
+                        choices=('L', 'RGB'), default='L',
+                        help='Mode to convert the image to before copying')
+
+    parser.add_argument('--num_images', type=int,
+                        default=32, help='Number of source images')
+
+    parser.add_argument('--num_workers', type=int,
+                        default=4, help='Number of threads or processes')
+
+    parser.add_argument('--chunk_size', type=int,
+                        default=4, help='Number of images per task')
+
+    parser.add_argument('--perturbations', type=str, nargs='+',
+                        choices=tuple(PERTURBATIONS.keys()),
+                        help='Perturbations to benchmark. Default: all')
+
+    parser.add_argument('--level', type=int,
+                        choices=tuple(LEVELS), default=2,
+                        help='Level of the perturbations')
+
+    parser.add_argument('--output_json', type=str,
+                        help='Where to save the results as JSON')
+
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_script_args()
+    img = Image.open(args.img_path).convert(args.mode)
+    with tempfile.TemporaryDirectory() as src_root:
+        src_csv = make_sources(img, args.num_images, Path(src_root))
+        results = benchmark_executors(src_csv, src_root,
+                                      args.perturbations or PERTURBATIONS,
+                                      args.level, args.num_workers,
+                                      args.chunk_size)
+    print(f'{"perturbation":<16} {"process s":>9} {"thread s":>8} ' +
+          f'{"speedup":>7} {"process MB":>10} {"worker MB":>9} ' +
+          f'{"thread MB":>9}')
+    for result in results:
+        print(f'{result["perturbation"]:<16} {result["process_s"]:>9.2f} ' +
+              f'{result["thread_s"]:>8.2f} ' +
+              f'{result["thread_speedup"]:>7.2f} ' +
+              f'{result["process_peak_mb"]:>10.1f} ' +
+              f'{result["process_worker_peak_mb"]:>9.1f} ' +
+              f'{result["thread_peak_mb"]:>9.1f}')
+    if args.output_json:
+        with open(args.output_json, 'w') as f:
+            json.dump({'img_path': args.img_path, 'mode': args.mode,
+                       'size': img.size, 'num_images': args.num_images,
+                       'num_workers': args.num_workers,
+                       'chunk_size': args.chunk_size,
+                       'results': results}, f, indent=4)
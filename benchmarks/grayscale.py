@@ -0,0 +1,93 @@
+"""Benchmark every transform on RGB and on single-channel (L) images.
+
+Usage:
+    python -m benchmarks.grayscale --img_path test_images/xray.jpg
+
+"""
+import json
+from argparse import ArgumentParser
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.util import peak_memory, time_call
+from transforms.constants import LEVELS, PERTURBATIONS
+
+
+def benchmark_modes(img, perturbations, levels, repeat):
+    """Time every perturbation and level on RGB and L versions of an image.
+
+    Args:
+        img (Image): PIL image to perturb
+        perturbations (dict): maps name (str) -> mapping function (function)
+        levels (list): list of each level (int) to benchmark
+        repeat (int): number of timed calls per perturbation, level and mode
+
+    Returns:
+        (list): one dict of results per perturbation and level
+
+    """
+    imgs = {'RGB': img.convert('RGB'), 'L': img.convert('L')}
+    results = []
+    for name, mapping_fn in perturbations.items():
+        for level in levels:
+            result = {'perturbation': name, 'level': level}
+            for mode, mode_img in imgs.items():
+                np.random.seed(0)
+                times = time_call(lambda: mapping_fn(level, mode_img), repeat)
+                result[f'{mode}_ms'] = float(np.median(times)) * 1000
+                result[f'{mode}_peak_mb'] = \
+                    peak_memory(lambda: mapping_fn(level, mode_img)) / 2 ** 20
+            result['speedup'] = result['RGB_ms'] / result['L_ms']
+            results.append(result)
+    return results
+
+
+def parse_script_args():
+    """Parse command line arguments.
+
+    Returns:
+        args (Namespace): Parsed command line arguments
+
+    """
+    parser = ArgumentParser()
+
+    parser.add_argument('--img_path', type=str,
+                        default='test_images/xray.jpg',
+                        help='Path to image to perturb')
+
+    parser.add_argument('--perturbations', type=str, nargs='+',
+                        choices=tuple(PERTURBATIONS.keys()),
+                        help='Perturbations to benchmark. Default: all')
+
+    parser.add_argument('--levels', type=int, nargs='+',
+                        choices=tuple(LEVELS), default=LEVELS,
+                        help='Levels to benchmark. Default: all')
+
+    parser.add_argument('--repeat', type=int,
+                        default=5, help='Number of timed calls per mode')
+
+    parser.add_argument('--output_json', type=str,
+                        help='Where to save the results as JSON')
+
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_script_args()
+    img = Image.open(args.img_path)
+    perturbations = {name: PERTURBATIONS[name]
+                     for name in args.perturbations or PERTURBATIONS}
+    results = benchmark_modes(img, perturbations, args.levels, args.repeat)
+    print(f'{"perturbation":<16} {"level":>5} {"RGB ms":>8} {"L ms":>8} ' +
+          f'{"speedup":>7} {"RGB MB":>8} {"L MB":>8}')
+    for result in results:
+        print(f'{result["perturbation"]:<16} {result["level"]:>5} ' +
+              f'{result["RGB_ms"]:>8.2f} {result["L_ms"]:>8.2f} ' +
+              f'{result["speedup"]:>7.2f} {result["RGB_peak_mb"]:>8.1f} ' +
+              f'{result["L_peak_mb"]:>8.1f}')
+    if args.output_json:
+        with open(args.output_json, 'w') as f:
+            json.dump({'img_path': args.img_path, 'size': img.size,
+                       'results': results}, f, indent=4)
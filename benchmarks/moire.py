@@ -0,0 +1,108 @@
+"""Benchmark analytic_moire against the mask-based moire at every level.
+
+The cache of analytic_moire is cleared before every call, so that each call
+is timed and measured with its masks built from scratch.
+
+Usage:
+    python -m benchmarks.moire --img_path test_images/xray.jpg
+
+"""
+import json
+from argparse import ArgumentParser
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.util import peak_memory, time_call
+from transforms.constants import LEVELS
+from transforms.moire import (analytic_moire, get_moire_params, moire,
+                              moire_alpha_cache)
+
+
+def benchmark_moire(img, levels, repeat, seed):
+    """Time both Moire implementations with the same mask parameters.
+
+    Args:
+        img (Image): PIL image to perturb
+        levels (list): list of each level (int) to benchmark
+        repeat (int): number of timed calls per implementation and level
+        seed (int): seed from which the mask parameters are drawn
+
+    Returns:
+        (list): one dict of results per level
+
+    """
+    rng = np.random.RandomState(seed)
+    results = []
+    for level in levels:
+        gap, opacity = get_moire_params(level)
+        mask_params = [(90, 0.5, tuple(rng.uniform(0, 100, 2))),
+                       (90 + rng.normal(0, 1), 0.5,
+                        tuple(rng.uniform(0, 100, 2)))]
+        result = {'level': level}
+        outputs = {}
+        for name, moire_fn in (('mask', moire), ('analytic', analytic_moire)):
+            def run():
+                moire_alpha_cache.clear()
+                return moire_fn(img, upsample_factor=2, thickness=1, gap=gap,
+                                opacity=opacity, darkness=1.0,
+                                mask_params=mask_params)
+            outputs[name] = np.asarray(run(), dtype=float)
+            result[f'{name}_ms'] = float(np.median(time_call(run, repeat))) \
+                * 1000
+            result[f'{name}_peak_mb'] = peak_memory(run) / 2 ** 20
+        error = np.abs(outputs['mask'] - outputs['analytic'])
+        result['speedup'] = result['mask_ms'] / result['analytic_ms']
+        result['max_abs_error'] = float(error.max())
+        result['mean_abs_error'] = float(error.mean())
+        results.append(result)
+    return results
+
+
+def parse_script_args():
+    """Parse command line arguments.
+
+    Returns:
+        args (Namespace): Parsed command line arguments
+
+    """
+    parser = ArgumentParser()
+
+    parser.add_argument('--img_path', type=str,
+                        default='test_images/xray.jpg',
+                        help='Path to image to perturb')
+
+    parser.add_argument('--mode', type=str,
+                        choices=('L', 'RGB'), default='L',
+                        help='Mode to convert the image to before perturbing')
+
+    parser.add_argument('--repeat', type=int,
+                        default=3, help='Number of timed calls per level')
+
+    parser.add_argument('--seed', type=int,
+                        default=0, help='Seed of the mask parameters')
+
+    parser.add_argument('--output_json', type=str,
+                        help='Where to save the results as JSON')
+
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_script_args()
+    img = Image.open(args.img_path).convert(args.mode)
+    results = benchmark_moire(img, LEVELS, args.repeat, args.seed)
+    print(f'{"level":>5} {"mask ms":>9} {"analytic ms":>11} {"speedup":>7} ' +
+          f'{"mask MB":>8} {"analytic MB":>11} {"max err":>7} {"mean err":>8}')
+    for result in results:
+        print(f'{result["level"]:>5} {result["mask_ms"]:>9.1f} ' +
+              f'{result["analytic_ms"]:>11.1f} {result["speedup"]:>7.2f} ' +
+              f'{result["mask_peak_mb"]:>8.1f} ' +
+              f'{result["analytic_peak_mb"]:>11.1f} ' +
+              f'{result["max_abs_error"]:>7.0f} ' +
+              f'{result["mean_abs_error"]:>8.3f}')
+    if args.output_json:
+        with open(args.output_json, 'w') as f:
+            json.dump({'img_path': args.img_path, 'mode': args.mode,
+                       'size': img.size, 'results': results}, f, indent=4)
@@ -0,0 +1,223 @@
+"""Benchmark every transform at every level and resolution.
+
+Each mapping of PERTURBATIONS is timed on the source image and on copies of
+it resized to CheXpert-typical resolutions, reporting throughput and the peak
+memory of a call. Results can be saved as JSON and compared against a stored
+baseline, flagging every transform, level and image that got slower or uses
+more memory beyond a tolerance.
+
+Usage:
+    python -m benchmarks.suite --output_json baseline.json
+    python -m benchmarks.suite --baseline baseline.json
+    python -m benchmarks.suite --results current.json --baseline baseline.json
+
+"""
+import json
+import sys
+from argparse import ArgumentParser
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.util import peak_memory, time_call
+from transforms.constants import LEVELS, PERTURBATIONS
+
+# Side of the square images benchmarked besides the source image
+SIZES = (320, 1024, 2500)
+
+# Peak memory growth below which a change is never flagged, in MB
+MIN_PEAK_DELTA_MB = 1.0
+
+
+def load_images(img_path, sizes, mode):
+    """Load the source image and resized copies of it.
+
+    Args:
+        img_path (str): path to the source image
+        sizes (list): side (int) of each square copy
+        mode (str): PIL mode to convert the images to
+
+    Returns:
+        (dict): maps name (str) -> PIL Image
+
+    """
+    img = Image.open(img_path).convert(mode)
+    images = {f'source {img.width}x{img.height}': img}
+    for size in sizes:
+        images[f'{size}x{size}'] = img.resize((size, size), Image.BICUBIC)
+    return images
+
+
+def benchmark_suite(images, perturbations, levels, repeat):
+    """Time every perturbation and level on every image.
+
+    Args:
+        images (dict): maps name (str) -> PIL Image to perturb
+        perturbations (dict): maps name (str) -> mapping function (function)
+        levels (list): list of each level (int) to benchmark
+        repeat (int): number of timed calls per image, perturbation and level
+
+    Returns:
+        (list): one dict of results per image, perturbation and level
+
+    """
+    results = []
+    for img_name, img in images.items():
+        megapixels = img.width * img.height / 1e6
+        for name, mapping_fn in perturbations.items():
+            for level in levels:
+                np.random.seed(0)
+                times = time_call(lambda: mapping_fn(level, img), repeat)
+                median = float(np.median(times))
+                peak = peak_memory(lambda: mapping_fn(level, img))
+                results.append({'image': img_name, 'width': img.width,
+                                'height': img.height, 'perturbation': name,
+                                'level': level, 'median_ms': median * 1000,
+                                'min_ms': float(times.min()) * 1000,
+                                'images_per_s': 1 / median,
+                                'mpix_per_s': megapixels / median,
+                                'peak_mb': peak / 2 ** 20})
+    return results
+
+
+def compare_results(results, baseline, time_tolerance, memory_tolerance):
+    """Compare results against a baseline and flag regressions.
+
+    Args:
+        results (list): results of benchmark_suite
+        baseline (list): results of benchmark_suite to compare against
+        time_tolerance (float): relative slowdown allowed before flagging
+        memory_tolerance (float): relative peak memory growth allowed before
+            flagging
+
+    Returns:
+        (list): one dict per result also found in the baseline, with the
+            ratios of time and peak memory to the baseline and the list of
+            regressions found
+
+    """
+    def key(result):
+        return result['image'], result['perturbation'], result['level']
+
+    baseline = {key(result): result for result in baseline}
+    comparisons = []
+    for result in results:
+        if key(result) not in baseline:
+            continue
+        base = baseline[key(result)]
+        time_ratio = result['median_ms'] / base['median_ms']
+        peak_delta = result['peak_mb'] - base['peak_mb']
+        regressions = []
+        if time_ratio > 1 + time_tolerance:
+            regressions.append('time')
+        if peak_delta > max(memory_tolerance * base['peak_mb'],
+                            MIN_PEAK_DELTA_MB):
+            regressions.append('memory')
+        comparisons.append({'image': result['image'],
+                            'perturbation': result['perturbation'],
+                            'level': result['level'],
+                            'baseline_ms': base['median_ms'],
+                            'median_ms': result['median_ms'],
+                            'time_ratio': time_ratio,
+                            'baseline_peak_mb': base['peak_mb'],
+                            'peak_mb': result['peak_mb'],
+                            'regressions': regressions})
+    return comparisons
+
+
+def parse_script_args():
+    """Parse command line arguments.
+
+    Returns:
+        args (Namespace): Parsed command line arguments
+
+    """
+    parser = ArgumentParser()
+
+    parser.add_argument('--img_path', type=str,
+                        default='test_images/xray.jpg',
+                        help='Path to image to perturb')
+
+    parser.add_argument('--sizes', type=int, nargs='*', default=SIZES,
+                        help='Sides of the square copies of the image to '
+                             'benchmark besides the image itself')
+
+    parser.add_argument('--mode', type=str,
+                        choices=('L', 'RGB'), default='L',
+                        help='Mode to convert the images to')
+
+    parser.add_argument('--perturbations', type=str, nargs='+',
+                        choices=tuple(PERTURBATIONS.keys()),
+                        help='Perturbations to benchmark. Default: all')
+
+    parser.add_argument('--levels', type=int, nargs='+',
+                        choices=tuple(LEVELS), default=LEVELS,
+                        help='Levels to benchmark. Default: all')
+
+    parser.add_argument('--repeat', type=int,
+                        default=5, help='Number of timed calls per level')
+
+    parser.add_argument('--output_json', type=str,
+                        help='Where to save the results as JSON')
+
+    parser.add_argument('--results', type=str,
+                        help='Compare the results saved in this JSON file '
+                             'instead of running the benchmark')
+
+    parser.add_argument('--baseline', type=str,
+                        help='JSON results of an earlier run to compare '
+                             'against. Exits with status 1 on regressions')
+
+    parser.add_argument('--time_tolerance', type=float, default=0.2,
+                        help='Relative slowdown flagged as a regression. '
+                             'Default: 0.2')
+
+    parser.add_argument('--memory_tolerance', type=float, default=0.2,
+                        help='Relative peak memory growth flagged as a '
+                             'regression. Default: 0.2')
+
+    args = parser.parse_args()
+    if args.results and not args.baseline:
+        parser.error('--results requires --baseline')
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_script_args()
+    if args.results:
+        with open(args.results) as f:
+            results = json.load(f)['results']
+    else:
+        images = load_images(args.img_path, args.sizes, args.mode)
+        perturbations = {name: PERTURBATIONS[name]
+                         for name in args.perturbations or PERTURBATIONS}
+        results = benchmark_suite(images, perturbations, args.levels,
+                                  args.repeat)
+        print(f'{"image":<20} {"perturbation":<16} {"level":>5} ' +
+              f'{"ms":>9} {"img/s":>8} {"MPix/s":>8} {"peak MB":>8}')
+        for result in results:
+            print(f'{result["image"]:<20} {result["perturbation"]:<16} ' +
+                  f'{result["level"]:>5} {result["median_ms"]:>9.2f} ' +
+                  f'{result["images_per_s"]:>8.1f} ' +
+                  f'{result["mpix_per_s"]:>8.1f} {result["peak_mb"]:>8.1f}')
+    if args.output_json:
+        with open(args.output_json, 'w') as f:
+            json.dump({'img_path': args.img_path, 'mode': args.mode,
+                       'repeat': args.repeat, 'results': results}, f,
+                      indent=4)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        comparisons = compare_results(results, baseline, args.time_tolerance,
+                                      args.memory_tolerance)
+        regressed = [c for c in comparisons if c['regressions']]
+        print(f'{len(regressed)} regressions in {len(comparisons)} results '
+              f'compared against {args.baseline}')
+        for c in regressed:
+            print(f'{c["image"]:<20} {c["perturbation"]:<16} ' +
+                  f'{c["level"]:>5} {c["baseline_ms"]:>9.2f} -> ' +
+                  f'{c["median_ms"]:>9.2f} ms ({c["time_ratio"]:.2f}x), ' +
+                  f'{c["baseline_peak_mb"]:.1f} -> {c["peak_mb"]:.1f} MB: ' +
+                  ', '.join(c['regressions']))
+        if regressed:
+            sys.exit(1)
@@ -0,0 +1,62 @@
+"""Implement helpers shared by the benchmark scripts."""
+import multiprocessing
+import time
+
+import numpy as np
+
+from synthesis.profiling import peak_rss, read_status_kb, reset_peak_rss
+
+
+def time_call(fn, repeat, warmup=1):
+    """Time repeated calls of a function.
+
+    Args:
+        fn (function): called without arguments
+        repeat (int): number of timed calls
+        warmup (int): number of untimed calls made first
+
+    Returns:
+        (np.ndarray): wall time of each timed call, in seconds
+
+    """
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return np.array(times)
+
+
+def _run_and_report_peak(fn, queue):
+    """Run fn and report its peak RSS growth in bytes through queue."""
+    if reset_peak_rss():
+        baseline = read_status_kb('VmRSS') * 1024
+    else:
+        # Fall back to the lifetime peak, which overestimates the baseline
+        baseline = peak_rss()
+    fn()
+    queue.put(peak_rss() - baseline)
+
+
+def peak_memory(fn):
+    """Measure how much a call grows the peak RSS of a process.
+
+    The call runs in a forked child process, so allocations made by earlier
+    measurements do not hide its own peak.
+
+    Args:
+        fn (function): called without arguments
+
+    Returns:
+        (int): peak RSS growth during the call, in bytes
+
+    """
+    context = multiprocessing.get_context('fork')
+    queue = context.Queue()
+    process = context.Process(target=_run_and_report_peak, args=(fn, queue))
+    process.start()
+    peak = queue.get()
+    process.join()
+    return peak
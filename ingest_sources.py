@@ -0,0 +1,214 @@
+"""Decode the images of a source csv once into a memory-mapped store.
+
+The store holds the raw grayscale pixels of every image in a single flat
+file, next to an index csv. Pass its directory to synthesize.py with
+--src_store so that repeated synthesis runs skip JPEG decoding entirely.
+
+The size of every image is first read from its header, so that each one
+is given its offset in the store up front. Workers then decode the images
+and write their pixels straight into the store, rather than sending them
+back to the main process. Images that fail to decode are listed with their
+traceback in sources_quarantine.jsonl and left out of the store's index; the
+space set aside for their pixels is never written, so it stays a hole in the
+file on filesystems with sparse files. The store and its index
+are written under temporary names and only renamed into place once every
+image has been processed, the index last. A store is therefore complete
+only if its index exists, and an interrupted ingest can simply be rerun.
+
+Usage:
+    python ingest_sources.py --src_csv /path/to/train.csv
+        --src_root /path/to/CheXpert --store_dir /path/to/store
+
+"""
+from argparse import ArgumentParser
+from functools import partial
+from pathlib import Path
+from PIL import Image
+from tqdm import tqdm
+import pandas as pd
+import numpy as np
+import concurrent.futures
+import os
+import traceback
+
+from synthesis.manifest import append_records, quarantine_path
+from synthesis.packing import index_path, remove_packs, write_indices
+from synthesis.scheduler import run_chunked
+from synthesis.store import STORE_NAME, get_store_path
+
+
+COL_PATH = 'Path'
+# Name of the store while it is being written
+TMP_NAME = f'.{STORE_NAME}.tmp'
+
+
+def parse_script_args():
+    """Parse command line arguments.
+
+    Returns:
+        args (Namespace): Parsed command line arguments
+
+    """
+    parser = ArgumentParser()
+
+    parser.add_argument('--src_csv', type=str, required=True,
+                        help='Path to source data csv')
+
+    parser.add_argument('--src_root', type=str,
+                        default='/deep/group/CheXpert/',
+                        help='Directory relative to which the paths in ' +
+                             'the csv are resolved')
+
+    parser.add_argument('--store_dir', type=str, required=True,
+                        help='Directory in which to write the store')
+
+    parser.add_argument('--num_workers', type=int,
+                        default=os.cpu_count(),
+                        help='Number of worker processes')
+
+    parser.add_argument('--chunk_size', type=int,
+                        default=32,
+                        help='Number of images submitted to a worker at once')
+
+    args = parser.parse_args()
+    return args
+
+
+def read_shapes(src_root, paths):
+    """Read the shape of a chunk of source images from their headers.
+
+    Args:
+        src_root (str): directory relative to which paths are resolved
+        paths (list): paths to original images, as listed in the csv
+
+    Returns:
+        shapes (list): (path, [height, width]) of each readable image
+        failures (list): quarantine record of each image that raised
+
+    """
+    shapes, failures = [], []
+    for path in paths:
+        try:
+            with Image.open(Path(src_root) / path) as img:
+                width, height = img.size
+        except Exception:
+            failures.append({'path': path, 'error': traceback.format_exc()})
+            continue
+        shapes.append((path, [height, width]))
+    return shapes, failures
+
+
+def decode_chunk(src_root, store_path, tasks):
+    """Decode a chunk of source images into their place in the store.
+
+    Args:
+        src_root (str): directory relative to which paths are resolved
+        store_path (Path): preallocated pixel array of the store
+        tasks (list): (path, offset, shape) of each image, where path is as
+            listed in the csv and offset is where its pixels go in the store
+
+    Returns:
+        decoded (list): path of each image written to the store
+        failures (list): quarantine record of each image that raised
+
+    """
+    store = np.memmap(store_path, dtype=np.uint8, mode='r+')
+    decoded, failures = [], []
+    for path, offset, shape in tasks:
+        try:
+            pixels = np.asarray(
+                Image.open(Path(src_root) / path).convert('L'))
+            if list(pixels.shape) != shape:
+                raise ValueError(f'Decoded shape {list(pixels.shape)} '
+                                 f'differs from header shape {shape}')
+        except Exception:
+            failures.append({'path': path, 'error': traceback.format_exc()})
+            continue
+        store[offset:offset + pixels.size] = pixels.reshape(-1)
+        decoded.append(path)
+    store.flush()
+    return decoded, failures
+
+
+def ingest(args):
+    """Decode every image of the source csv into the store.
+
+    Args:
+        args (Namespace): Parsed command line arguments
+
+    Returns:
+        None
+
+    """
+    store_dir = Path(args.store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+    store_path = get_store_path(store_dir)
+    if index_path(store_path).exists():
+        raise FileExistsError(f'{store_path} already exists')
+    paths = list(pd.read_csv(args.src_csv)[COL_PATH])
+    # leftovers of an interrupted ingest are discarded, including a store
+    # whose index was never renamed into place
+    remove_packs(store_dir, TMP_NAME)
+    if store_path.exists():
+        store_path.unlink()
+    quarantine = quarantine_path(store_dir, STORE_NAME)
+    if quarantine.exists():
+        quarantine.unlink()
+    tmp_path = store_path.with_name(f'{TMP_NAME}_images.u8')
+
+    shapes, failed = {}, set()
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=args.num_workers) as executor:
+        with tqdm(total=len(paths), desc='read headers') as progress:
+            for chunk, (chunk_shapes, failures) in run_chunked(
+                    executor, partial(read_shapes, args.src_root), paths,
+                    args.chunk_size, 2 * args.num_workers):
+                shapes.update(chunk_shapes)
+                append_records(quarantine, failures)
+                failed.update(failure['path'] for failure in failures)
+                progress.update(len(chunk))
+        # Offsets follow the order of the csv, as if the pixels were appended
+        records, offset = {}, 0
+        for path in dict.fromkeys(paths):
+            if path in shapes:
+                height, width = shapes[path]
+                records[path] = {'path': path, 'member': path,
+                                 'shape': [height, width],
+                                 'dst': str(tmp_path), 'offset': offset,
+                                 'size': height * width}
+                offset += height * width
+        with open(tmp_path, 'wb') as f:
+            f.truncate(offset)
+        tasks = [(path, record['offset'], record['shape'])
+                 for path, record in records.items()]
+        with tqdm(total=len(tasks), desc='decode') as progress:
+            # only paths and failures come back, so the window stays small
+            # whatever the size of the images
+            for chunk, (_, failures) in run_chunked(
+                    executor, partial(decode_chunk, args.src_root, tmp_path),
+                    tasks, args.chunk_size,
+                    2 * args.num_workers):
+                append_records(quarantine, failures)
+                failed.update(failure['path'] for failure in failures)
+                progress.update(len(chunk))
+    with open(tmp_path, 'rb+') as f:
+        os.fsync(f.fileno())
+    ingested = [path for path in paths if path not in failed]
+    write_indices([record for path, record in records.items()
+                   if path not in failed], ingested, ingested)
+    if not index_path(tmp_path).exists():
+        # write_indices only writes indices of packs holding images
+        pd.DataFrame(columns=['row', COL_PATH, 'member', 'offset', 'size',
+                              'height', 'width', 'channels']).to_csv(
+            index_path(tmp_path), index=False)
+    # the index goes last, as it marks the store as complete
+    os.replace(tmp_path, store_path)
+    os.replace(index_path(tmp_path), index_path(store_path))
+    if failed:
+        print(f'{len(failed)} images failed, see {quarantine}. They are ' +
+              'left out of the store.')
+
+
+if __name__ == '__main__':
+    args = parse_script_args()
+    ingest(args)
@@ -0,0 +1,118 @@
+"""Keep worker pools from oversubscribing the CPUs they are given.
+
+Each worker of a pool can call into OpenCV, and through numpy and scipy into
+BLAS and OpenMP, each of which starts its own pool of one thread per CPU by
+default. With one worker per CPU that makes as many threads as the square of
+the number of CPUs, which thrash rather than help. The governor counts the
+CPUs actually available, honouring the CPU affinity and the cgroup CPU quota
+of containers, and splits them evenly between the workers.
+
+By the time a worker starts, numpy, scipy and OpenCV are loaded and their
+thread pools sized, so environment variables such as OMP_NUM_THREADS no
+longer have any effect. The pools are instead resized where they run:
+OpenCV's with cv2.setNumThreads, and the OpenMP and BLAS pools with
+threadpoolctl.
+
+"""
+import math
+import os
+
+import cv2
+from threadpoolctl import threadpool_info, threadpool_limits
+
+
+def read_cgroup_quota():
+    """Read the CPU quota of the cgroup of this process.
+
+    Supports cgroup v2 (cpu.max) and v1 (cpu.cfs_quota_us).
+
+    Returns:
+        (float): the number of CPUs the quota allows, or None if unlimited
+            or unknown
+
+    """
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota == 'max':
+            return None
+        return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+            quota = int(f.read())
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+            period = int(f.read())
+    except (OSError, ValueError):
+        return None
+    if quota <= 0 or period <= 0:
+        return None
+    return quota / period
+
+
+def available_cpus():
+    """Count the CPUs this process may run on.
+
+    Returns:
+        (int): the number of CPUs in the affinity mask of the process, capped
+            by its cgroup quota rounded up, and at least 1
+
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        # Not available on macOS and Windows
+        cpus = os.cpu_count() or 1
+    quota = read_cgroup_quota()
+    if quota is not None:
+        cpus = min(cpus, math.ceil(quota))
+    return max(1, cpus)
+
+
+def threads_per_worker(num_workers, cpus=None):
+    """Split the available CPUs evenly between the workers of a pool."""
+    if cpus is None:
+        cpus = available_cpus()
+    return max(1, cpus // max(1, num_workers))
+
+
+def limit_threads(num_threads):
+    """Limit the threads of OpenCV, OpenMP and BLAS in this process.
+
+    Args:
+        num_threads (int): maximum number of threads of each library
+
+    Returns:
+        (dict): the number of threads OpenCV now uses, under 'opencv', and
+            the library, API and number of threads of every OpenMP and BLAS
+            pool loaded, under 'threadpools', as read back after limiting
+
+    """
+    cv2.setNumThreads(num_threads)
+    threadpool_limits(limits=num_threads)
+    return {'opencv': cv2.getNumThreads(),
+            'threadpools': [{'library': os.path.basename(info['filepath']),
+                             'api': info['internal_api'],
+                             'num_threads': info['num_threads']}
+                            for info in threadpool_info()]}
+
+
+def plan_concurrency(num_workers, num_threads=None):
+    """Choose the thread limit of each worker of a pool.
+
+    Args:
+        num_workers (int): number of processes or threads of the pool
+        num_threads (int): thread limit of each worker, or None to split the
+            available CPUs evenly between the workers
+
+    Returns:
+        (dict): the available CPUs, cgroup quota, number of workers and
+            thread limit of each worker
+
+    """
+    cpus = available_cpus()
+    if num_threads is None:
+        num_threads = threads_per_worker(num_workers, cpus)
+    return {'available_cpus': cpus, 'cgroup_quota': read_cgroup_quota(),
+            'num_workers': num_workers, 'threads_per_worker': num_threads}
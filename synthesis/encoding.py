@@ -0,0 +1,81 @@
+"""Encode perturbed images for writing to disk.
+
+The output format is chosen independently of the source format. PNG and
+lossless WebP keep every pixel, JPEG trades fidelity for size, and raw
+writes the uint8 pixel array as an .npy file, skipping compression entirely.
+
+"""
+import io
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+
+# Output formats, where 'source' keeps the extension of the source image
+FORMATS = ('source', 'png', 'jpeg', 'webp', 'raw')
+SUFFIXES = {'png': '.png', 'jpeg': '.jpg', 'webp': '.webp', 'raw': '.npy'}
+JPEG_SUBSAMPLINGS = ('4:4:4', '4:2:2', '4:2:0')
+
+
+def get_save_options(png_compress_level=6, jpeg_quality=75,
+                     jpeg_subsampling=None):
+    """Collect the encoder options of every PIL format.
+
+    Args:
+        png_compress_level (int): zlib level in [0, 9]. 0 stores the image
+            uncompressed, 1 is fastest, 9 is smallest
+        jpeg_quality (int): JPEG quality in [1, 95]
+        jpeg_subsampling (str): chroma subsampling of colour JPEGs, one of
+            JPEG_SUBSAMPLINGS. None keeps the encoder default
+
+    Returns:
+        (dict): maps PIL format name (str) -> keyword arguments of save
+
+    """
+    jpeg_options = {'quality': jpeg_quality}
+    if jpeg_subsampling is not None:
+        jpeg_options['subsampling'] = jpeg_subsampling
+    return {'PNG': {'compress_level': png_compress_level},
+            'JPEG': jpeg_options,
+            'WEBP': {'lossless': True}}
+
+
+def encoded_path(dst_path, fmt):
+    """Replace the extension of dst_path with the one of the output format.
+
+    Args:
+        dst_path (Path): path derived from the source image path
+        fmt (str): output format, one of FORMATS
+
+    Returns:
+        (Path): path under which the encoded image is written
+
+    """
+    if fmt == 'source':
+        return Path(dst_path)
+    return Path(dst_path).with_suffix(SUFFIXES[fmt])
+
+
+def encode_image(img, suffix, save_options):
+    """Encode an image in the format implied by a file extension.
+
+    Args:
+        img (Image): the image to encode
+        suffix (str): file extension, such as .png or .npy
+        save_options (dict): maps PIL format name -> keyword arguments of
+            save, as returned by get_save_options
+
+    Returns:
+        (bytes): the encoded image
+
+    """
+    buffer = io.BytesIO()
+    suffix = suffix.lower()
+    if suffix == SUFFIXES['raw']:
+        np.save(buffer, np.asarray(img))
+    else:
+        pil_format = Image.registered_extensions()[suffix]
+        img.save(buffer, format=pil_format,
+                 **save_options.get(pil_format, {}))
+    return buffer.getvalue()
@@ -0,0 +1,146 @@
+"""Track finished and failed outputs of a synthesis run.
+
+Each finished image is appended as one JSON line to a manifest, recording
+where it was written along with its size and checksum. Images that raised an
+error are appended to a quarantine list instead. Both files are only ever
+appended to by the parent process, so a run that dies partway through leaves
+a valid record of everything that was completed before the crash.
+
+"""
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+
+def manifest_path(perturbed_dir, name):
+    """Get the path of the completion manifest of a run.
+
+    Args:
+        perturbed_dir (Path): root of perturbed dataset
+        name (str): name of the run's csv, without extension
+
+    """
+    return Path(perturbed_dir) / f'{name}_manifest.jsonl'
+
+
+def quarantine_path(perturbed_dir, name):
+    """Get the path of the quarantine list of a run.
+
+    Args:
+        perturbed_dir (Path): root of perturbed dataset
+        name (str): name of the run's csv, without extension
+
+    """
+    return Path(perturbed_dir) / f'{name}_quarantine.jsonl'
+
+
+def checksum(data):
+    """Get the size and sha256 checksum of data, as recorded in manifests.
+
+    Args:
+        data (bytes): contents of an output
+
+    Returns:
+        (dict): the size and sha256 checksum of data
+
+    """
+    return {'size': len(data), 'sha256': hashlib.sha256(data).hexdigest()}
+
+
+def atomic_write(dst_path, data):
+    """Write bytes to dst_path so that it is either complete or absent.
+
+    The data is written to a temporary file in the same directory, flushed
+    to disk, and renamed over dst_path.
+
+    Args:
+        dst_path (Path): where to write the data
+        data (bytes): contents of the file
+
+    Returns:
+        (dict): the size and sha256 checksum of the written data
+
+    """
+    dst_path = Path(dst_path)
+    tmp_path = dst_path.with_name(
+        f'.{dst_path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, dst_path)
+    return checksum(data)
+
+
+def append_records(path, records):
+    """Append records to a JSON lines file and flush them to disk.
+
+    Args:
+        path (Path): manifest or quarantine file
+        records (list): JSON-serializable dicts to append
+
+    """
+    if not records:
+        return
+    with open(path, 'a') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_records(path):
+    """Read all records from a JSON lines file.
+
+    A truncated trailing line, left behind if the run was killed while
+    appending, is ignored.
+
+    Args:
+        path (Path): manifest or quarantine file
+
+    Returns:
+        (list): the records, in the order they were appended
+
+    """
+    path = Path(path)
+    if not path.exists():
+        return []
+    records = []
+    with open(path) as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+def completed_paths(path):
+    """Find the source paths whose outputs are recorded and still on disk.
+
+    An entry only counts as complete if its output exists and has the size
+    recorded in the manifest, so deleted or truncated outputs are redone.
+    For images packed at an offset within a larger file, the file must
+    extend past the end of the image.
+
+    Args:
+        path (Path): manifest file
+
+    Returns:
+        (set): source paths (as listed in the csv) that are already done
+
+    """
+    done = set()
+    for record in read_records(path):
+        dst = Path(record['dst'])
+        if not dst.exists():
+            continue
+        if 'offset' in record:
+            complete = dst.stat().st_size >= record['offset'] + record['size']
+        else:
+            complete = dst.stat().st_size == record['size']
+        if complete:
+            done.add(record['path'])
+    return done
@@ -0,0 +1,236 @@
+"""Pack perturbed images into a few large files instead of one per image.
+
+Two layouts are supported:
+    tar: encoded images are streamed into size-capped tar shards.
+    array: raw uint8 pixels are appended to a single flat file, which can be
+        memory-mapped and sliced without copying.
+
+Packs are only written by the parent process. Each written image is recorded
+in the run's manifest with its pack file and offset, and at the end of the
+run every pack gets a companion index csv mapping rows of the output csv to
+offsets within the pack.
+
+"""
+import io
+import os
+import tarfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+OUTPUTS = ('files', 'tar', 'array')
+COL_PATH = 'Path'
+
+
+class TarShardWriter:
+    """Append encoded images to tar shards of bounded size."""
+
+    def __init__(self, directory, name, max_bytes):
+        """Prepare to write shards named <name>-<shard id>.tar.
+
+        Shards left over from a previous run are kept, and new shards are
+        numbered after them. Runs that do not resume remove them first with
+        remove_packs.
+
+        Args:
+            directory (Path): directory in which to write the shards
+            name (str): name of the run's csv, without extension
+            max_bytes (int): size after which a shard is closed
+
+        """
+        self.directory = Path(directory)
+        self.name = name
+        self.max_bytes = max_bytes
+        self.shard_id = len(list(self.directory.glob(f'{name}-*.tar')))
+        self.path = None
+        self.tar = None
+
+    def write(self, member, data):
+        """Append a file to the current shard.
+
+        Args:
+            member (str): name of the file within the tar
+            data (bytes): contents of the file
+
+        Returns:
+            (dict): the shard path ('dst') and offset of data within it
+
+        """
+        if self.tar is None:
+            self.path = self.directory / f'{self.name}-{self.shard_id:05d}.tar'
+            self.tar = tarfile.open(self.path, 'w', format=tarfile.PAX_FORMAT)
+        info = tarfile.TarInfo(member)
+        info.size = len(data)
+        header = info.tobuf(self.tar.format, self.tar.encoding,
+                            self.tar.errors)
+        record = {'dst': str(self.path), 'offset': self.tar.offset +
+                  len(header)}
+        self.tar.addfile(info, io.BytesIO(data))
+        if self.tar.offset >= self.max_bytes:
+            self.close()
+        return record
+
+    def flush(self):
+        """Flush the current shard to disk."""
+        if self.tar is not None:
+            self.tar.fileobj.flush()
+            os.fsync(self.tar.fileobj.fileno())
+
+    def close(self):
+        """Finish the current shard, so the next write starts a new one."""
+        if self.tar is not None:
+            self.tar.close()
+            self.tar = None
+            self.shard_id += 1
+
+
+class ArrayWriter:
+    """Append raw uint8 pixels to a single flat file."""
+
+    def __init__(self, directory, name):
+        """Open <name>_images.u8 for appending.
+
+        Runs that do not resume remove the array of a previous run first
+        with remove_packs, so offsets then start at 0.
+
+        Args:
+            directory (Path): directory in which to write the array
+            name (str): name of the run's csv, without extension
+
+        """
+        self.path = Path(directory) / f'{name}_images.u8'
+        self.file = open(self.path, 'ab')
+        self.file.seek(0, os.SEEK_END)
+
+    def write(self, member, data):
+        """Append the pixels of an image.
+
+        Args:
+            member (str): unused, for compatibility with TarShardWriter
+            data (bytes): raw uint8 pixels of the image
+
+        Returns:
+            (dict): the array path ('dst') and offset of data within it
+
+        """
+        record = {'dst': str(self.path), 'offset': self.file.tell()}
+        self.file.write(data)
+        return record
+
+    def flush(self):
+        """Flush the array to disk."""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        """Close the array file."""
+        self.file.close()
+
+
+def get_writer(output, directory, name, max_bytes):
+    """Create the pack writer of an output layout.
+
+    Args:
+        output (str): 'tar' or 'array'
+        directory (Path): directory in which to write the packs
+        name (str): name of the run's csv, without extension
+        max_bytes (int): size after which a tar shard is closed
+
+    Returns:
+        (TarShardWriter or ArrayWriter): the writer
+
+    """
+    if output == 'tar':
+        return TarShardWriter(directory, name, max_bytes)
+    return ArrayWriter(directory, name)
+
+
+def remove_packs(directory, name):
+    """Remove the tar shards, array and indices of a previous run.
+
+    Args:
+        directory (Path): directory in which the packs were written
+        name (str): name of the run's csv, without extension
+
+    """
+    directory = Path(directory)
+    pack_paths = list(directory.glob(f'{name}-*.tar')) + \
+        [directory / f'{name}_images.u8']
+    for pack_path in pack_paths:
+        for path in (pack_path, index_path(pack_path)):
+            if path.exists():
+                path.unlink()
+
+
+def index_path(pack_path):
+    """Get the path of the index csv of a pack."""
+    pack_path = Path(pack_path)
+    return pack_path.with_name(f'{pack_path.stem}_index.csv')
+
+
+def write_indices(records, src_paths, dst_paths):
+    """Write the index csv of every pack referenced by manifest records.
+
+    Only the last record of each image is indexed. An image rewritten by a
+    resumed run is recorded again with a newer pack, and its earlier copy is
+    left out of the index of the older one. Packs left with no current
+    images get an empty index.
+
+    Args:
+        records (list): manifest records of packed images
+        src_paths (list): Path column of the source csv rows that were
+            written to the output csv
+        dst_paths (list): Path column of the output csv, whose positions are
+            the rows listed in the indices
+
+    """
+    rows = {src_path: (row, str(dst_path)) for row, (src_path, dst_path)
+            in enumerate(zip(src_paths, dst_paths))}
+    latest, columns = {}, {}
+    for record in records:
+        # later records of the same image supersede earlier ones
+        latest[record['path']] = record
+        columns[record['dst']] = ['row', COL_PATH, 'member', 'offset', 'size']
+        if 'shape' in record:
+            columns[record['dst']] += ['height', 'width', 'channels']
+    entries = {pack_path: [] for pack_path in columns}
+    for path, record in latest.items():
+        if path not in rows:
+            continue
+        row, dst_path = rows[path]
+        entry = {'row': row, COL_PATH: dst_path, 'member': record['member'],
+                 'offset': record['offset'], 'size': record['size']}
+        if 'shape' in record:
+            shape = list(record['shape']) + [1]
+            entry.update(height=shape[0], width=shape[1], channels=shape[2])
+        entries[record['dst']].append(entry)
+    for pack_path, pack_entries in entries.items():
+        index_df = pd.DataFrame(pack_entries, columns=columns[pack_path])
+        index_df.sort_values('offset').to_csv(index_path(pack_path),
+                                              index=False)
+
+
+def open_pack(pack_path):
+    """Memory-map a tar shard or pixel array for zero-copy reads."""
+    return np.memmap(pack_path, dtype=np.uint8, mode='r')
+
+
+def get_encoded(pack, offset, size):
+    """Get a view of the encoded bytes of an image in a memory-mapped tar."""
+    return pack[offset:offset + size]
+
+
+def get_pixels(pack, offset, height, width, channels):
+    """Get a view of the pixels of an image in a memory-mapped array.
+
+    Returns:
+        (np.ndarray): (height, width) array for single-channel images,
+            (height, width, channels) otherwise
+
+    """
+    pixels = pack[offset:offset + height * width * channels]
+    if channels == 1:
+        return pixels.reshape(height, width)
+    return pixels.reshape(height, width, channels)
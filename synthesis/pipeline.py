@@ -0,0 +1,85 @@
+"""Parse and evaluate perturbation pipelines.
+
+A pipeline is a tuple of (perturbation, level) steps applied in order, written
+on the command line as e.g. moire:2,blur:1,tilt:3. When several pipelines
+start with the same steps, the shared prefix is computed once per image and
+its result reused for every pipeline that extends it.
+
+"""
+from transforms.constants import LEVELS, PERTURBATIONS
+
+
+def parse_pipeline(spec, default_level=None):
+    """Parse a pipeline spec such as moire:2,blur:1,tilt:3.
+
+    Args:
+        spec (str): comma-separated perturbations, each optionally followed
+            by :level
+        default_level (int): level of steps that do not specify one
+
+    Returns:
+        (tuple): (perturbation, level) steps, in order
+
+    """
+    steps = []
+    for step in spec.split(','):
+        name, _, level = step.partition(':')
+        if name not in PERTURBATIONS:
+            raise ValueError(f'Unknown perturbation "{name}" in "{spec}"')
+        if level:
+            level = int(level)
+        elif default_level is not None:
+            level = default_level
+        else:
+            raise ValueError(f'No level given for "{name}" in "{spec}"')
+        if level not in LEVELS:
+            raise ValueError(f'Invalid level {level} for "{name}" in "{spec}"')
+        steps.append((name, level))
+    return tuple(steps)
+
+
+def has_levels(spec):
+    """Check whether every step of a pipeline spec specifies its level."""
+    return all(':' in step for step in spec.split(','))
+
+
+def run_pipelines(src_img, pipelines, apply_step):
+    """Apply several pipelines to an image, sharing common prefixes.
+
+    Pipelines are visited in sorted order, so pipelines with a common prefix
+    are adjacent. Only the intermediate results along the current prefix are
+    kept alive, which bounds memory by the length of the longest pipeline
+    rather than by the number of pipelines.
+
+    If a step raises, every pipeline sharing the failing prefix is reported
+    as failed with the same error.
+
+    Args:
+        src_img (Image): the image to perturb
+        pipelines (list): pipelines to apply, each a tuple of steps
+        apply_step (function): called as apply_step(prefix, img), where
+            prefix holds the steps applied so far ending with the step to
+            apply, returning the perturbed image
+
+    Yields:
+        (index, img, error): index of the pipeline in pipelines, and either
+            its output image or the exception that prevented it
+
+    """
+    # Each entry is (prefix, result of prefix, error raised by prefix)
+    stack = [((), src_img, None)]
+    for index in sorted(range(len(pipelines)), key=lambda i: pipelines[i]):
+        steps = pipelines[index]
+        while steps[:len(stack[-1][0])] != stack[-1][0]:
+            stack.pop()
+        prefix, img, error = stack[-1]
+        for step in steps[len(prefix):]:
+            if error is not None:
+                break
+            prefix = prefix + (step,)
+            try:
+                img = apply_step(prefix, img)
+            except Exception as e:
+                img, error = None, e
+            stack.append((prefix, img, error))
+        yield index, img, error
@@ -0,0 +1,180 @@
+"""Profile where a synthesis run spends its time and memory.
+
+Each worker records the wall time and peak RSS of every stage it runs for
+every image: decoding, each perturbation step and level, applying fused
+steps, and encoding, creating directories and writing outputs. The samples
+are returned to the parent with each chunk, which aggregates them into a
+report of percentiles per stage.
+
+Peak RSS is measured per stage by resetting the kernel's high-water mark
+before the stage (Linux only). Elsewhere it falls back to the peak RSS of the
+process so far, which can only grow. The high-water mark belongs to the whole
+process, so workers that are threads only record times, and the run reports
+the peak RSS of the process instead.
+
+"""
+import csv
+import json
+import resource
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+
+PERCENTILES = (50, 95, 99)
+
+
+def read_status_kb(field):
+    """Read a memory field of /proc/self/status, in kB."""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    raise OSError(f'{field} not found in /proc/self/status')
+
+
+def reset_peak_rss():
+    """Reset the peak RSS of this process to its current RSS.
+
+    Returns:
+        (bool): whether the peak could be reset
+
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss():
+    """Get the peak RSS of this process since it was last reset, in bytes."""
+    try:
+        return read_status_kb('VmHWM') * 1024
+    except OSError:
+        # ru_maxrss is in kB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Profiler:
+    """Record the wall time and peak RSS of named stages.
+
+    A profiler is only used by the thread that created it.
+
+    """
+
+    def __init__(self, stage_rss=True):
+        """Create a profiler with no samples.
+
+        Args:
+            stage_rss (bool): whether to reset and record the peak RSS of the
+                process for every stage. Disable when other threads of the
+                process run stages of their own at the same time
+
+        """
+        self.samples = defaultdict(list)
+        self.stage_rss = stage_rss
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block as one sample of stage name."""
+        if self.stage_rss:
+            reset_peak_rss()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples[name].append((time.perf_counter() - start,
+                                       peak_rss() if self.stage_rss
+                                       else None))
+
+    def pop(self):
+        """Return the samples recorded so far and start over.
+
+        Returns:
+            (dict): maps stage name -> list of (seconds, peak RSS in bytes,
+                or None if not recorded)
+
+        """
+        samples, self.samples = dict(self.samples), defaultdict(list)
+        return samples
+
+
+class NullProfiler:
+    """Stand-in for Profiler that records nothing."""
+
+    def stage(self, name):
+        """Run the enclosed block without timing it."""
+        return nullcontext()
+
+    def pop(self):
+        """Return no samples."""
+        return None
+
+
+def merge_samples(total, samples):
+    """Add the samples popped from a Profiler to a running total.
+
+    Args:
+        total (dict): maps stage name -> list of (seconds, peak RSS), updated
+            in place
+        samples (dict): samples to add, or None
+
+    """
+    for name, stage_samples in (samples or {}).items():
+        total.setdefault(name, []).extend(stage_samples)
+
+
+def summarize(samples):
+    """Aggregate the samples of every stage.
+
+    Args:
+        samples (dict): maps stage name -> list of (seconds, peak RSS)
+
+    Returns:
+        (list): one dict per stage, slowest total first, with the number of
+            samples, total and percentile times in ms, and the median and
+            maximum peak RSS in MB if recorded
+
+    """
+    rows = []
+    for name, stage_samples in samples.items():
+        times = np.array([seconds for seconds, _ in stage_samples]) * 1e3
+        rss = np.array([peak for _, peak in stage_samples
+                        if peak is not None]) / 2 ** 20
+        row = {'stage': name, 'count': len(times),
+               'total_s': times.sum() / 1e3, 'mean_ms': times.mean()}
+        for q, value in zip(PERCENTILES, np.percentile(times, PERCENTILES)):
+            row[f'p{q}_ms'] = value
+        if len(rss):
+            row.update(peak_rss_p50_mb=np.median(rss),
+                       peak_rss_max_mb=rss.max())
+        rows.append({key: round(float(value), 3)
+                     if isinstance(value, (float, np.floating)) else value
+                     for key, value in row.items()})
+    return sorted(rows, key=lambda row: -row['total_s'])
+
+
+def write_report(samples, stem, run_info):
+    """Write the aggregated profile as JSON and CSV.
+
+    Args:
+        samples (dict): maps stage name -> list of (seconds, peak RSS)
+        stem (Path): path of the report without extension
+        run_info (dict): description of the run, stored in the JSON report
+
+    Returns:
+        (list): the summary rows, as returned by summarize
+
+    """
+    rows = summarize(samples)
+    with open(stem.with_suffix('.json'), 'w') as f:
+        json.dump({'run': run_info, 'stages': rows}, f, indent=2)
+    if rows:
+        with open(stem.with_suffix('.csv'), 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+    return rows
@@ -0,0 +1,80 @@
+"""Decode and resize source images to the resolution they are used at.
+
+When outputs are only needed at a reduced resolution, perturbing the full
+resolution source wastes most of the compute and disk. JPEG sources are
+instead decoded at reduced resolution with PIL's draft mode, which skips most
+of the inverse DCT, and resized to the target before any perturbation runs.
+The scale of the resized image relative to the source is returned alongside,
+so that perturbation parameters in pixel lengths can be scaled to match.
+
+"""
+from PIL import Image
+
+
+def get_target_size(size, target_size):
+    """Get the size of an image resized to a target resolution.
+
+    Args:
+        size (tuple): (width, height) of the image
+        target_size (int): length of the shorter side after resizing. Images
+            no larger than that are not resized
+
+    Returns:
+        (tuple): (width, height) of the resized image, keeping the aspect
+            ratio
+
+    """
+    width, height = size
+    if min(width, height) <= target_size:
+        return size
+    if width <= height:
+        return target_size, max(1, int(round(height * target_size / width)))
+    return max(1, int(round(width * target_size / height))), target_size
+
+
+def resize_image(img, target_size):
+    """Resize an image to a target resolution.
+
+    Args:
+        img (Image): PIL Image to resize
+        target_size (int): length of the shorter side after resizing
+
+    Returns:
+        img (Image): the resized Image
+        scale (float): ratio of the resized width to the original width
+
+    """
+    size = get_target_size(img.size, target_size)
+    if size == img.size:
+        return img, 1.0
+    return img.resize(size, Image.ANTIALIAS), size[0] / img.width
+
+
+def open_image(path, target_size=None, mode=None):
+    """Decode an image, at reduced resolution if a target is given.
+
+    Args:
+        path (Path): path to the image
+        target_size (int): length of the shorter side of the decoded image,
+            or None to decode at full resolution
+        mode (str): mode to convert the image to, or None to keep its own.
+            JPEG images are decoded to single-channel directly for 'L'
+
+    Returns:
+        img (Image): the decoded Image
+        scale (float): ratio of the decoded width to the original width
+
+    """
+    img = Image.open(path)
+    width = img.width
+    if target_size is not None:
+        # Decode at the smallest power of two reduction no smaller than the
+        # target. Formats other than JPEG ignore the draft
+        img.draft(mode, get_target_size(img.size, target_size))
+    img.load()
+    if mode is not None and img.mode != mode:
+        img = img.convert(mode)
+    if target_size is None:
+        return img, 1.0
+    img, _ = resize_image(img, target_size)
+    return img, img.width / width
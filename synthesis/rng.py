@@ -0,0 +1,32 @@
+"""Derive deterministic random streams for individual perturbations.
+
+Each perturbation step draws its parameters from its own random state,
+seeded from the global seed, the row key of the image, and the steps applied
+so far. An image's output therefore depends only on those, and not on which
+worker, shard or chunk processed it, and no global random state is touched.
+
+"""
+import hashlib
+
+import numpy as np
+
+
+def derive_seed(seed, *keys):
+    """Derive a 32-bit seed from a global seed and the keys of a draw.
+
+    Args:
+        seed (int): global seed of the run
+        keys: values identifying the draw, such as the row key of an image
+            and the pipeline steps applied so far. Must have a stable repr
+
+    Returns:
+        (int): seed in [0, 2**32)
+
+    """
+    digest = hashlib.sha256(repr((seed,) + keys).encode()).digest()
+    return int.from_bytes(digest[:4], 'little')
+
+
+def derive_rng(seed, *keys):
+    """Create the random state of a draw, as seeded by derive_seed."""
+    return np.random.RandomState(derive_seed(seed, *keys))
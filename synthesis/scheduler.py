@@ -0,0 +1,61 @@
+"""Schedule chunks of work onto an executor with a bounded in-flight window.
+
+Submitting one future per CSV row keeps every future (and its pickled
+arguments) alive at once. Instead, rows are grouped into chunks and only a
+fixed number of chunks are pending at any time, so memory use does not grow
+with the size of the source CSV.
+
+"""
+import concurrent.futures
+from itertools import islice
+
+
+def chunked(iterable, chunk_size):
+    """Lazily split an iterable into lists of at most chunk_size items.
+
+    Args:
+        iterable (iterable): items to split
+        chunk_size (int): maximum number of items per chunk
+
+    Yields:
+        (list): the next chunk of items
+
+    """
+    assert chunk_size > 0, 'chunk_size must be positive'
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def run_chunked(executor, fn, items, chunk_size, max_in_flight):
+    """Apply fn to chunks of items, keeping at most max_in_flight pending.
+
+    Chunks are submitted lazily: a new chunk is only pulled from items once
+    a slot in the in-flight window frees up.
+
+    Args:
+        executor (Executor): executor on which to run fn
+        fn (function): called as fn(chunk), where chunk is a list of items
+        items (iterable): items to process
+        chunk_size (int): maximum number of items per submitted chunk
+        max_in_flight (int): maximum number of chunks pending at once
+
+    Yields:
+        (chunk, result): each chunk along with the value fn returned for it,
+            in order of completion
+
+    """
+    assert max_in_flight > 0, 'max_in_flight must be positive'
+    pending = {}
+    for chunk in chunked(items, chunk_size):
+        if len(pending) >= max_in_flight:
+            done, _ = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+        pending[executor.submit(fn, chunk)] = chunk
+    for future in concurrent.futures.as_completed(pending):
+        yield pending[future], future.result()
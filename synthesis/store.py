@@ -0,0 +1,63 @@
+"""Read source images from a packed, memory-mapped store.
+
+The store is written once by ingest_sources.py: every source image is
+decoded, converted to grayscale, and its raw uint8 pixels are appended to a
+single flat file, along with an index csv giving the offset and shape of each
+image. Synthesis runs then memory-map the store, so each worker reads pixels
+straight from the page cache with no JPEG decoding.
+
+"""
+from pathlib import Path
+
+import pandas as pd
+from PIL import Image
+
+from synthesis.packing import get_pixels, index_path, open_pack
+
+
+STORE_NAME = 'sources'
+COL_PATH = 'Path'
+
+
+def get_store_path(store_dir):
+    """Get the path of the pixel array of a store."""
+    return Path(store_dir) / f'{STORE_NAME}_images.u8'
+
+
+def load_store(store_dir):
+    """Memory-map a store and load its index.
+
+    Args:
+        store_dir (Path): directory written by ingest_sources.py
+
+    Returns:
+        pack (np.memmap): the pixels of every image
+        index (dict): maps source path (str) -> (offset, height, width,
+            channels) of the image within pack
+
+    """
+    store_path = get_store_path(store_dir)
+    index_df = pd.read_csv(index_path(store_path))
+    index = {path: (int(offset), int(height), int(width), int(channels))
+             for path, offset, height, width, channels in zip(
+                 index_df[COL_PATH], index_df['offset'], index_df['height'],
+                 index_df['width'], index_df['channels'])}
+    return open_pack(store_path), index
+
+
+def read_store_image(pack, index, path):
+    """Get a source image from a store without copying its pixels.
+
+    Args:
+        pack (np.memmap): the pixels of every image, as returned by
+            load_store
+        index (dict): index of the store, as returned by load_store
+        path (str): path to original image, as listed in the csv
+
+    Returns:
+        (Image): the grayscale source image
+
+    """
+    if path not in index:
+        raise KeyError(f'{path} was not ingested into the store')
+    return Image.fromarray(get_pixels(pack, *index[path]))
@@ -0,0 +1,138 @@
+"""Stream perturbed images on the fly, without writing them to disk.
+
+stream_perturbed iterates over the rows of a source csv and yields each row
+with its perturbed image, so a training loop can apply CheXphoto
+perturbations at load time. Images are decoded and perturbed by a background
+pool of threads or processes, with at most a fixed number of images
+prefetched ahead of the consumer.
+
+Every step draws its parameters as in synthesize.py, from a random state
+seeded from the seed, the path of the image and the steps applied so far,
+and from the epoch if given. Each epoch is therefore deterministic, whatever
+the number of workers, and with no epoch the images are identical to those
+written by synthesize.py with the same seed.
+
+Usage:
+    src_df = pd.read_csv('/path/to/train.csv')
+    for epoch in range(num_epochs):
+        for row, img in stream_perturbed(src_df, '/path/to/CheXpert',
+                                         ['moire:2,tilt:3', 'blur:1'],
+                                         epoch=epoch, shuffle=True):
+            ...
+
+"""
+import concurrent.futures
+from collections import deque
+from pathlib import Path
+
+from synthesis.pipeline import parse_pipeline
+from synthesis.resolution import open_image
+from synthesis.rng import derive_rng
+from transforms.constants import PARAMETRIC, SCALE_PARAMS
+from transforms.fusion import apply_fused, resolve
+
+COL_PATH = 'Path'
+EXECUTORS = {'thread': concurrent.futures.ThreadPoolExecutor,
+             'process': concurrent.futures.ProcessPoolExecutor}
+
+
+def perturb_source(path, src_root, steps, seed, keys, target_size=None,
+                   grayscale=False):
+    """Decode a source image and apply a pipeline to it.
+
+    Args:
+        path (str): path to original image, as listed in the csv
+        src_root (str): directory relative to which path is resolved
+        steps (tuple): (perturbation, level) steps to apply, in order
+        seed (int): global seed from which the parameters are drawn
+        keys (tuple): keys identifying the image, from which with seed and
+            the steps so far the random state of each step is derived
+        target_size (int): length of the shorter side of the decoded image,
+            or None for full resolution
+        grayscale (bool): whether to convert the image to single-channel
+
+    Returns:
+        (Image): the perturbed image
+
+    """
+    img, scale = open_image(Path(src_root) / path, target_size,
+                            'L' if grayscale else None)
+    for i, (perturbation, level) in enumerate(steps):
+        rng = derive_rng(seed, *keys, steps[:i + 1])
+        params = PARAMETRIC[perturbation].sample_params(level, rng, img.size)
+        if scale != 1 and perturbation in SCALE_PARAMS:
+            params = SCALE_PARAMS[perturbation](params, scale)
+        img = apply_fused(perturbation, params, img)
+    return resolve(img)
+
+
+def stream_perturbed(src_df, src_root, pipelines, seed=0, epoch=None,
+                     shuffle=False, num_workers=4, prefetch=None,
+                     executor='thread', target_size=None, grayscale=False):
+    """Lazily yield every row of a csv with its perturbed image.
+
+    Each row gets one of pipelines, chosen by its own random draw, so that
+    an epoch over several pipelines mixes them.
+
+    Args:
+        src_df (pd.DataFrame): source csv, with image paths under 'Path'
+        src_root (str): directory relative to which paths are resolved
+        pipelines (list): pipelines to choose from, each given as a spec
+            such as 'moire:2,tilt:3' or as a tuple of (perturbation, level)
+            steps
+        seed (int): global seed from which every draw is derived
+        epoch (int): epoch, from which draws are derived along with seed.
+            If None, images match those of synthesize.py with the same seed
+        shuffle (bool): whether to visit the rows in an order drawn for the
+            epoch rather than in csv order
+        num_workers (int): number of threads or processes perturbing images
+        prefetch (int): maximum number of images decoded or perturbed ahead
+            of the consumer. Default: twice num_workers
+        executor (str): 'thread' or 'process'
+        target_size (int): length of the shorter side to resize sources to
+            before perturbing them, or None for full resolution
+        grayscale (bool): whether to convert sources to single-channel
+
+    Yields:
+        (row, img): the row of src_df as a Series, and its perturbed image,
+            in visiting order
+
+    """
+    pipelines = [parse_pipeline(pipeline) if isinstance(pipeline, str)
+                 else tuple(pipeline) for pipeline in pipelines]
+    if not pipelines:
+        raise ValueError('At least one pipeline is required')
+    prefetch = prefetch or 2 * num_workers
+    assert prefetch > 0, 'prefetch must be positive'
+    order = range(len(src_df))
+    if shuffle:
+        order = derive_rng(seed, epoch, 'order').permutation(len(src_df))
+
+    def tasks():
+        for index in order:
+            row = src_df.iloc[index]
+            path = row[COL_PATH]
+            keys = (path,) if epoch is None else (epoch, path)
+            steps = pipelines[0]
+            if len(pipelines) > 1:
+                choice = derive_rng(seed, *keys, 'pipeline')
+                steps = pipelines[choice.randint(len(pipelines))]
+            yield row, (path, src_root, steps, seed, keys, target_size,
+                        grayscale)
+
+    # Futures are kept in visiting order, and at most prefetch are pending
+    pending = deque()
+    with EXECUTORS[executor](max_workers=num_workers) as pool:
+        try:
+            for row, args in tasks():
+                if len(pending) >= prefetch:
+                    done_row, future = pending.popleft()
+                    yield done_row, future.result()
+                pending.append((row, pool.submit(perturb_source, *args)))
+            while pending:
+                done_row, future = pending.popleft()
+                yield done_row, future.result()
+        finally:
+            # Stop early without waiting on images nobody will consume
+            for _, future in pending:
+                future.cancel()
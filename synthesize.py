@@ -3,25 +3,106 @@
 Usage:
     python synthesize.py --perturbation identity
 
+Sweep over several perturbation chains and levels in a single pass:
+    python synthesize.py --chains moire blur glare_matte,moire,tilt
+        --levels 1 2 3 4
+
+Chains may also fix the level of each step:
+    python synthesize.py --chains moire:2,blur:1,tilt:3 moire:2,blur:1,tilt:4
+
+Write lossless PNGs with the fastest zlib level:
+    python synthesize.py --perturbation blur --format png --png_compress_level 1
+
+Stream images into 1 GB tar shards rather than one file per image:
+    python synthesize.py --perturbation blur --output tar --tar_max_mb 1024
+
+Read sources from a store written by ingest_sources.py instead of decoding
+every JPEG:
+    python synthesize.py --perturbation blur --src_store /path/to/store
+
+Split a run across 4 machines, with output identical to a single-node run:
+    python synthesize.py --perturbation moire --seed 0 --shard 0/4
+
+Perturb images resized to a shorter side of 320 pixels, decoding JPEGs at
+reduced resolution:
+    python synthesize.py --perturbation moire --target_size 320
+
+Run workers as threads of a single process instead of separate processes:
+    python synthesize.py --perturbation blur --executor thread
+
+Regenerate the images of a run from the parameters in its manifest:
+    python synthesize.py --perturbation moire --level 2 --dst_dir /path/to/copy
+        --replay /path/to/moire/level_2/train_manifest.jsonl
+
 """
 
 from argparse import ArgumentParser
 from pathlib import Path
-from PIL import Image
 from tqdm import tqdm
 import pandas as pd
 import numpy as np
 import concurrent.futures
-
-from transforms.constants import LEVELS, PERTURBATIONS
+import json
+import threading
+import time
+import traceback
+
+from collections import defaultdict
+from synthesis.concurrency import (available_cpus, limit_threads,
+                                   plan_concurrency)
+from synthesis.encoding import (FORMATS, JPEG_SUBSAMPLINGS, encode_image,
+                                encoded_path, get_save_options)
+from synthesis.manifest import (append_records, atomic_write, checksum,
+                                completed_paths, manifest_path,
+                                quarantine_path, read_records)
+from synthesis.packing import (OUTPUTS, get_writer, remove_packs,
+                               write_indices)
+from synthesis.pipeline import has_levels, parse_pipeline, run_pipelines
+from synthesis.profiling import NullProfiler, Profiler, merge_samples, \
+    peak_rss, write_report
+from synthesis.resolution import open_image, resize_image
+from synthesis.rng import derive_rng
+from synthesis.scheduler import run_chunked
+from synthesis.stream import EXECUTORS
+from synthesis.store import load_store, read_store_image
+from transforms.constants import (LEVELS, PARAMETRIC, PERTURBATIONS,
+                                  SCALE_PARAMS)
+from transforms.fusion import (apply_fused, deferred_steps, fusion_kind,
+                               is_pending, resolve)
+from transforms.moire import MOIRE_ALPHA_CACHE_BYTES, moire_alpha_cache
 
 
 COL_PATH = 'Path'
 
+# Static configuration of the current worker, set once by init_worker. The
+# threads of a thread pool share it, and only read it
+_worker_args = None
+_worker_variants = None
+_worker_save_options = None
+# Memory-mapped source store and its index, if reading from a store
+_worker_store = None
+_worker_replay = None
+
+
+class _WorkerState(threading.local):
+    """Mutable state of the current worker, private to each thread."""
+
+    def __init__(self):
+        self.profiler = NullProfiler()
+        # Directories known to exist, to avoid a mkdir call per image
+        self.created_dirs = set()
+
+
+_worker_state = _WorkerState()
 
-def parse_script_args():
+
+def parse_script_args(argv=None):
     """Parse command line arguments.
 
+    Args:
+        argv (list): arguments to parse (str), or None for those of the
+            command line
+
     Returns:
         args (Namespace): Parsed command line arguments
 
@@ -33,6 +114,28 @@ def parse_script_args():
                                 'CheXpert/dev10K.csv',
                         help='Absolute path to source data csv')
 
+    parser.add_argument('--src_root', type=str,
+                        default='/deep/group/CheXpert/',
+                        help='Directory relative to which the paths in ' +
+                             'the source csv are resolved')
+
+    parser.add_argument('--src_store', type=str,
+                        help='Directory of a source store written by ' +
+                             'ingest_sources.py. If given, source images ' +
+                             'are read from it instead of --src_root')
+
+    parser.add_argument('--grayscale', action='store_true',
+                        help='Convert source images to single-channel (L) ' +
+                             'after decoding, so they stay single-channel ' +
+                             'through every transform and the encoder')
+
+    parser.add_argument('--target_size', type=int,
+                        help='Resize source images so their shorter side ' +
+                             'is this many pixels before perturbing them, ' +
+                             'decoding JPEGs at reduced resolution. ' +
+                             'Parameters in pixels are scaled to match. ' +
+                             'Default: full resolution')
+
     parser.add_argument('--dst_dir', type=str,
                         default='/deep/group/aihc-bootcamp-spring2020/break/chexperturbed/data/' +
                                 'synthetic/CheXpert-10K-digital',
@@ -56,11 +159,127 @@ def parse_script_args():
                         choices=tuple(LEVELS),
                         default=1, help='Severity of perturbation')
 
+    parser.add_argument('--chains', type=str, nargs='+',
+                        help='Sweep mode: perturbation chains to generate, ' +
+                             'each a comma-separated list of perturbations ' +
+                             'optionally followed by :level (e.g. ' +
+                             'glare_matte,moire:2,tilt:3), or "all" for ' +
+                             'every single perturbation. Overrides ' +
+                             '--perturbation, --perturbation2 and ' +
+                             '--perturbation3')
+
+    parser.add_argument('--levels', type=int, nargs='+',
+                        choices=tuple(LEVELS),
+                        help='Sweep mode: levels at which to generate ' +
+                             'the steps of every chain that do not fix ' +
+                             'their own level. Default: all levels')
+
     parser.add_argument('--split', type=str,
                         choices=('train', 'valid', 'test'),
                         default='train', help='Type of splitting of dataset')
 
-    args = parser.parse_args()
+    parser.add_argument('--num_workers', type=int,
+                        default=available_cpus(),
+                        help='Number of worker processes or threads. ' +
+                             'Default: number of CPUs available to this ' +
+                             'process, within its cgroup quota')
+
+    parser.add_argument('--threads_per_worker', type=int,
+                        help='Maximum number of threads each worker may ' +
+                             'use in OpenCV, OpenMP and BLAS. Default: the ' +
+                             'available CPUs divided by --num_workers')
+
+    parser.add_argument('--executor', type=str,
+                        choices=tuple(EXECUTORS), default='process',
+                        help='Run workers as processes, or as threads of ' +
+                             'this process, which share its memory and ' +
+                             'skip pickling. Image kernels release the GIL')
+
+    parser.add_argument('--chunk_size', type=int,
+                        default=32,
+                        help='Number of images submitted to a worker at once')
+
+    parser.add_argument('--max_in_flight', type=int,
+                        help='Maximum number of chunks pending at once. ' +
+                             'Default: twice the number of workers')
+
+    parser.add_argument('--resume', action='store_true',
+                        help='Skip images already recorded as finished ' +
+                             'in the manifest of a previous run')
+
+    parser.add_argument('--seed', type=int,
+                        default=0,
+                        help='Global seed from which the random stream of ' +
+                             'every image is derived')
+
+    parser.add_argument('--share_params', action='store_true',
+                        help='Draw the same parameters for every image, ' +
+                             'rather than per image, so that images of ' +
+                             'the same size get identical perturbations ' +
+                             'and share their masks')
+
+    parser.add_argument('--replay', type=str,
+                        help='Manifest of a previous run of a single ' +
+                             'variant. Its images are regenerated from ' +
+                             'the recorded parameters instead of drawing ' +
+                             'new ones')
+
+    parser.add_argument('--profile', action='store_true',
+                        help='Record the time and peak memory of every ' +
+                             'stage of every image, and write percentiles ' +
+                             'per stage to <dst_dir>/<split>_profile.json ' +
+                             'and .csv')
+
+    parser.add_argument('--shard', type=str,
+                        help='Only process shard i of N, given as i/N. ' +
+                             'Rows i, i + N, i + 2N, ... of the csv belong ' +
+                             'to shard i')
+
+    parser.add_argument('--format', type=str,
+                        choices=FORMATS, default='source',
+                        help='Output image format. "source" keeps the ' +
+                             'format of the source image, "webp" is ' +
+                             'lossless and "raw" writes uint8 .npy arrays')
+
+    parser.add_argument('--png_compress_level', type=int,
+                        choices=range(10), default=6,
+                        help='zlib level of PNG outputs, from 0 (none) ' +
+                             'to 9 (smallest)')
+
+    parser.add_argument('--jpeg_quality', type=int,
+                        default=75, help='Quality of JPEG outputs')
+
+    parser.add_argument('--jpeg_subsampling', type=str,
+                        choices=JPEG_SUBSAMPLINGS,
+                        help='Chroma subsampling of colour JPEG outputs')
+
+    parser.add_argument('--output', type=str,
+                        choices=OUTPUTS, default='files',
+                        help='How to write images: one file per image, ' +
+                             'size-capped tar shards of encoded images, ' +
+                             'or a single flat array of raw uint8 pixels')
+
+    parser.add_argument('--tar_max_mb', type=int,
+                        default=1024,
+                        help='Size in MB after which a tar shard is closed')
+
+    args = parser.parse_args(argv)
+    if args.perturbation is None and not args.chains:
+        parser.error('either --perturbation or --chains is required')
+    if args.threads_per_worker is not None and args.threads_per_worker < 1:
+        parser.error('--threads_per_worker must be positive')
+    if args.target_size is not None and args.target_size < 1:
+        parser.error('--target_size must be positive')
+    if args.replay is not None and len(get_variants(args)) != 1:
+        parser.error('--replay requires a single variant')
+    if args.shard is not None:
+        try:
+            args.shard = tuple(int(part) for part in args.shard.split('/'))
+            index, count = args.shard
+        except ValueError:
+            parser.error('--shard must be given as i/N')
+        if not 0 <= index < count:
+            parser.error('--shard i/N requires 0 <= i < N')
     return args
 
 
@@ -101,20 +320,332 @@ def apply_perturbation(perturbation, level, src_img):
         return PERTURBATIONS[perturbation](level, src_img)
     raise NotImplementedError()
 
-def process_perturbation(path, args, perturbed_dir):
-    # TODO: remove the absolute path
-    src_img = Image.open(Path('/deep/group/CheXpert/') / path)
-    dst_img = apply_perturbation(args.perturbation, args.level, src_img)
-    dst_img = apply_perturbation(args.perturbation2, args.level, dst_img)
-    dst_img = apply_perturbation(args.perturbation3, args.level, dst_img)
-    # write stuff to disk
-    dst_path = get_dst_img_path(path, args.split, perturbed_dir)
-    dst_path.parent.mkdir(parents=True, exist_ok=True)
-    dst_img.save(dst_path)
+
+def get_variants(args):
+    """List the pipelines requested on the command line.
+
+    Args:
+        args (Namespace): Parsed command line arguments
+
+    Returns:
+        (list): pipelines, each a tuple of (perturbation, level) steps to
+            apply in order
+
+    """
+    if not args.chains:
+        spec = ','.join((args.perturbation, args.perturbation2,
+                         args.perturbation3))
+        return [parse_pipeline(spec, args.level)]
+    specs = []
+    for spec in args.chains:
+        if spec == 'all':
+            specs.extend(perturbation for perturbation in PERTURBATIONS
+                         if perturbation != 'identity')
+        else:
+            specs.append(spec)
+    variants = []
+    for spec in specs:
+        if has_levels(spec):
+            variants.append(parse_pipeline(spec))
+        else:
+            variants.extend(parse_pipeline(spec, level)
+                            for level in args.levels or LEVELS)
+    # drop duplicates while keeping the requested order
+    return list(dict.fromkeys(variants))
+
+
+def get_perturbed_dir(dst_dir, steps):
+    """Derive the root of the perturbed dataset of a pipeline.
+
+    Identity steps after the first perturbation are left out of the path.
+    Pipelines whose steps all share one level keep the level_N layout;
+    otherwise the level of every step is listed, as in level_2-1-3.
+
+    Args:
+        dst_dir (str): destination directory for synthesized data
+        steps (tuple): (perturbation, level) steps to apply in order
+
+    Returns:
+        (Path): root of perturbed dataset
+
+    """
+    steps = steps[:1] + tuple(step for step in steps[1:]
+                              if step[0] != 'identity')
+    names = [name for name, _ in steps]
+    levels = [str(level) for _, level in steps]
+    if len(set(levels)) == 1:
+        level_name = f'level_{levels[0]}'
+    else:
+        level_name = 'level_' + '-'.join(levels)
+    return Path(dst_dir).joinpath(*names) / level_name
+
+
+def save_image(img, dst_path, save_options):
+    """Encode an image and atomically write it to dst_path.
+
+    Args:
+        img (Image): the image to save
+        dst_path (Path): where to save the image. Its extension decides the
+            image format
+        save_options (dict): maps PIL format name -> keyword arguments of
+            save
+
+    Returns:
+        (dict): the size and sha256 checksum of the written file
+
+    """
+    if dst_path.parent not in _worker_state.created_dirs:
+        with _worker_state.profiler.stage('mkdir'):
+            dst_path.parent.mkdir(parents=True, exist_ok=True)
+        _worker_state.created_dirs.add(dst_path.parent)
+    with _worker_state.profiler.stage('encode'):
+        data = encode_image(img, dst_path.suffix, save_options)
+    with _worker_state.profiler.stage('write'):
+        return atomic_write(dst_path, data)
+
+
+def pack_image(img, dst_path, perturbed_dir):
+    """Prepare an image to be packed by the parent process.
+
+    Args:
+        img (Image): the image to pack
+        dst_path (Path): path the image would have been saved to
+        perturbed_dir (Path): root of perturbed dataset
+
+    Returns:
+        (dict): member name of the image within the pack, and the encoded
+            image (tar) or its raw pixels and shape (array)
+
+    """
+    payload = {'member': str(dst_path.relative_to(perturbed_dir))}
+    with _worker_state.profiler.stage('encode'):
+        if _worker_args.output == 'array':
+            pixels = np.ascontiguousarray(np.asarray(img, dtype=np.uint8))
+            payload.update(data=pixels.tobytes(), shape=list(pixels.shape))
+        else:
+            payload['data'] = encode_image(img, dst_path.suffix,
+                                           _worker_save_options)
+    return payload
+
+
+def process_perturbation(path, variant_ids):
+    """Decode one source image and write each requested variant of it.
+
+    The source image is decoded once and shared by every variant, and the
+    steps that variants have in common are applied once. Consecutive
+    photometric steps are fused into a single lookup table, and consecutive
+    geometric steps into a single resampling. The parameters drawn by every
+    step are returned with the record, so the image can be replayed. Errors
+    are caught per variant, so one failing chain does not lose the others.
+
+    Args:
+        path (str): path to original image, as listed in the csv
+        variant_ids (list): indices into the worker's variants to generate
+
+    Returns:
+        records (list): (variant_id, manifest record) of the written images.
+            When packing, records instead hold the data for the parent to
+            write, as returned by pack_image
+        failures (list): (variant_id, quarantine record) of the variants
+            that raised
+
+    """
+    records, failures = [], []
+    try:
+        with _worker_state.profiler.stage('decode'):
+            if _worker_store is not None:
+                src_img, scale = read_store_image(*_worker_store, path), 1.0
+                if _worker_args.target_size is not None:
+                    src_img, scale = resize_image(src_img,
+                                                  _worker_args.target_size)
+            else:
+                src_img, scale = open_image(
+                    Path(_worker_args.src_root) / path,
+                    _worker_args.target_size,
+                    'L' if _worker_args.grayscale else None)
+    except Exception:
+        failure = {'path': path, 'error': traceback.format_exc()}
+        return records, [(variant_id, failure) for variant_id in variant_ids]
+
+    step_params = {}
+
+    def apply_step(prefix, img):
+        perturbation, level = prefix[-1]
+        if _worker_replay is not None:
+            params = _worker_replay[path][len(prefix) - 1]
+        else:
+            # Seed from the steps so far, so a step draws the same parameters
+            # no matter which other variants of this image are generated
+            # with it
+            keys = (prefix,) if _worker_args.share_params else (path, prefix)
+            rng = derive_rng(_worker_args.seed, *keys)
+            params = PARAMETRIC[perturbation].sample_params(level, rng,
+                                                            img.size)
+            if scale != 1 and perturbation in SCALE_PARAMS:
+                # Draws do not depend on the scale, so the effect matches
+                # that of the same draw at full resolution
+                params = SCALE_PARAMS[perturbation](params, scale)
+        step_params[prefix] = params
+        kind = fusion_kind(perturbation)
+        if kind is not None and (len(prefix) == 1 or
+                                 fusion_kind(prefix[-2][0]) == kind):
+            # Deferred, and timed when resolved
+            return apply_fused(perturbation, params, img)
+        img = resolve_profiled(img, prefix[:-1])
+        if kind is not None:
+            return apply_fused(perturbation, params, img)
+        with _worker_state.profiler.stage(f'step {perturbation}:{level}'):
+            return apply_fused(perturbation, params, img)
+
+    pipelines = [_worker_variants[variant_id][0]
+                 for variant_id in variant_ids]
+    for index, dst_img, error in run_pipelines(src_img, pipelines,
+                                               apply_step):
+        variant_id = variant_ids[index]
+        if error is not None:
+            failures.append((variant_id, {
+                'path': path,
+                'error': ''.join(traceback.format_exception(
+                    type(error), error, error.__traceback__))}))
+            continue
+        try:
+            steps = _worker_variants[variant_id][0]
+            dst_img = resolve_profiled(dst_img, steps)
+            perturbed_dir = _worker_variants[variant_id][1]
+            dst_path = encoded_path(
+                get_dst_img_path(path, _worker_args.split, perturbed_dir),
+                _worker_args.format)
+            if _worker_args.output == 'files':
+                record = {'dst': str(dst_path),
+                          **save_image(dst_img, dst_path,
+                                       _worker_save_options)}
+            else:
+                record = pack_image(dst_img, dst_path, perturbed_dir)
+            params = [step_params[steps[:i + 1]] for i in range(len(steps))]
+            records.append((variant_id,
+                            {'path': path, **record, 'params': params}))
+        except Exception:
+            failures.append((variant_id,
+                             {'path': path, 'error': traceback.format_exc()}))
+    return records, failures
+
+
+def resolve_profiled(img, steps):
+    """Resolve an image, timing any deferred steps as their own stage.
+
+    Deferring a step costs nothing, so the work of fused steps is timed when
+    they are applied: as the stage of the step if it was deferred alone, or
+    as 'fused <perturbation>:<level>+...' for a group of steps.
+
+    Args:
+        img (Image): the image to resolve, possibly deferred
+        steps (tuple): (perturbation, level) steps applied to produce img
+
+    Returns:
+        (Image): the resolved image
+
+    """
+    if not is_pending(img):
+        return resolve(img)
+    labels = [f'{perturbation}:{level}'
+              for perturbation, level in deferred_steps(steps)]
+    name = f'step {labels[0]}' if len(labels) == 1 else \
+        f'fused {"+".join(labels)}'
+    with _worker_state.profiler.stage(name):
+        return resolve(img)
+
+
+def read_replay(manifest):
+    """Read the parameters recorded in the manifest of a previous run.
+
+    Args:
+        manifest (str): path to the manifest
+
+    Returns:
+        (dict): maps source path -> parameters of each step
+
+    """
+    return {record['path']: record['params']
+            for record in read_records(Path(manifest))}
+
+
+def init_worker(args, variants):
+    """Store the static configuration of a worker process.
+
+    Called once per worker process, so the configuration is pickled once per
+    worker rather than once per image. With a thread pool, called once in
+    the parent, whose configuration every thread then shares, while each
+    thread sets up its own state with init_worker_thread.
+
+    Args:
+        args (Namespace): Parsed command line arguments
+        variants (list): (steps, perturbed_dir) of every variant
+
+    """
+    global _worker_args, _worker_variants, _worker_save_options, \
+        _worker_store, _worker_replay
+    _worker_args = args
+    _worker_variants = variants
+    _worker_save_options = get_save_options(args.png_compress_level,
+                                            args.jpeg_quality,
+                                            args.jpeg_subsampling)
+    if args.src_store is not None:
+        _worker_store = load_store(args.src_store)
+    if args.replay is not None:
+        _worker_replay = read_replay(args.replay)
+    limit_threads(args.threads_per_worker)
+    if args.share_params:
+        # Images of the same size then share Moire masks, each worker
+        # caching its own
+        moire_alpha_cache.resize(MOIRE_ALPHA_CACHE_BYTES)
+    init_worker_thread(args)
+
+
+def init_worker_thread(args):
+    """Set up the state private to the calling worker thread.
+
+    Each thread of a thread pool profiles into its own profiler, whose
+    samples are merged by the parent with those of the others. The peak RSS
+    of the process is shared by its threads, so they only record times.
+
+    Args:
+        args (Namespace): Parsed command line arguments
+
+    """
+    if args.profile:
+        _worker_state.profiler = Profiler(
+            stage_rss=args.executor == 'process')
+
+
+def process_chunk(tasks):
+    """Perturb a chunk of images using the worker's static configuration.
+
+    Args:
+        tasks (list): (path, variant_ids) of each image to perturb
+
+    Returns:
+        records (list): (variant_id, manifest record) of the written images
+        failures (list): (variant_id, quarantine record) of the variants
+            that raised
+        profile (dict): samples of every stage run for the chunk, or None
+            when not profiling
+
+    """
+    records, failures = [], []
+    for path, variant_ids in tasks:
+        image_records, image_failures = process_perturbation(path,
+                                                             variant_ids)
+        records.extend(image_records)
+        failures.extend(image_failures)
+    return records, failures, _worker_state.profiler.pop()
+
 
 def generate_data(args):
     """Generate perturbed dataset.
 
+    Every requested variant is generated in the same pass over the source
+    images, so each source image is read and decoded only once.
+
     Args:
         args (Namespace): Parsed command line arguments
 
@@ -122,34 +653,158 @@ def generate_data(args):
         None
 
     """
-    # manages optional additional perturbations
-    if (args.perturbation2!="identity"):
-        if (args.perturbation3!="identity"):
-            perturbed_dir = Path(args.dst_dir) / args.perturbation / args.perturbation2/ args.perturbation3 / f'level_{args.level}'
-        else:
-            perturbed_dir = Path(args.dst_dir) / args.perturbation / args.perturbation2 / f'level_{args.level}'
-    else:
-        perturbed_dir = Path(args.dst_dir) / args.perturbation / f'level_{args.level}'
-    
-    
-    perturbed_dir.mkdir(parents=True, exist_ok=True)
+    variants = [(steps, get_perturbed_dir(args.dst_dir, steps))
+                for steps in get_variants(args)]
 
     src_df = pd.read_csv(args.src_csv)
+    name = args.split
+    if args.shard is not None:
+        index, count = args.shard
+        src_df = src_df.iloc[index::count]
+        name = f'{args.split}_shard{index}of{count}'
+    if args.replay is not None:
+        # only the images recorded in the manifest can be replayed
+        src_df = src_df[src_df[COL_PATH].isin(read_replay(args.replay))]
     paths = list(src_df[COL_PATH])
 
-    # generate the image using parallel processing
-    with concurrent.futures.ProcessPoolExecutor() as executor:
-        results = [executor.submit(process_perturbation, path, args, perturbed_dir) for path in paths]
-
-        for f in tqdm(concurrent.futures.as_completed(results), total=len(paths)):
-            pass
-        
-    src_df[COL_PATH] = src_df[COL_PATH].apply(get_dst_img_path,
-                                              args=(args.split, perturbed_dir))
-    src_df.to_csv(perturbed_dir / f'{args.split}.csv', index=False)
+    manifests, quarantines, done = [], [], []
+    for _, perturbed_dir in variants:
+        perturbed_dir.mkdir(parents=True, exist_ok=True)
+        manifest = manifest_path(perturbed_dir, name)
+        quarantine = quarantine_path(perturbed_dir, name)
+        if args.resume:
+            done.append(completed_paths(manifest))
+        else:
+            # start from a clean slate so stale records cannot be mistaken
+            # for outputs of this run
+            if manifest.exists():
+                manifest.unlink()
+            # packs are appended to, so they would otherwise keep the images
+            # of the previous run ahead of this one's
+            remove_packs(perturbed_dir, name)
+            done.append(set())
+        # previously quarantined images are retried, so only keep failures
+        # of this run
+        if quarantine.exists():
+            quarantine.unlink()
+        manifests.append(manifest)
+        quarantines.append(quarantine)
+
+    todo = []
+    for path in paths:
+        variant_ids = [variant_id for variant_id in range(len(variants))
+                       if path not in done[variant_id]]
+        if variant_ids:
+            todo.append((path, variant_ids))
+    if args.resume:
+        print(f'Resuming: {len(paths) - len(todo)} of {len(paths)} ' +
+              'images already done for every variant')
+    failed = [set() for _ in variants]
+    writers = None
+    if args.output != 'files':
+        writers = [get_writer(args.output, perturbed_dir, name,
+                              args.tar_max_mb * 1024 ** 2)
+                   for _, perturbed_dir in variants]
+
+    concurrency = plan_concurrency(args.num_workers, args.threads_per_worker)
+    # Workers set the same limits when they start. The limits read back here
+    # are those of the pools actually loaded, as the workers get them
+    args.threads_per_worker = concurrency['threads_per_worker']
+    concurrency.update(limit_threads(args.threads_per_worker))
+    print(f'{args.num_workers} {args.executor} workers with up to ' +
+          f'{args.threads_per_worker} library threads each, on ' +
+          f'{concurrency["available_cpus"]} available CPUs')
+    # Recorded before any work is submitted, so that the plan of a run is
+    # known even if it does not finish
+    run_info = {
+        'images': len(todo), 'variants': len(variants),
+        'num_workers': args.num_workers, 'executor': args.executor,
+        'format': args.format, 'output': args.output,
+        'concurrency': concurrency}
+    run_report = Path(args.dst_dir) / f'{name}_run.json'
+    atomic_write(run_report, json.dumps(run_info, indent=2).encode())
+
+    profile = {}
+    profiler = Profiler(stage_rss=args.executor == 'process') \
+        if args.profile else NullProfiler()
+    start = time.perf_counter()
+
+    # generate the images using parallel processing, submitting chunks of
+    # paths through a bounded window so memory does not grow with the csv
+    max_in_flight = args.max_in_flight or 2 * args.num_workers
+    if args.executor == 'thread':
+        # Threads share the configuration of this process, so set it once
+        init_worker(args, variants)
+        pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=args.num_workers,
+            initializer=init_worker_thread,
+            initargs=(args,))
+    else:
+        pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=args.num_workers,
+            initializer=init_worker,
+            initargs=(args, variants))
+    with pool as executor, tqdm(total=len(todo)) as progress:
+        for chunk, (records, failures, chunk_profile) in run_chunked(
+                executor, process_chunk, todo, args.chunk_size,
+                max_in_flight):
+            merge_samples(profile, chunk_profile)
+            variant_records = defaultdict(list)
+            for variant_id, record in records:
+                if writers is not None:
+                    # the image data is written to the pack, not the manifest
+                    data = record.pop('data')
+                    record.update(checksum(data))
+                    with profiler.stage('pack'):
+                        record.update(writers[variant_id].write(
+                            record['member'], data))
+                variant_records[variant_id].append(record)
+            for variant_id, variant_record in variant_records.items():
+                if writers is not None:
+                    writers[variant_id].flush()
+                append_records(manifests[variant_id], variant_record)
+            variant_failures = defaultdict(list)
+            for variant_id, failure in failures:
+                variant_failures[variant_id].append(failure)
+                failed[variant_id].add(failure['path'])
+            for variant_id, variant_failure in variant_failures.items():
+                append_records(quarantines[variant_id], variant_failure)
+            progress.update(len(chunk))
+    for writer in writers or []:
+        writer.close()
+    wall_time = time.perf_counter() - start
+    run_info['wall_s'] = round(wall_time, 3)
+    run_info['images_per_s'] = round(len(todo) / wall_time, 3)
+    run_info['failed'] = sum(len(variant_failed) for variant_failed in failed)
+    if args.executor == 'thread':
+        # Stages overlap across threads, so only the process has a peak
+        run_info['peak_rss_mb'] = round(peak_rss() / 2 ** 20, 3)
+    atomic_write(run_report, json.dumps(run_info, indent=2).encode())
+    if args.profile:
+        merge_samples(profile, profiler.pop())
+        stem = Path(args.dst_dir) / f'{name}_profile'
+        write_report(profile, stem, run_info)
+        print(f'Profile written to {stem}.json and {stem}.csv')
+
+    for (_, perturbed_dir), manifest, quarantine, variant_failed in zip(
+            variants, manifests, quarantines, failed):
+        dst_df = src_df
+        if variant_failed:
+            print(f'{len(variant_failed)} images failed, see {quarantine}. ' +
+                  'They are left out of the csv; rerun with --resume to ' +
+                  'retry.')
+            dst_df = dst_df[~dst_df[COL_PATH].isin(variant_failed)]
+        dst_df = dst_df.assign(**{COL_PATH: dst_df[COL_PATH].apply(
+            lambda path: encoded_path(
+                get_dst_img_path(path, args.split, perturbed_dir),
+                args.format))})
+        dst_df.to_csv(perturbed_dir / f'{name}.csv', index=False)
+        if writers is not None:
+            src_paths = src_df.loc[dst_df.index, COL_PATH]
+            write_indices(read_records(manifest), src_paths,
+                          dst_df[COL_PATH])
 
 
 if __name__ == '__main__':
-    np.random.seed(0)
     args = parse_script_args()
     generate_data(args)
@@ -0,0 +1,40 @@
+"""Fixtures shared by the tests of whole synthesis runs."""
+import numpy as np
+import pandas as pd
+import pytest
+from PIL import Image
+
+import synthesize
+
+NUM_SOURCES = 6
+
+
+@pytest.fixture
+def source_csv(tmp_path):
+    """Write a csv of small noisy JPEG sources under tmp_path / 'src'."""
+    rng = np.random.RandomState(0)
+    paths = []
+    for i in range(NUM_SOURCES):
+        path = f'CheXpert-v1.0/train/patient{i:05d}/study1/view1_frontal.jpg'
+        src_path = tmp_path / 'src' / path
+        src_path.parent.mkdir(parents=True)
+        pixels = rng.randint(0, 256, (48 + 4 * i, 64)).astype(np.uint8)
+        Image.fromarray(pixels).save(src_path)
+        paths.append(path)
+    csv_path = tmp_path / 'train.csv'
+    pd.DataFrame({'Path': paths, 'Sex': 'F'}).to_csv(csv_path, index=False)
+    return csv_path
+
+
+@pytest.fixture
+def run_synthesize(tmp_path, source_csv):
+    """Run synthesize.py on source_csv with extra command line arguments."""
+    def run(dst_dir, *argv):
+        args = synthesize.parse_script_args([
+            '--src_csv', str(source_csv), '--src_root', str(tmp_path / 'src'),
+            '--split', 'train', '--dst_dir', str(dst_dir), '--format', 'png',
+            '--num_workers', '2', '--executor', 'thread', '--chunk_size', '2',
+            *argv])
+        synthesize.generate_data(args)
+        return dst_dir
+    return run
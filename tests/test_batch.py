@@ -0,0 +1,47 @@
+"""Tests for perturbing batches of same-size grayscale images."""
+import numpy as np
+import pytest
+from PIL import Image
+
+from transforms.batch import apply_batch
+from transforms.constants import PARAMETRIC
+
+SIZE = (64, 48)
+
+
+def make_batch(count, seed=0):
+    """Make a batch of noisy grayscale images of shape (count, H, W)."""
+    rng = np.random.RandomState(seed)
+    return rng.randint(0, 256, (count, SIZE[1], SIZE[0]), dtype=np.uint8)
+
+
+@pytest.mark.parametrize('perturbation', sorted(PARAMETRIC))
+def test_apply_batch_matches_loop(perturbation):
+    imgs = make_batch(3)
+    sample_params, apply = PARAMETRIC[perturbation]
+    for level in (1, 4):
+        np.random.seed(level)
+        batch = apply_batch(perturbation, level, imgs)
+        np.random.seed(level)
+        loop = np.stack([np.asarray(apply(Image.fromarray(img, 'L'),
+                                          sample_params(level, np.random,
+                                                        SIZE)))
+                         for img in imgs])
+        np.testing.assert_array_equal(batch, loop)
+
+
+def test_apply_batch_uses_given_params():
+    imgs = make_batch(4, seed=1)
+    rng = np.random.RandomState(0)
+    params = [PARAMETRIC['contrast_up'].sample_params(2, rng, SIZE)
+              for _ in imgs]
+    batch = apply_batch('contrast_up', 2, imgs, params)
+    for img, img_params, output in zip(imgs, params, batch):
+        expected = PARAMETRIC['contrast_up'].apply(Image.fromarray(img, 'L'),
+                                                   img_params)
+        np.testing.assert_array_equal(output, np.asarray(expected))
+
+
+def test_apply_batch_rejects_single_image():
+    with pytest.raises(ValueError):
+        apply_batch('blur', 1, make_batch(1)[0])
@@ -0,0 +1,85 @@
+"""Tests for the homographies shared by the geometric perturbations."""
+import numpy as np
+from PIL import Image
+from scipy import ndimage
+
+from transforms.constants import GEOMETRIC, PARAMETRIC
+from transforms.fusion import apply_fused, resolve
+from transforms.homography import (affine_to_matrix, coeffs_to_matrix,
+                                   find_coeffs, matrix_to_affine, warp_image)
+
+STEPS = ('tilt', 'rotation', 'translation')
+
+
+def smooth_image(size):
+    """Make a grayscale image smooth enough to resample without aliasing."""
+    width, height = size
+    xs = np.linspace(0, 2 * np.pi, width)
+    ys = np.linspace(0, 2 * np.pi, height)[:, None]
+    pixels = 128 + 60 * np.sin(xs) * np.cos(ys) + 30 * np.cos(2 * xs + ys)
+    return Image.fromarray(np.round(pixels).astype(np.uint8))
+
+
+def warp_sequentially(img, steps):
+    """Resample each (perturbation, params) step in turn.
+
+    Steps are resampled in floating point, since PIL truncates the output of
+    8-bit bicubic resampling, which would lose half a level on average per
+    step rather than once.
+
+    """
+    img = img.convert('F')
+    for perturbation, params in steps:
+        get_warp, _ = GEOMETRIC[perturbation]
+        img = warp_image(img, *get_warp(params, img.size))
+    return img
+
+
+def warp_fused(img, steps):
+    """Apply (perturbation, params) steps with their warps fused."""
+    for perturbation, params in steps:
+        img = apply_fused(perturbation, params, img)
+    return resolve(img)
+
+
+def test_find_coeffs_maps_points():
+    pa = [(10, 20), (300, 5), (280, 250), (30, 240)]
+    pb = [(0, 0), (320, 0), (320, 256), (0, 256)]
+    matrix = coeffs_to_matrix(find_coeffs(pa, pb))
+    for (x, y), expected in zip(pa, pb):
+        mapped = matrix @ [x, y, 1.0]
+        np.testing.assert_allclose(mapped[:2] / mapped[2], expected,
+                                   atol=1e-9)
+
+
+def test_affine_round_trip():
+    affine = np.array([[0.8, -0.6, 40.0], [0.6, 0.8, -12.5]])
+    np.testing.assert_allclose(matrix_to_affine(affine_to_matrix(affine)),
+                               affine, atol=1e-9)
+    matrix = affine_to_matrix(affine)
+    np.testing.assert_allclose(affine_to_matrix(matrix_to_affine(matrix)),
+                               matrix, atol=1e-9)
+
+
+def test_fused_warps_match_sequential():
+    img = smooth_image((640, 512))
+    rng = np.random.RandomState(0)
+    steps = []
+    for perturbation in STEPS:
+        # Warps after the first are drawn for the size they are applied to
+        size = warp_sequentially(img, steps).size
+        steps.append((perturbation,
+                      PARAMETRIC[perturbation].sample_params(1, rng, size)))
+    sequential = warp_sequentially(img, steps)
+    fused = warp_fused(img, steps)
+    assert fused.size == sequential.size
+    # Compare where every sequential step sampled inside its input, away
+    # from the black borders each resampling blurs in
+    valid = np.asarray(warp_sequentially(Image.new('L', img.size, 255),
+                                         steps)) >= 255
+    valid = ndimage.binary_erosion(valid, iterations=4)
+    assert valid.mean() > 0.25
+    # Truncate as PIL does the fused output
+    error = np.abs(np.floor(np.asarray(sequential)) -
+                   np.asarray(fused, dtype=np.float32))
+    assert error[valid].max() <= 1
@@ -0,0 +1,83 @@
+"""Tests for the manifests and quarantine lists that runs resume from."""
+import json
+from pathlib import Path
+
+import pandas as pd
+from PIL import Image
+
+from synthesis.manifest import (append_records, completed_paths,
+                                manifest_path, quarantine_path, read_records)
+
+STEPS = ('--perturbation', 'blur', '--level', '1')
+
+
+def test_read_records_ignores_truncated_line(tmp_path):
+    path = tmp_path / 'train_manifest.jsonl'
+    append_records(path, [{'path': 'a'}, {'path': 'b'}])
+    with open(path, 'a') as f:
+        f.write('{"path": "c", "ds')
+    assert read_records(path) == [{'path': 'a'}, {'path': 'b'}]
+    assert read_records(tmp_path / 'missing.jsonl') == []
+
+
+def test_completed_paths_redoes_missing_and_truncated_outputs(tmp_path):
+    for name in ('kept', 'deleted', 'truncated'):
+        (tmp_path / f'{name}.png').write_bytes(b'x' * 10)
+    (tmp_path / 'pack.u8').write_bytes(b'x' * 30)
+    path = tmp_path / 'train_manifest.jsonl'
+    append_records(path, [
+        {'path': name, 'dst': str(tmp_path / f'{name}.png'), 'size': 10}
+        for name in ('kept', 'deleted', 'truncated')])
+    append_records(path, [
+        {'path': 'packed', 'dst': str(tmp_path / 'pack.u8'), 'offset': 10,
+         'size': 20},
+        {'path': 'cut_off', 'dst': str(tmp_path / 'pack.u8'), 'offset': 20,
+         'size': 20}])
+    (tmp_path / 'deleted.png').unlink()
+    (tmp_path / 'truncated.png').write_bytes(b'x' * 5)
+    assert completed_paths(path) == {'kept', 'packed'}
+
+
+def test_resume_redoes_only_missing_outputs(tmp_path, run_synthesize):
+    dst_dir = run_synthesize(tmp_path / 'dst', *STEPS)
+    perturbed_dir = dst_dir / 'blur' / 'level_1'
+    manifest = manifest_path(perturbed_dir, 'train')
+    records = read_records(manifest)
+    redone = records[2]
+    with Image.open(redone['dst']) as img:
+        expected = img.tobytes()
+    Path(redone['dst']).unlink()
+
+    run_synthesize(dst_dir, *STEPS, '--resume')
+    resumed = read_records(manifest)
+    assert resumed[:len(records)] == records
+    assert [record['path'] for record in resumed[len(records):]] == \
+        [redone['path']]
+    with Image.open(redone['dst']) as img:
+        assert img.tobytes() == expected
+
+
+def test_resume_retries_quarantined_images(tmp_path, run_synthesize,
+                                           source_csv):
+    src_paths = list(pd.read_csv(source_csv)['Path'])
+    broken = tmp_path / 'src' / src_paths[1]
+    source = broken.read_bytes()
+    broken.write_bytes(source[:100])
+    dst_dir = run_synthesize(tmp_path / 'dst', *STEPS)
+    perturbed_dir = dst_dir / 'blur' / 'level_1'
+    quarantine = quarantine_path(perturbed_dir, 'train')
+    assert [record['path'] for record in read_records(quarantine)] == \
+        [src_paths[1]]
+    dst_csv = pd.read_csv(perturbed_dir / 'train.csv')
+    assert len(dst_csv) == len(src_paths) - 1
+
+    broken.write_bytes(source)
+    run_synthesize(dst_dir, *STEPS, '--resume')
+    assert not quarantine.exists()
+    assert completed_paths(manifest_path(perturbed_dir, 'train')) == \
+        set(src_paths)
+    dst_csv = pd.read_csv(perturbed_dir / 'train.csv')
+    assert len(dst_csv) == len(src_paths)
+    assert Path(dst_csv['Path'][1]).exists()
+    with open(dst_dir / 'train_run.json') as f:
+        assert json.load(f)['images'] == 1
@@ -0,0 +1,67 @@
+"""Tests for packed outputs and the indices that locate images in them."""
+import tarfile
+
+import numpy as np
+import pandas as pd
+
+from synthesis.packing import (ArrayWriter, TarShardWriter, get_encoded,
+                               get_pixels, index_path, open_pack,
+                               write_indices)
+
+
+def test_array_index_locates_pixels(tmp_path):
+    rng = np.random.RandomState(0)
+    images = {'a.jpg': rng.randint(0, 256, (4, 6), dtype=np.uint8),
+              'b.jpg': rng.randint(0, 256, (5, 3, 3), dtype=np.uint8)}
+    writer = ArrayWriter(tmp_path, 'train')
+    records = [{'path': path, 'member': path, 'shape': list(pixels.shape),
+                'size': pixels.size, **writer.write(path, pixels.tobytes())}
+               for path, pixels in images.items()]
+    writer.close()
+    write_indices(records, list(images), ['A.png', 'B.png'])
+
+    index_df = pd.read_csv(index_path(writer.path))
+    assert list(index_df['Path']) == ['A.png', 'B.png']
+    pack = open_pack(writer.path)
+    for pixels, (_, row) in zip(images.values(), index_df.iterrows()):
+        view = get_pixels(pack, row['offset'], row['height'], row['width'],
+                          row['channels'])
+        np.testing.assert_array_equal(view, pixels)
+
+
+def test_tar_shards_are_indexed_and_readable(tmp_path):
+    writer = TarShardWriter(tmp_path, 'train', max_bytes=1)
+    data = {'a.png': b'first image', 'b.png': b'second image'}
+    records = [{'path': member, 'member': member, 'size': len(content),
+                **writer.write(member, content)}
+               for member, content in data.items()]
+    writer.close()
+    assert records[0]['dst'] != records[1]['dst']
+    write_indices(records, list(data), list(data))
+
+    for record in records:
+        index_df = pd.read_csv(index_path(record['dst']))
+        assert list(index_df['member']) == [record['member']]
+        pack = open_pack(record['dst'])
+        assert get_encoded(pack, index_df['offset'][0],
+                           index_df['size'][0]).tobytes() == \
+            data[record['member']]
+        with tarfile.open(record['dst']) as tar:
+            assert tar.extractfile(record['member']).read() == \
+                data[record['member']]
+
+
+def test_write_indices_drops_superseded_entries(tmp_path):
+    shards = [str(tmp_path / f'train-0000{i}.tar') for i in range(3)]
+    records = [
+        {'path': 'a', 'dst': shards[0], 'member': 'a', 'offset': 0, 'size': 1},
+        {'path': 'b', 'dst': shards[0], 'member': 'b', 'offset': 9, 'size': 1},
+        {'path': 'c', 'dst': shards[1], 'member': 'c', 'offset': 0, 'size': 1},
+        # rewritten by a resumed run
+        {'path': 'a', 'dst': shards[2], 'member': 'a', 'offset': 0, 'size': 2},
+        {'path': 'c', 'dst': shards[2], 'member': 'c', 'offset': 9, 'size': 2}]
+    write_indices(records, ['a', 'b', 'c'], ['A', 'B', 'C'])
+    members = [list(pd.read_csv(index_path(shard))['member'])
+               for shard in shards]
+    assert members == [['b'], [], ['a', 'c']]
+    assert list(pd.read_csv(index_path(shards[2]))['size']) == [2, 2]
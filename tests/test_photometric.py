@@ -0,0 +1,66 @@
+"""Tests for photometric perturbations fused into lookup tables."""
+import numpy as np
+from PIL import Image, ImageEnhance
+from skimage import exposure
+
+from transforms.constants import LEVELS, PARAMETRIC, PHOTOMETRIC
+from transforms.fusion import apply_fused, resolve
+from transforms.photometric import apply_photometric
+
+
+def noisy_image(size, seed=0):
+    """Make a grayscale image covering the whole range of values."""
+    width, height = size
+    rng = np.random.RandomState(seed)
+    return Image.fromarray(rng.randint(0, 256, (height, width),
+                                       dtype=np.uint8))
+
+
+def enhance_sequentially(img, ops):
+    """Apply each operation in a full pass, as before they were fused."""
+    for name, arg in ops:
+        if name == 'brightness':
+            img = ImageEnhance.Brightness(img).enhance(arg)
+        elif name == 'contrast':
+            img = ImageEnhance.Contrast(img).enhance(arg)
+        else:
+            cutoff, gain = arg
+            img = Image.fromarray(exposure.adjust_sigmoid(
+                np.asarray(img), cutoff=cutoff, gain=gain))
+    return img
+
+
+def test_lut_matches_image_enhance():
+    img = noisy_image((96, 64))
+    rng = np.random.RandomState(0)
+    for perturbation in sorted(PHOTOMETRIC):
+        for level in LEVELS:
+            ops = PARAMETRIC[perturbation].sample_params(level, rng,
+                                                         img.size)['ops']
+            np.testing.assert_array_equal(
+                np.asarray(apply_photometric(img, ops)),
+                np.asarray(enhance_sequentially(img, ops)),
+                err_msg=f'{perturbation}:{level} {ops}')
+
+
+def test_lut_composes_operations():
+    img = noisy_image((96, 64), seed=1)
+    ops = [('brightness', 1.3), ('contrast', 0.6), ('sigmoid', (0.4, 8)),
+           ('contrast', 1.4), ('brightness', 0.8)]
+    np.testing.assert_array_equal(np.asarray(apply_photometric(img, ops)),
+                                  np.asarray(enhance_sequentially(img, ops)))
+
+
+def test_fused_steps_match_separate_steps():
+    img = noisy_image((96, 64), seed=2)
+    rng = np.random.RandomState(1)
+    steps = [(perturbation, PARAMETRIC[perturbation].sample_params(
+        3, rng, img.size)) for perturbation in
+        ('contrast_up', 'brightness_down', 'exposure', 'contrast_down')]
+    separate = img
+    fused = img
+    for perturbation, params in steps:
+        separate = PARAMETRIC[perturbation].apply(separate, params)
+        fused = apply_fused(perturbation, params, fused)
+    np.testing.assert_array_equal(np.asarray(resolve(fused)),
+                                  np.asarray(separate))
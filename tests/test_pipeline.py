@@ -0,0 +1,46 @@
+"""Tests for parsing pipelines and applying them with shared prefixes."""
+import pytest
+
+from synthesis.pipeline import has_levels, parse_pipeline, run_pipelines
+
+
+def test_parse_pipeline():
+    assert parse_pipeline('moire:2,blur:1') == (('moire', 2), ('blur', 1))
+    assert parse_pipeline('moire,blur:3', default_level=1) == \
+        (('moire', 1), ('blur', 3))
+    assert has_levels('moire:2,blur:1') and not has_levels('moire,blur:1')
+    for spec in ('moire', 'unknown:1', 'moire:5'):
+        with pytest.raises(ValueError):
+            parse_pipeline(spec)
+
+
+def test_run_pipelines_applies_shared_prefixes_once():
+    pipelines = [('a', 'b', 'c'), ('d',), ('a', 'b'), ('a', 'e'),
+                 ('a', 'b', 'f')]
+    applied = []
+
+    def apply_step(prefix, img):
+        applied.append(prefix)
+        return img + prefix[-1]
+
+    outputs = {index: (img, error) for index, img, error in
+               run_pipelines('', pipelines, apply_step)}
+    assert outputs == {index: (''.join(steps), None)
+                       for index, steps in enumerate(pipelines)}
+    assert sorted(applied) == sorted(set(
+        steps[:i + 1] for steps in pipelines for i in range(len(steps))))
+
+
+def test_run_pipelines_fails_every_pipeline_sharing_a_failing_prefix():
+    pipelines = [('a', 'b', 'c'), ('a', 'b'), ('a', 'c'), ('b',)]
+    error = ValueError('b failed')
+
+    def apply_step(prefix, img):
+        if prefix == ('a', 'b'):
+            raise error
+        return img + prefix[-1]
+
+    outputs = {index: (img, raised) for index, img, raised in
+               run_pipelines('', pipelines, apply_step)}
+    assert outputs == {0: (None, error), 1: (None, error), 2: ('ac', None),
+                       3: ('b', None)}
@@ -0,0 +1,46 @@
+"""Tests for the random streams every perturbation step draws from."""
+from PIL import Image
+
+from synthesize import get_perturbed_dir
+from synthesis.manifest import manifest_path, read_records
+from synthesis.rng import derive_rng, derive_seed
+
+STEPS = (('moire', 2), ('tilt', 3))
+
+
+def test_derive_rng_depends_only_on_its_keys():
+    draws = derive_rng(0, 'a.jpg', STEPS).uniform(size=4)
+    assert (derive_rng(0, 'a.jpg', STEPS).uniform(size=4) == draws).all()
+    for other in (derive_rng(1, 'a.jpg', STEPS),
+                  derive_rng(0, 'b.jpg', STEPS),
+                  derive_rng(0, 'a.jpg', STEPS[:1])):
+        assert (other.uniform(size=4) != draws).any()
+
+
+def test_derive_seed_fits_in_32_bits():
+    for key in range(100):
+        assert 0 <= derive_seed(7, key) < 2 ** 32
+
+
+def read_outputs(perturbed_dir, names):
+    """Map the source path of every recorded image to its pixels."""
+    outputs = {}
+    for name in names:
+        for record in read_records(manifest_path(perturbed_dir, name)):
+            with Image.open(record['dst']) as img:
+                outputs[record['path']] = (img.tobytes(), record['params'])
+    return outputs
+
+
+def test_shards_match_full_run(tmp_path, run_synthesize):
+    chain = ('--chains', ','.join(f'{name}:{level}' for name, level in STEPS))
+    full_dir = run_synthesize(tmp_path / 'full', *chain)
+    shard_dir = tmp_path / 'sharded'
+    for index in range(2):
+        run_synthesize(shard_dir, *chain, '--shard', f'{index}/2',
+                       '--num_workers', '1')
+    full = read_outputs(get_perturbed_dir(full_dir, STEPS), ['train'])
+    sharded = read_outputs(get_perturbed_dir(shard_dir, STEPS),
+                           ['train_shard0of2', 'train_shard1of2'])
+    assert len(full) > 1
+    assert sharded == full
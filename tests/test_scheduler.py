@@ -0,0 +1,41 @@
+"""Tests for scheduling chunks of work with a bounded in-flight window."""
+import concurrent.futures
+
+from synthesis.scheduler import chunked, run_chunked
+
+
+def test_chunked_keeps_order():
+    assert list(chunked(range(7), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert list(chunked([], 3)) == []
+
+
+def test_run_chunked_pairs_every_chunk_with_its_result():
+    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+        results = list(run_chunked(executor, sum, range(20), 3, 2))
+    assert sorted(chunk for chunk, _ in results) == list(chunked(range(20), 3))
+    for chunk, result in results:
+        assert result == sum(chunk)
+
+
+def test_run_chunked_with_one_in_flight_keeps_order():
+    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+        chunks = [chunk for chunk, _ in run_chunked(executor, sum, range(20),
+                                                    3, 1)]
+    assert chunks == list(chunked(range(20), 3))
+
+
+def test_run_chunked_pulls_items_lazily():
+    pulled = []
+
+    def items():
+        for item in range(100):
+            pulled.append(item)
+            yield item
+
+    chunk_size, max_in_flight = 4, 2
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        for consumed, _ in enumerate(run_chunked(
+                executor, sum, items(), chunk_size, max_in_flight), 1):
+            # The chunks in flight, plus the one waiting for a free slot
+            assert len(pulled) <= (consumed + max_in_flight + 1) * chunk_size
+    assert len(pulled) == 100
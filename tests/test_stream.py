@@ -0,0 +1,58 @@
+"""Tests for streaming perturbed images at load time."""
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+from synthesize import get_perturbed_dir
+from synthesis.manifest import manifest_path, read_records
+from synthesis.stream import stream_perturbed
+
+PIPELINES = ['moire:2,tilt:3', 'contrast_up:1,blur:2']
+
+
+def stream(src_df, src_root, **kwargs):
+    """Collect the path and pixels of every streamed image."""
+    return [(row['Path'], np.asarray(img)) for row, img in stream_perturbed(
+        src_df, src_root, PIPELINES, executor='thread', **kwargs)]
+
+
+def assert_same_stream(first, second):
+    assert [path for path, _ in first] == [path for path, _ in second]
+    for (_, first_pixels), (_, second_pixels) in zip(first, second):
+        np.testing.assert_array_equal(first_pixels, second_pixels)
+
+
+def test_stream_is_reproducible(tmp_path, source_csv):
+    src_df = pd.read_csv(source_csv)
+    src_root = tmp_path / 'src'
+    for kwargs in ({}, {'epoch': 3, 'shuffle': True}):
+        assert_same_stream(
+            stream(src_df, src_root, num_workers=1, **kwargs),
+            stream(src_df, src_root, num_workers=3, prefetch=2, **kwargs))
+
+
+def test_stream_epochs_differ(tmp_path, source_csv):
+    src_df = pd.read_csv(source_csv)
+    src_root = tmp_path / 'src'
+    first = stream(src_df, src_root, epoch=0, shuffle=True)
+    second = stream(src_df, src_root, epoch=1, shuffle=True)
+    assert sorted(path for path, _ in first) == list(src_df['Path'])
+    assert [path for path, _ in first] != [path for path, _ in second]
+    first, second = dict(first), dict(second)
+    assert any(first[path].shape != second[path].shape or
+               (first[path] != second[path]).any() for path in first)
+
+
+def test_stream_matches_synthesize(tmp_path, source_csv, run_synthesize):
+    src_df = pd.read_csv(source_csv)
+    dst_dir = run_synthesize(tmp_path / 'dst', '--chains', PIPELINES[0])
+    steps = (('moire', 2), ('tilt', 3))
+    written = {}
+    for record in read_records(manifest_path(
+            get_perturbed_dir(dst_dir, steps), 'train')):
+        with Image.open(record['dst']) as img:
+            written[record['path']] = np.asarray(img)
+    streamed = stream_perturbed(src_df, tmp_path / 'src', PIPELINES[:1],
+                                executor='thread')
+    for row, img in streamed:
+        np.testing.assert_array_equal(np.asarray(img), written[row['Path']])
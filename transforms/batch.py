@@ -0,0 +1,141 @@
+"""Apply perturbations to a batch of same-size grayscale images.
+
+A batch is an (N, H, W) uint8 array, perturbed with one set of parameters per
+sample. Parameters not given are drawn for each sample in turn, in the same
+order as calling the mapping on each image, so a batch gives the same output
+as a loop over its images from the same random state.
+
+Perturbations with a batched kernel skip the PIL round trip: photometric
+perturbations count the histograms of all samples and map them through
+their lookup tables each in a single pass, and motion blur filters the rows
+of all samples sharing a blur length in a single call. Geometric
+perturbations are not batched: every homography is computed first, but
+each sample is resampled on its own from a zero-copy view, since each has
+its own warp. The others apply to each image in turn.
+
+"""
+import cv2
+import numpy as np
+from PIL import Image
+
+from transforms.constants import GEOMETRIC, PARAMETRIC, PHOTOMETRIC
+from transforms.motion import align_rows, motion_blur
+from transforms.photometric import photometric_lut
+
+# Samples whose values offset into their own 256 entries fit in uint16
+OFFSET_SAMPLES = 256
+
+
+def photometric_batch(imgs, params):
+    """Apply a photometric perturbation with a lookup table per sample.
+
+    The values of each sample are offset into its own 256 entries, so that
+    the histograms of a whole run of samples are counted in one pass, and
+    the run is mapped through the stacked (N, 256) tables in one gather.
+
+    Args:
+        imgs (np.ndarray): uint8 batch of shape (N, H, W)
+        params (list): parameters of each sample
+
+    Returns:
+        (np.ndarray): the perturbed batch
+
+    """
+    output = np.empty_like(imgs)
+    for start in range(0, len(imgs), OFFSET_SAMPLES):
+        end = min(start + OFFSET_SAMPLES, len(imgs))
+        ops = [img_params['ops'] for img_params in params[start:end]]
+        offsets = np.arange(0, 256 * (end - start), 256, dtype=np.uint16)
+        indices = imgs[start:end] + offsets[:, None, None]
+        histograms = [None] * (end - start)
+        if any(name == 'contrast' for img_ops in ops for name, _ in img_ops):
+            histograms = cv2.calcHist(
+                [indices.reshape(-1, indices.shape[2])], [0], None,
+                [256 * (end - start)], [0, 256 * (end - start)]
+            ).reshape(-1, 256)
+        luts = np.stack([photometric_lut(img_ops, histogram)
+                         for img_ops, histogram in zip(ops, histograms)])
+        np.take(luts, indices, out=output[start:end], mode='clip')
+    return output
+
+
+def geometric_batch(get_warp, resample, imgs, params):
+    """Apply a geometric perturbation with one homography per sample.
+
+    Not batched: each sample is resampled on its own through its own warp.
+
+    Args:
+        get_warp (function): computes the homography of the perturbation
+        resample (function): resamples an image through a homography
+        imgs (np.ndarray): uint8 batch of shape (N, H, W)
+        params (list): parameters of each sample
+
+    Returns:
+        (np.ndarray): the perturbed batch, whose images may be larger
+
+    """
+    size = (imgs.shape[2], imgs.shape[1])
+    warps = [get_warp(img_params, size) for img_params in params]
+    return np.stack([np.asarray(resample(Image.fromarray(img, 'L'), *warp))
+                     for img, warp in zip(imgs, warps)])
+
+
+def motion_batch(imgs, params):
+    """Apply motion blur to the rows of each group of samples at once.
+
+    Args:
+        imgs (np.ndarray): uint8 batch of shape (N, H, W)
+        params (list): parameters of each sample
+
+    Returns:
+        (np.ndarray): the perturbed batch
+
+    """
+    _, height, width = imgs.shape
+    output = np.empty_like(imgs)
+    sizes = np.array([img_params['size'] for img_params in params])
+    for size in np.unique(sizes):
+        group = np.flatnonzero(sizes == size)
+        blurred = motion_blur(imgs[group].reshape(-1, width), int(size))
+        output[group] = align_rows(blurred.reshape(-1, height, width),
+                                   int(size), axis=1)
+    return output
+
+
+def apply_batch(perturbation, level, imgs, params=None):
+    """Apply a perturbation to each image of a batch.
+
+    Args:
+        perturbation (str): name of perturbation to be applied
+        level (int): degree of perturbation (from 1 to 4)
+        imgs (np.ndarray): uint8 batch of same-size grayscale images, of
+            shape (N, H, W)
+        params (list): parameters of each sample, as drawn by the
+            perturbation's sample_params. Drawn from the global random state
+            if not given
+
+    Returns:
+        (np.ndarray): uint8 batch of the perturbed images, of shape
+            (N, H', W'). Only rotation changes the size of the images
+
+    """
+    imgs = np.ascontiguousarray(imgs, dtype=np.uint8)
+    if imgs.ndim != 3:
+        raise ValueError(f'Expected a batch of shape (N, H, W), got '
+                         f'{imgs.shape}')
+    if perturbation not in PARAMETRIC:
+        raise NotImplementedError()
+    sample_params, apply = PARAMETRIC[perturbation]
+    if params is None:
+        size = (imgs.shape[2], imgs.shape[1])
+        params = [sample_params(level, np.random, size) for _ in imgs]
+    if perturbation == 'identity':
+        return imgs.copy()
+    if perturbation == 'motion':
+        return motion_batch(imgs, params)
+    if perturbation in PHOTOMETRIC:
+        return photometric_batch(imgs, params)
+    if perturbation in GEOMETRIC:
+        return geometric_batch(*GEOMETRIC[perturbation], imgs, params)
+    return np.stack([np.asarray(apply(Image.fromarray(img, 'L'), img_params))
+                     for img, img_params in zip(imgs, params)])
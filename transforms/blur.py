@@ -12,6 +12,21 @@ def blur_mapping(level, src_img):
     Returns:
         (Image): the Image perturbed by the blur
 
+    """
+    return blur_apply(src_img, blur_params(level, None, src_img.size))
+
+
+def blur_params(level, rng, size):
+    """Return the parameters of the blur effect, which draws none.
+
+    Args:
+        level (int): level of perturbation
+        rng (np.random.RandomState): random state to draw from
+        size (tuple): (width, height) of the image to perturb
+
+    Returns:
+        (dict): the Gaussian radius in pixels, under 'radius'
+
     """
     if level == 1:
         radius = 1.5
@@ -21,4 +36,14 @@ def blur_mapping(level, src_img):
         radius = 6
     else:
         radius = 10
-    return src_img.filter(ImageFilter.GaussianBlur(radius=radius))
+    return {'radius': radius}
+
+
+def blur_scale(params, scale):
+    """Scale the radius of the blur to a resized image."""
+    return {'radius': params['radius'] * scale}
+
+
+def blur_apply(img, params):
+    """Apply the blur effect with given parameters."""
+    return img.filter(ImageFilter.GaussianBlur(radius=params['radius']))
@@ -1,22 +1,38 @@
 """Implement brightness on a set of images."""
 import numpy as np
-from PIL import ImageEnhance
+from transforms.photometric import photometric_apply
 
 
-def brightness_up_mapping(level, src_img):
-    """Perform the brightness up effect.
+def brightness_up_params(level, rng, size):
+    """Draw the parameters of the brightness up effect.
 
     Args:
         level (int): level of perturbation
-        src_img (Image): PIL Image to perturb
+        rng (np.random.RandomState): random state to draw from
+        size (tuple): (width, height) of the image to perturb
 
     Returns:
-        (Image): the Image perturbed by the brightness
+        (dict): the photometric operations to apply, under 'ops'
 
     """
     if level == 1:
         factor = 0.5
     else:
         factor = level
-    noisy_factor = 1 + factor * 0.2 + np.random.uniform(-0.01, 0.01)
-    return ImageEnhance.Brightness(src_img).enhance(noisy_factor)
+    noisy_factor = 1 + factor * 0.2 + rng.uniform(-0.01, 0.01)
+    return {'ops': [('brightness', noisy_factor)]}
+
+
+def brightness_up_mapping(level, src_img):
+    """Perform the brightness up effect.
+
+    Args:
+        level (int): level of perturbation
+        src_img (Image): PIL Image to perturb
+
+    Returns:
+        (Image): the Image perturbed by the brightness
+
+    """
+    return photometric_apply(src_img,
+                             brightness_up_params(level, np.random, src_img.size))
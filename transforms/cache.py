@@ -0,0 +1,100 @@
+"""Implement a least-recently-used cache bounded by memory use.
+
+Each process gets its own caches, and so does each thread: the entries of a
+cache live in thread-local storage, so pool workers never share or lock them
+whether they are processes or threads. The memory budget applies to each
+worker separately.
+
+"""
+import threading
+from collections import OrderedDict
+
+
+class _CacheState(threading.local):
+    """Entries and counters of a cache, initialized empty in every thread."""
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+class LRUCache:
+    """Cache values up to a total size, evicting the least recently used."""
+
+    def __init__(self, max_bytes, sizeof):
+        """Create an empty cache.
+
+        Args:
+            max_bytes (int): memory budget of the cached values. Values
+                larger than the budget are returned but not cached
+            sizeof (function): returns the size in bytes of a value
+
+        """
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.state = _CacheState()
+
+    def get(self, key, create):
+        """Get the value of key, creating and caching it if needed.
+
+        Args:
+            key (hashable): key of the value
+            create (function): called without arguments to create the value
+                on a miss
+
+        Returns:
+            the cached or newly created value
+
+        """
+        state = self.state
+        if key in state.entries:
+            state.hits += 1
+            state.entries.move_to_end(key)
+            return state.entries[key][0]
+        state.misses += 1
+        value = create()
+        size = self.sizeof(value)
+        if size <= self.max_bytes:
+            state.entries[key] = (value, size)
+            state.nbytes += size
+            self.evict()
+        return value
+
+    def evict(self):
+        """Evict least recently used values until within the budget."""
+        state = self.state
+        while state.nbytes > self.max_bytes:
+            _, (_, evicted_size) = state.entries.popitem(last=False)
+            state.nbytes -= evicted_size
+            state.evictions += 1
+
+    def resize(self, max_bytes):
+        """Change the memory budget of every thread.
+
+        Values of the calling thread are evicted at once if it shrinks, those
+        of other threads on their next insert.
+
+        """
+        self.max_bytes = max_bytes
+        self.evict()
+
+    def clear(self):
+        """Remove every value of the calling thread, keeping the counters."""
+        self.state.entries.clear()
+        self.state.nbytes = 0
+
+    def stats(self):
+        """Get the counters and memory use of the cache in this thread.
+
+        Returns:
+            (dict): hits, misses, evictions, number of entries, bytes used
+                and memory budget
+
+        """
+        state = self.state
+        return {'hits': state.hits, 'misses': state.misses,
+                'evictions': state.evictions, 'entries': len(state.entries),
+                'nbytes': state.nbytes, 'max_bytes': self.max_bytes}
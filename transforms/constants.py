@@ -1,20 +1,35 @@
 """Directory of all perturbations and levels."""
+from collections import namedtuple
 
-from transforms.moire import moire_mapping
-from transforms.blur import blur_mapping
-from transforms.motion import motion_mapping
-from transforms.glare_matte import glare_matte_mapping
-from transforms.glare_glossy import glare_glossy_mapping
-from transforms.tilt import tilt_mapping
-from transforms.brightness_up import brightness_up_mapping
-from transforms.brightness_down import brightness_down_mapping
-from transforms.contrast_up import contrast_up_mapping
-from transforms.contrast_down import contrast_down_mapping
-from transforms.identity import identity_mapping
-from transforms.random_digital import random_digital_mapping
-from transforms.rotation import rotation_mapping
-from transforms.translation import translation_mapping
-from transforms.exposure import exposure_mapping
+from transforms.moire import (moire_apply, moire_mapping, moire_params,
+                              moire_scale)
+from transforms.blur import blur_apply, blur_mapping, blur_params, blur_scale
+from transforms.motion import (motion_apply, motion_mapping, motion_params,
+                               motion_scale)
+from transforms.glare_matte import (glare_matte_apply, glare_matte_mapping,
+                                    glare_matte_params, glare_matte_scale)
+from transforms.glare_glossy import (glare_glossy_apply, glare_glossy_mapping,
+                                     glare_glossy_params)
+from transforms.tilt import tilt_apply, tilt_mapping, tilt_params, tilt_warp
+from transforms.brightness_up import brightness_up_mapping, brightness_up_params
+from transforms.brightness_down import (brightness_down_mapping,
+                                        brightness_down_params)
+from transforms.contrast_up import contrast_up_mapping, contrast_up_params
+from transforms.contrast_down import (contrast_down_mapping,
+                                      contrast_down_params)
+from transforms.identity import (identity_apply, identity_mapping,
+                                 identity_params)
+from transforms.random_digital import (random_digital_mapping,
+                                       random_digital_params)
+from transforms.rotation import (rotate_image, rotation_apply,
+                                 rotation_mapping, rotation_params,
+                                 rotation_warp)
+from transforms.translation import (translation_apply, translation_mapping,
+                                    translation_params, translation_scale,
+                                    translation_warp)
+from transforms.homography import warp_image
+from transforms.exposure import exposure_mapping, exposure_params
+from transforms.photometric import photometric_apply
 
 PERTURBATIONS = {'moire': moire_mapping,
                  'blur': blur_mapping,
@@ -31,4 +46,51 @@ PERTURBATIONS = {'moire': moire_mapping,
                  'rotation':rotation_mapping,
                  'translation':translation_mapping,
                  'exposure':exposure_mapping}
+# Every perturbation split in two phases: sample_params(level, rng, size)
+# draws its random parameters as a JSON-serializable dict, and
+# apply(img, params) applies it deterministically
+Perturbation = namedtuple('Perturbation', ['sample_params', 'apply'])
+PARAMETRIC = {'moire': Perturbation(moire_params, moire_apply),
+              'blur': Perturbation(blur_params, blur_apply),
+              'motion': Perturbation(motion_params, motion_apply),
+              'glare_matte': Perturbation(glare_matte_params,
+                                          glare_matte_apply),
+              'glare_glossy': Perturbation(glare_glossy_params,
+                                           glare_glossy_apply),
+              'tilt': Perturbation(tilt_params, tilt_apply),
+              'brightness_up': Perturbation(brightness_up_params,
+                                            photometric_apply),
+              'brightness_down': Perturbation(brightness_down_params,
+                                              photometric_apply),
+              'contrast_up': Perturbation(contrast_up_params,
+                                          photometric_apply),
+              'contrast_down': Perturbation(contrast_down_params,
+                                            photometric_apply),
+              'identity': Perturbation(identity_params, identity_apply),
+              'random-digital': Perturbation(random_digital_params,
+                                             photometric_apply),
+              'rotation': Perturbation(rotation_params, rotation_apply),
+              'translation': Perturbation(translation_params,
+                                          translation_apply),
+              'exposure': Perturbation(exposure_params, photometric_apply)}
+# Perturbations that only remap pixel values, whose parameters hold their
+# operations under 'ops'. Consecutive steps among these can be fused into one
+# pass.
+PHOTOMETRIC = {'brightness_up', 'brightness_down', 'contrast_up',
+               'contrast_down', 'random-digital', 'exposure'}
+# Perturbations that only warp pixel coordinates, with the function computing
+# their homography from their parameters and the function resampling it when
+# applied on its own. Consecutive steps among these can be fused into one
+# resampling.
+GEOMETRIC = {'tilt': (tilt_warp, warp_image),
+             'translation': (translation_warp, warp_image),
+             'rotation': (rotation_warp, rotate_image)}
+# Perturbations with parameters in absolute pixel lengths, with the function
+# scaling them to an image resized by a given factor. The parameters of the
+# others are unitless or drawn in proportion to the size of the image.
+SCALE_PARAMS = {'moire': moire_scale,
+                'blur': blur_scale,
+                'motion': motion_scale,
+                'glare_matte': glare_matte_scale,
+                'translation': translation_scale}
 LEVELS = [1, 2, 3, 4]
@@ -1,22 +1,38 @@
 """Implement contrast on a set of images."""
 import numpy as np
-from PIL import ImageEnhance
+from transforms.photometric import photometric_apply
 
 
-def contrast_up_mapping(level, src_img):
-    """Perform contrast adjustment.
+def contrast_up_params(level, rng, size):
+    """Draw the parameters of the contrast up effect.
 
     Args:
         level (int): level of perturbation
-        src_img (Image): PIL Image to perturb
+        rng (np.random.RandomState): random state to draw from
+        size (tuple): (width, height) of the image to perturb
 
     Returns:
-        (Image): the Image perturbed by the contrast
+        (dict): the photometric operations to apply, under 'ops'
 
     """
     if level == 1:
         factor = 0.5
     else:
         factor = level
-    noisy_factor = 1 + factor * 0.2 + np.random.uniform(-0.01, 0.01)
-    return ImageEnhance.Contrast(src_img).enhance(noisy_factor)
+    noisy_factor = 1 + factor * 0.2 + rng.uniform(-0.01, 0.01)
+    return {'ops': [('contrast', noisy_factor)]}
+
+
+def contrast_up_mapping(level, src_img):
+    """Perform contrast adjustment.
+
+    Args:
+        level (int): level of perturbation
+        src_img (Image): PIL Image to perturb
+
+    Returns:
+        (Image): the Image perturbed by the contrast
+
+    """
+    return photometric_apply(src_img,
+                             contrast_up_params(level, np.random, src_img.size))
@@ -1,29 +1,41 @@
 """Implement exposure correction on a set of images."""
 import numpy as np
-from PIL import Image
-from skimage import exposure
+from transforms.photometric import photometric_apply
 
 
-def exposure_mapping(level, src_img):
-    """Perform contrast adjustment.
+def exposure_params(level, rng, size):
+    """Return the parameters of the exposure shift, which draws none.
 
     Args:
         level (int): level of perturbation
-        src_img (Image): PIL Image to perturb
+        rng (np.random.RandomState): random state to draw from
+        size (tuple): (width, height) of the image to perturb
 
     Returns:
-        (Image): the Image perturbed by the exposure shift
+        (dict): the photometric operations to apply, under 'ops'
 
     """
-    image = np.asarray(src_img)
     # min 0.5, max 2
     # ) = I ** gama after scaling 0 to 1
     #expose = exposure.adjust_gamma(image, gamma=(level/5.0)*1.5 + 0.5, gain=1)
 
     #expose = exposure.adjust_log(image, gain=1.1)
 
-    expose = exposure.adjust_sigmoid(image, cutoff= 0.5, gain=5)
-
     #expose = exposure.equalize_hist(image)
-    return Image.fromarray(expose, "RGB")
+    return {'ops': [('sigmoid', (0.5, 5))]}
+
+
+def exposure_mapping(level, src_img):
+    """Perform contrast adjustment.
 
+    Args:
+        level (int): level of perturbation
+        src_img (Image): PIL Image to perturb
+
+    Returns:
+        (Image): the Image perturbed by the exposure shift. Grayscale images
+            stay single-channel
+
+    """
+    return photometric_apply(src_img,
+                             exposure_params(level, np.random, src_img.size))
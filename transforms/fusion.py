@@ -0,0 +1,77 @@
+"""Fuse consecutive pipeline steps that can be applied together.
+
+Photometric steps are composed into one lookup table and geometric steps into
+one homography. Such steps return a deferred image, which is only applied
+when a step of another kind, or the caller, needs its pixels.
+
+"""
+from transforms.constants import GEOMETRIC, PARAMETRIC, PHOTOMETRIC
+from transforms.homography import DeferredWarp
+from transforms.photometric import DeferredPhotometric
+
+
+def apply_fused(perturbation, params, img):
+    """Apply a pipeline step, deferring it if it can be fused.
+
+    Args:
+        perturbation (str): name of perturbation to be applied
+        params (dict): parameters of the step, as drawn by its sample_params
+        img (Image): the image to perturb, possibly deferred
+
+    Returns:
+        (Image): the perturbed image, possibly deferred. Pass it to resolve
+            before using its pixels
+
+    """
+    if perturbation in PHOTOMETRIC:
+        if isinstance(img, DeferredPhotometric):
+            return img.then(params['ops'])
+        return DeferredPhotometric(resolve(img), params['ops'])
+    if perturbation in GEOMETRIC:
+        get_warp, resample = GEOMETRIC[perturbation]
+        if isinstance(img, DeferredWarp):
+            return img.then(*get_warp(params, img.size))
+        img = resolve(img)
+        return DeferredWarp(img, *get_warp(params, img.size), resample)
+    return PARAMETRIC[perturbation].apply(resolve(img), params)
+
+
+def resolve(img):
+    """Return the pixels of img, applying any deferred steps."""
+    if isinstance(img, (DeferredPhotometric, DeferredWarp)):
+        return img.resolve()
+    return img
+
+
+def is_pending(img):
+    """Whether img holds deferred steps that have not been applied yet."""
+    return isinstance(img, (DeferredPhotometric, DeferredWarp)) and \
+        not img.resolved
+
+
+def fusion_kind(perturbation):
+    """Get the kind of steps a perturbation is fused with, or None."""
+    if perturbation in PHOTOMETRIC:
+        return 'photometric'
+    if perturbation in GEOMETRIC:
+        return 'geometric'
+    return None
+
+
+def deferred_steps(steps):
+    """Get the steps of a pipeline still deferred after applying it.
+
+    Args:
+        steps (tuple): (perturbation, level) steps applied so far, in order
+
+    Returns:
+        (tuple): the trailing steps that are fused together, or an empty
+            tuple if the last step is applied at once
+
+    """
+    kind = fusion_kind(steps[-1][0]) if steps else None
+    start = len(steps)
+    while kind is not None and start > 0 and \
+            fusion_kind(steps[start - 1][0]) == kind:
+        start -= 1
+    return tuple(steps[start:])
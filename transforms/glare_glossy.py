@@ -2,13 +2,12 @@
 
 import numpy as np
 from PIL import Image
-from scipy.stats import multivariate_normal
 
 
 # TODO: explore other possible covariance matrices
 # TODO: another type of boundary which is a line
 def glare_glossy_mapping(level, src_img):
-    """Perform the glare matte mapping.
+    """Perform the glare glossy mapping.
 
     Args:
         level (int): level of perturbation
@@ -17,87 +16,118 @@ def glare_glossy_mapping(level, src_img):
     Returns:
         (Image): the Image perturbed by the glare mapping
 
+    """
+    return glare_glossy_apply(src_img, glare_glossy_params(level, np.random,
+                                                           src_img.size))
+
+
+def glare_glossy_params(level, rng, size):
+    """Draw the parameters of the glare glossy mapping.
+
+    Args:
+        level (int): level of perturbation
+        rng (np.random.RandomState): random state to draw from
+        size (tuple): (width, height) of the image to perturb
+
+    Returns:
+        (dict): parameters of the glare, as returned by glare_params
+
     """
     # choose between glare gaussian/covariance and a line based glare
     # gaussian/covarairance....randomly in image, choice of location and size
-    width, height = src_img.size
-    location = np.random.randint(1, 10)
-    return glare(src_img, location, level)
+    location = rng.randint(1, 10)
+    return glare_params(location, level, rng, size)
 
 
 def glare(img, location, level):
-    """Simulate a glare effect.
+    """Simulate a glossy glare effect.
 
-    Generate semi-transparent white masks where opacity is determined by a
-    2-dimensional Gaussian. Masks are directly alpha-composited onto the
-    image.
+    Blend a semi-transparent white rectangle into the image at one of nine
+    locations. Only the pixels of the rectangle are touched, so the cost
+    depends on the glare area rather than the image area. Grayscale images
+    stay single-channel.
 
     Args:
         img (Image): PIL image on which to apply the glare effect
-        mask_params (list): list of (mean, cov, max_val), which control
-            various aspects of mask appearance.
-            mean (np.ndarray): (x, y) point about which Gaussian is centered
-            cov (np.ndarray): 2x2 matrix controlling spread of Gaussian
-            max_val (float): value to normalize values to before clamping
+        location (int): where to place the glare, from 1 (top left) to 9
+            (bottom right), numbered down each column: 1, 2 and 3 are the
+            left column from top to bottom, 4, 5 and 6 the middle column
+            and 7, 8 and 9 the right column, so 1, 4 and 7 are the top row
+        level (int): level of perturbation
+
+    Returns:
+        (Image): the Image perturbed by the glare
+
+    """
+    return glare_glossy_apply(img, glare_params(location, level, np.random,
+                                                img.size))
+
+
+def glare_params(location, level, rng, size):
+    """Draw the rectangle and opacity of a glossy glare.
+
+    Args:
+        location (int): where to place the glare, from 1 (top left) to 9
+            (bottom right), numbered down each column: 1, 2 and 3 are the
+            left column from top to bottom, 4, 5 and 6 the middle column
+            and 7, 8 and 9 the right column, so 1, 4 and 7 are the top row
         level (int): level of perturbation
+        rng (np.random.RandomState): random state to draw from
+        size (tuple): (width, height) of the image to perturb
+
+    Returns:
+        (dict): (left, top, right, bottom) of the glare within the image,
+            under 'box', and its opacity in [0, 255], under 'opacity'
+
+    """
+    width, height = size
+    width_box = level * 0.1 * width + rng.uniform(0, 0.05) * width
+    height_box = level * 0.1 * height + rng.uniform(0, 0.05) * height
+    # Rows of the glare
+    if location in (1, 4, 7): # Top
+        top, bottom = 0, int(height_box)
+    elif location in (3, 6, 9): # Bottom
+        top, bottom = height - int(height_box), height
+    else: # Center
+        start_x = rng.uniform(0.3, 0.7)
+        top = int(start_x * height - height_box/2)
+        bottom = int(start_x * height + height_box/2)
+    # Columns of the glare
+    if location in (1, 2, 3): # Left
+        left, right = 0, int(width_box)
+    elif location in (7, 8, 9): # Right
+        left, right = width - int(width_box), width
+    else: # Center
+        start_y = rng.uniform(0.3, 0.7)
+        left = int(start_y * width - width_box/2)
+        right = int(start_y * width + width_box/2)
+    opacity = int(150 + 20 * level + rng.uniform(0, 20))
+
+    top, left = max(top, 0), max(left, 0)
+    bottom, right = min(bottom, height), min(right, width)
+    return {'box': (left, top, right, bottom), 'opacity': opacity}
+
+
+def glare_glossy_apply(img, params):
+    """Blend a glossy glare into an image with given parameters.
+
+    Args:
+        img (Image): PIL image on which to apply the glare effect
+        params (dict): parameters of the glare, as returned by glare_params
+
+    Returns:
+        (Image): the Image perturbed by the glare
 
     """
-    img = img.convert('RGBA')
-    width, height = img.size
-    mask = np.zeros((height, width, 4), dtype=float)
-    mask[:, :, :3] = 255
-    mask[:, :, 3] = 0
-    width_box = level * 0.1 * width + np.random.uniform(0, 0.05) * width
-    height_box = level * 0.1 * height + np.random.uniform(0, 0.05) * height
-    location = np.random.randint(1, 10)
-    if location == 1: # Top left
-        mask[:int(height_box), :int(width_box), 3] = \
-            150 + 20 * level + np.random.uniform(0, 20)
-    if location == 2: # Left center
-        start_x = np.random.uniform(0.3, 0.7)
-        x_start = int(start_x * height - height_box/2)
-        x_end = int(start_x * height + height_box/2)
-        mask[x_start: x_end, :int(width_box), 3] = \
-            150 + 20 * level + np.random.uniform(0, 20)
-    if location == 3: # Bottom left
-        mask[height - int(height_box):height, :int(width_box), 3] = \
-            150 + 20 * level + np.random.uniform(0, 20)
-    if location == 4: # Top center
-        start_y = np.random.uniform(0.3, 0.7)
-        y_start = int(start_y * width - width_box/2)
-        y_end = int(start_y * width + width_box/2)
-        mask[:int(height_box), y_start:y_end, 3] = \
-            150 + 20 * level + np.random.uniform(0, 20)
-    if location == 5: # Center
-        start_x = np.random.uniform(0.3, 0.7)
-        x_start = int(start_x * height - height_box/2)
-        x_end = int(start_x * height + height_box/2)
-        start_y = np.random.uniform(0.3, 0.7)
-        y_start = int(start_y * width - width_box/2)
-        y_end = int(start_y * width + width_box/2)
-        mask[x_start:x_end, y_start:y_end, 3] = \
-            150 + 20 * level + np.random.uniform(0, 20)
-    if location == 6: # Bottom center
-        start_y = np.random.uniform(0.3, 0.7)
-        y_start = int(start_y * width - width_box/2)
-        y_end = int(start_y * width + width_box/2)
-        mask[height - int(height_box):height, y_start:y_end, 3] = \
-            150 + 20 * level + np.random.uniform(0, 20)
-    if location == 7: # Top right
-        mask[:int(height_box), width - int(width_box):width, 3] = \
-            150 + 20 * level + np.random.uniform(0, 20)
-    if location == 8: # Right center
-        start_x = np.random.uniform(0.3, 0.7)
-        x_start = int(start_x * height - height_box/2)
-        x_end = int(start_x * height + height_box/2)
-        mask[x_start:x_end, width - int(width_box):
-             width, 3] = \
-            150 + 20 * level + np.random.uniform(0, 20)
-    if location == 9: # Bottom right
-        mask[height - int(height_box):height, width - int(width_box):
-             width, 3] = \
-            150 + 20 * level + np.random.uniform(0, 20)
-    mask = Image.fromarray(np.uint8(mask))
-    img.alpha_composite(mask)
-    img = img.convert('RGB')
+    left, top, right, bottom = params['box']
+    if img.mode == 'L':
+        img = img.copy()
+        white = 255
+    else:
+        img = img.convert('RGB')
+        white = (255, 255, 255)
+    if bottom > top and right > left:
+        img.paste(white, box=(left, top, right, bottom),
+                  mask=Image.new('L', (right - left, bottom - top),
+                                 params['opacity']))
     return img
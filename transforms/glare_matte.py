@@ -17,11 +17,54 @@ def glare_matte_mapping(level, src_img):
         (Image): the Image perturbed by the glare mapping
 
     """
-    width, height = src_img.size
+    return glare_matte_apply(src_img, glare_matte_params(level, np.random,
+                                                         src_img.size))
+
+
+def glare_matte_params(level, rng, size):
+    """Draw the parameters of the glare matte mapping.
+
+    Args:
+        level (int): level of perturbation
+        rng (np.random.RandomState): random state to draw from
+        size (tuple): (width, height) of the image to perturb
+
+    Returns:
+        (dict): the (mean, cov, max_val) of each mask, under 'masks', and
+            the level, which caps the opacity, under 'level'
+
+    """
+    width, height = size
     cov = (level*50) ** 2
-    return glare_matte(src_img, [([np.random.uniform(0, width),
-                                   np.random.uniform(0, height)],
-                                  [[cov, 0], [0, cov]], level*100)], level)
+    return {'masks': [([rng.uniform(0, width), rng.uniform(0, height)],
+                       [[cov, 0], [0, cov]], level*100)],
+            'level': level}
+
+
+def glare_matte_apply(img, params):
+    """Apply the glare matte mapping with given parameters."""
+    return local_glare_matte(img, params['masks'], params['level'])
+
+
+def glare_matte_scale(params, scale):
+    """Scale the spread of the glare to a resized image.
+
+    The means are drawn within the image, so only the covariances, in
+    squared pixels, are scaled.
+
+    Args:
+        params (dict): parameters drawn by glare_matte_params
+        scale (float): ratio of the size of the resized image to the size
+            the parameters were drawn for
+
+    Returns:
+        (dict): parameters with covariances scaled
+
+    """
+    return {**params,
+            'masks': [(mean, [[value * scale ** 2 for value in row]
+                              for row in cov], max_val)
+                      for mean, cov, max_val in params['masks']]}
 
 
 def glare_matte(img, mask_params, level):
@@ -29,7 +72,8 @@ def glare_matte(img, mask_params, level):
 
     Generate semi-transparent white masks where opacity is determined by a
     2-dimensional Gaussian. Masks are directly alpha-composited onto the
-    image.
+    image. Grayscale images are blended in place of compositing, so they
+    stay single-channel.
 
     Args:
         img (Image): PIL image on which to apply the glare effect
@@ -41,6 +85,12 @@ def glare_matte(img, mask_params, level):
         level (int): level of perturbation
 
     """
+    if img.mode == 'L':
+        img = img.copy()
+        for mean, cov, max_val in mask_params:
+            alpha = generate_glare_alpha(img.size, mean, cov, max_val, level)
+            img.paste(255, mask=Image.fromarray(alpha))
+        return img
     img = img.convert('RGBA')
     for mean, cov, max_val in mask_params:
         mask = generate_glare_mask(img.size, mean, cov, max_val, level)
@@ -49,8 +99,89 @@ def glare_matte(img, mask_params, level):
     return img
 
 
-def generate_glare_mask(mask_size, mean, cov, max_val, level):
-    """Generate a glare mask from a 2-dimensional Gaussian.
+def local_glare_matte(img, mask_params, level):
+    """Simulate a glare effect, only touching the pixels it brightens.
+
+    Produces the same effect as glare_matte. For isotropic covariances the
+    Gaussian is separable, so the opacity is computed in float32 as the outer
+    product of two 1-D Gaussians over the bounding box outside of which it
+    rounds down to zero, and white is blended into that box only.
+
+    Args:
+        img (Image): PIL image on which to apply the glare effect
+        mask_params (list): list of (mean, cov, max_val), as in glare_matte
+        level (int): level of perturbation
+
+    Returns:
+        (Image): the Image perturbed by the glare
+
+    """
+    if img.mode == 'L':
+        img = img.copy()
+        white = 255
+    else:
+        img = img.convert('RGB')
+        white = (255, 255, 255)
+    for mean, cov, max_val in mask_params:
+        if cov[0][1] == 0 and cov[1][0] == 0 and cov[0][0] == cov[1][1]:
+            box, alpha = generate_local_glare_alpha(img.size, mean, cov[0][0],
+                                                    max_val, level)
+        else:
+            box = (0, 0) + img.size
+            alpha = generate_glare_alpha(img.size, mean, cov, max_val, level)
+        if alpha is not None:
+            img.paste(white, box=box, mask=Image.fromarray(alpha))
+    return img
+
+
+def generate_local_glare_alpha(mask_size, mean, var, max_val, level):
+    """Compute the opacity of an isotropic glare within its bounding box.
+
+    Equivalent to generate_glare_alpha with cov [[var, 0], [0, var]],
+    cropped to the pixels with non-zero opacity. The normalized PDF is
+    max_val * gx(x) * gy(y), where each 1-D factor equals 1 at the grid
+    point closest to the mean, so it is at least 1 only where both factors
+    are at least 1 / max_val.
+
+    Args:
+        mask_size (tuple): (width, height) of the full mask
+        mean (np.ndarray): (x, y) point about which Gaussian is centered
+        var (float): variance of the Gaussian along each axis
+        max_val (float): value to normalize values to before clamping
+        level (int): level of perturbation
+
+    Returns:
+        box (tuple): (left, upper, right, lower) of the non-zero opacity
+        alpha (np.ndarray): uint8 opacity within box, or None if no pixel
+            has non-zero opacity
+
+    """
+    if max_val < 1:
+        return None, None
+    box = []
+    factors = []
+    for center, size in zip(mean, mask_size):
+        # Squared distance from the mean to its closest grid point, where
+        # the normalized PDF peaks
+        peak_dist2 = (min(max(round(center), 0), size - 1) - center) ** 2
+        radius = np.sqrt(peak_dist2 + 2 * var * np.log(max_val))
+        start = max(0, int(np.floor(center - radius)))
+        end = min(size, int(np.floor(center + radius)) + 1)
+        if start >= end:
+            return None, None
+        coords = np.arange(start, end, dtype=np.float32) - np.float32(center)
+        factors.append(np.exp((peak_dist2 - coords ** 2) /
+                              np.float32(2 * var)))
+        box.append((start, end))
+    gx, gy = factors
+    alpha = np.fmin(np.float32(150 + 20*level),
+                    np.float32(max_val) * gy[:, None] * gx[None, :])
+    (left, right), (upper, lower) = box
+    return (left, upper, right, lower), alpha.astype(np.uint8)
+
+
+def generate_glare_alpha(mask_size, mean, cov, max_val, level):
+    """Generate the opacity of a glare mask from a 2-dimensional Gaussian.
 
     Args:
         mask_size (tuple): (width, height) of the mask to generate
@@ -60,19 +191,38 @@ def generate_glare_mask(mask_size, mean, cov, max_val, level):
         level (int): level of perturbation
 
     Returns:
-        (Image): RGBA base mask of size mask_size
+        (np.ndarray): uint8 opacity of shape (height, width)
 
     """
     width, height = mask_size
-    mask = np.zeros((height, width, 4), dtype=float)
-    # Set mask to be all white
-    mask[:, :, :3] = 255
     # Spatially compute normal PDF values
     normal = multivariate_normal(mean=mean, cov=cov)
     x_vals, y_vals = np.meshgrid(np.arange(width), np.arange(height))
     vals = np.stack([x_vals, y_vals], axis=-1)
     alpha = normal.pdf(vals)
+    # Renormalize and clamp PDF values
+    return np.uint8(np.fmin(150 + 20*level, alpha * max_val / np.max(alpha)))
+
+
+def generate_glare_mask(mask_size, mean, cov, max_val, level):
+    """Generate a glare mask from a 2-dimensional Gaussian.
+
+    Args:
+        mask_size (tuple): (width, height) of the mask to generate
+        mean (np.ndarray): (x, y) point about which Gaussian is centered
+        cov (np.ndarray): 2x2 matrix controlling spread of Gaussian
+        max_val (float): value to normalize values to before clamping
+        level (int): level of perturbation
+
+    Returns:
+        (Image): RGBA base mask of size mask_size
+
+    """
+    width, height = mask_size
+    mask = np.zeros((height, width, 4), dtype=np.uint8)
+    # Set mask to be all white
+    mask[:, :, :3] = 255
     # Set alpha channel to renormalized and clamped PDF values
-    mask[:, :, 3] = np.fmin(150 + 20*level, alpha * max_val / np.max(alpha))
+    mask[:, :, 3] = generate_glare_alpha(mask_size, mean, cov, max_val, level)
     # Convert np.ndarray to PIL Image for further processing
-    return Image.fromarray(np.uint8(mask))
+    return Image.fromarray(mask)
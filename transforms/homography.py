@@ -0,0 +1,124 @@
+"""Homographies shared by the geometric perturbations.
+
+A warp is described by a 3x3 homography mapping output pixel coordinates to
+input pixel coordinates, in the convention of PIL's PERSPECTIVE transform,
+where the centre of pixel (i, j) lies at (i + 0.5, j + 0.5). Since every
+matrix maps output to input, a sequence of warps is the product of their
+matrices in the order they are applied, and is resampled once.
+
+"""
+import numpy as np
+from PIL import Image
+
+# Shift from PIL's pixel centres at i + 0.5 to OpenCV's at i
+PIL_TO_CV = np.array([[1.0, 0.0, -0.5],
+                      [0.0, 1.0, -0.5],
+                      [0.0, 0.0, 1.0]])
+CV_TO_PIL = np.linalg.inv(PIL_TO_CV)
+
+
+def find_coeffs(pa, pb):
+    """Calculate parameters for PIL perspective transform.
+
+    Solves the 8x8 linear system directly, four point correspondences
+    determining the homography exactly.
+
+    Source:
+        https://stackoverflow.com/questions/14177744/
+
+    Args:
+        pa (list): list of 4 (x, y) points to map to pb
+        pb (list): list of 4 (x, y) points to be mapped from pa
+
+    Returns:
+        (np.ndarray): parameters for PIL perspective transform
+
+    """
+    matrix = []
+    for p1, p2 in zip(pa, pb):
+        matrix.append([p1[0], p1[1], 1, 0, 0, 0, -p2[0]*p1[0], -p2[0]*p1[1]])
+        matrix.append([0, 0, 0, p1[0], p1[1], 1, -p2[1]*p1[0], -p2[1]*p1[1]])
+
+    A = np.array(matrix, dtype=np.float64)
+    B = np.array(pb, dtype=np.float64).reshape(8)
+    return np.linalg.solve(A, B)
+
+
+def coeffs_to_matrix(coeffs):
+    """Convert PIL perspective parameters to a 3x3 homography."""
+    return np.append(np.asarray(coeffs, dtype=np.float64), 1.0).reshape(3, 3)
+
+
+def matrix_to_coeffs(matrix):
+    """Convert a 3x3 homography to PIL perspective parameters."""
+    return tuple((matrix / matrix[2, 2]).reshape(9)[:8])
+
+
+def affine_to_matrix(affine):
+    """Convert an OpenCV forward affine transform to a homography.
+
+    Args:
+        affine (np.ndarray): 2x3 matrix mapping input to output pixels, as
+            passed to cv2.warpAffine
+
+    Returns:
+        (np.ndarray): 3x3 homography mapping output to input pixels
+
+    """
+    forward = np.vstack([affine, [0.0, 0.0, 1.0]])
+    return CV_TO_PIL @ np.linalg.inv(forward) @ PIL_TO_CV
+
+
+def matrix_to_affine(matrix):
+    """Convert an affine homography back to an OpenCV forward transform."""
+    forward = np.linalg.inv(PIL_TO_CV @ matrix @ CV_TO_PIL)
+    return forward[:2] / forward[2, 2]
+
+
+def warp_image(img, matrix, size):
+    """Resample an image through a homography.
+
+    Args:
+        img (Image): PIL Image to warp
+        matrix (np.ndarray): 3x3 homography mapping output to input pixels
+        size (tuple): (width, height) of the output
+
+    Returns:
+        (Image): the warped Image, black outside of the input
+
+    """
+    return img.transform(size, Image.PERSPECTIVE, matrix_to_coeffs(matrix),
+                         Image.BICUBIC)
+
+
+class DeferredWarp:
+    """An image with geometric warps not yet applied.
+
+    Consecutive geometric steps of a pipeline accumulate their homographies
+    here, so the whole run is resampled once when a later step or the caller
+    needs the pixels. A single warp is resampled with the function of its
+    own perturbation, so its output is unchanged by deferring it.
+
+    """
+
+    def __init__(self, img, matrix, size, resample):
+        self.img = img
+        self.matrix = matrix
+        self.size = size
+        self.resample = resample
+        self._result = None
+
+    @property
+    def resolved(self):
+        """Whether the warps have been resampled already."""
+        return self._result is not None
+
+    def then(self, matrix, size):
+        """Return a new deferred image with a warp appended."""
+        return DeferredWarp(self.img, self.matrix @ matrix, size, warp_image)
+
+    def resolve(self):
+        """Resample the accumulated warps, once."""
+        if self._result is None:
+            self._result = self.resample(self.img, self.matrix, self.size)
+        return self._result
@@ -13,3 +13,13 @@ def identity_mapping(level, src_img):
 
     """
     return src_img
+
+
+def identity_params(level, rng, size):
+    """Return the parameters of the identity mapping, which has none."""
+    return {}
+
+
+def identity_apply(img, params):
+    """Apply the identity mapping, returning img itself."""
+    return img
@@ -1,8 +1,24 @@
 """Implement a synthetic Moire effect."""
 
+import math
+
 import numpy as np
 from PIL import Image
 
+from transforms.cache import LRUCache
+from transforms.homography import find_coeffs
+
+
+# Number of mask rows computed at once by analytic_moire
+BAND_HEIGHT = 64
+# Image.rotate resamples in 16.16 fixed point while every corner of the
+# image maps within this distance of the origin
+FIXED_POINT_LIMIT = 32768.0
+# Transformed mask opacities only repeat when images share parameters, so
+# their cache is disabled until a caller that shares them sets a budget
+MOIRE_ALPHA_CACHE_BYTES = 256 * 2 ** 20
+moire_alpha_cache = LRUCache(0, lambda alpha: alpha.nbytes)
+
 
 def moire_mapping(level, src_img):
     """Perform the Moire mapping.
@@ -14,6 +30,76 @@ def moire_mapping(level, src_img):
     Returns:
         (Image): the Image perturbed by the Moire mapping
 
+    """
+    return moire_apply(src_img, moire_params(level, np.random, src_img.size))
+
+
+def moire_params(level, rng, size):
+    """Draw the parameters of the Moire mapping.
+
+    Args:
+        level (int): level of perturbation
+        rng (np.random.RandomState): random state to draw from
+        size (tuple): (width, height) of the image to perturb
+
+    Returns:
+        (dict): line thickness, gap and opacity, under 'thickness', 'gap' and
+            'opacity', and the (angle, spread, offset) of each mask, under
+            'masks'
+
+    """
+    gap, opacity = get_moire_params(level)
+    return {'thickness': 1,
+            'gap': gap,
+            'opacity': opacity,
+            'masks': [(90, 0.5, (rng.uniform(0, 100),
+                                 rng.uniform(0, 100))),
+                      (90 + rng.normal(0, 1), 0.5,
+                       (rng.uniform(0, 100),
+                        rng.uniform(0, 100)))]}
+
+
+def moire_apply(img, params):
+    """Apply the Moire mapping with given parameters."""
+    return analytic_moire(img, upsample_factor=2,
+                          thickness=params['thickness'],
+                          gap=params['gap'],
+                          opacity=params['opacity'],
+                          darkness=1.0,
+                          mask_params=params['masks'])
+
+
+def moire_scale(params, scale):
+    """Scale the pixel lengths of Moire parameters to a resized image.
+
+    Args:
+        params (dict): parameters drawn by moire_params
+        scale (float): ratio of the size of the resized image to the size
+            the parameters were drawn for
+
+    Returns:
+        (dict): parameters with line thickness, gap and mask offsets scaled.
+            Lines scaled thinner than a pixel are rendered by the area of
+            each pixel they cover
+
+    """
+    return {**params,
+            'thickness': params['thickness'] * scale,
+            'gap': params['gap'] * scale,
+            'masks': [(angle, spread, (offset[0] * scale, offset[1] * scale))
+                      for angle, spread, offset in params['masks']]}
+
+
+def get_moire_params(level):
+    """Get the line gap and opacity of a level of the Moire mapping.
+
+    Args:
+        level (int): level of perturbation
+
+    Returns:
+        gap (float): gap between adjacent mask lines in pixels
+        opacity (float): opacity of mask lines in [0, 1]
+
     """
     if level == 1:
         gap = 20
@@ -27,17 +113,7 @@ def moire_mapping(level, src_img):
     else:
         gap = 1
         opacity = 0.5
-
-    return moire(src_img, upsample_factor=2,
-                 thickness=1,
-                 gap=gap,
-                 opacity=opacity,
-                 darkness=1.0,
-                 mask_params=[(90, 0.5, (np.random.uniform(0, 100),
-                                         np.random.uniform(0, 100))),
-                              (90 + np.random.normal(0, 1), 0.5,
-                               (np.random.uniform(0, 100),
-                                np.random.uniform(0, 100)))])
+    return gap, opacity
 
 
 def moire(img, upsample_factor, thickness, gap, opacity, darkness,
@@ -47,7 +123,9 @@ def moire(img, upsample_factor, thickness, gap, opacity, darkness,
     Generate semi-transparent masks consisting of parallel lines, which are
     then warped, rotated, cropped, and alpha-composited onto the original
     image. Original image is upsampled before applying masks and downsampled
-    to original size afterwards, to induce additional artifacts.
+    to original size afterwards, to induce additional artifacts. Grayscale
+    images are blended with single-channel masks, so they stay
+    single-channel.
 
     Args:
         img (Image): PIL Image on which to apply the Moire effect
@@ -66,60 +144,264 @@ def moire(img, upsample_factor, thickness, gap, opacity, darkness,
         (Image): the Image perturbed by the Moire effect
 
     """
-    # Add alpha channel to image
-    img = img.convert('RGBA')
+    grayscale = img.mode == 'L'
+    # Add alpha channel to image, unless blending into a grayscale image
+    if not grayscale:
+        img = img.convert('RGBA')
     # Upsample the image according to upsample_factor
     upsample_size = (img.width * upsample_factor, img.height * upsample_factor)
     img_resize = img.resize(upsample_size, Image.ANTIALIAS)
     # Make mask large enough so it can still contain the image when rotated
     mask_dim = max(img_resize.size) * 2
     # Create a mask with the specified parameters
-    base_mask = generate_base_mask((mask_dim, mask_dim), thickness,
-                                   gap, opacity, darkness)
+    base_mask = generate_base_mask((mask_dim, mask_dim), thickness, gap,
+                                   opacity, darkness, alpha_only=grayscale)
     # Apply transformations on the base mask, and use alpha compositing to
     # paste them onto the image
     for angle, spread, offset in mask_params:
         mask = transform_mask(base_mask, img_resize.size, angle, spread,
                               offset)
-        img_resize.alpha_composite(mask, (0, 0))
+        if grayscale:
+            img_resize.paste(int((1 - darkness) * 255), mask=mask)
+        else:
+            img_resize.alpha_composite(mask, (0, 0))
     # Downsample back to the original image size
     img = img_resize.resize(img.size, Image.ANTIALIAS)
     # Remove alpha channel for JPEG export
-    img = img.convert('RGB')
+    if not grayscale:
+        img = img.convert('RGB')
     return img
 
 
-def find_coeffs(pa, pb):
-    """Calculate parameters for PIL perspective transform.
+def analytic_moire(img, upsample_factor, thickness, gap, opacity, darkness,
+                   mask_params):
+    """Simulate a Moire effect without materializing the base mask.
+
+    Produces the same effect as moire, but instead of building a mask twice
+    the size of the upsampled image and warping, rotating and cropping it,
+    the opacity of each transformed mask is computed directly at the
+    upsampled resolution by mapping every pixel back through the crop,
+    rotation and perspective warp onto the base line pattern. Time and
+    memory therefore scale with the image rather than the base mask. Lines
+    thinner than a pixel, as drawn for a downscaled image, would alias if
+    sampled at pixel centres, so each pixel instead gets the fraction of its
+    area they cover. When moire_alpha_cache has a budget, opacities are
+    reused across images that share parameters.
+
+    Args:
+        img (Image): PIL Image on which to apply the Moire effect
+        upsample_factor (float): upsampling factor in [1, +inf)
+        thickness (float): width of mask lines in pixels
+        gap (float): gap between adjacent mask lines in pixels
+        opacity (float): opacity of mask lines in [0, 1]
+        darkness (float): darkness of mask lines in [0, 1]
+        mask_params (list): list of (angle, spread, offset), as in moire
+
+    Returns:
+        (Image): the Image perturbed by the Moire effect
+
+    """
+    if img.mode != 'L':
+        img = img.convert('RGB')
+    # Upsample the image according to upsample_factor
+    upsample_size = (img.width * upsample_factor, img.height * upsample_factor)
+    img_resize = img.resize(upsample_size, Image.ANTIALIAS)
+    # Size of the base mask that moire would have generated
+    mask_dim = max(img_resize.size) * 2
+    color = int((1 - darkness) * 255)
+    if img.mode != 'L':
+        color = (color,) * 3
+    for angle, spread, offset in mask_params:
+        key = (img_resize.size, mask_dim, thickness, gap, opacity, angle,
+               spread, tuple(offset))
+        alpha = moire_alpha_cache.get(key, lambda: generate_moire_alpha(
+            img_resize.size, mask_dim, thickness, gap, opacity, angle,
+            spread, offset))
+        img_resize.paste(color, mask=Image.fromarray(alpha))
+    # Downsample back to the original image size
+    return img_resize.resize(img.size, Image.ANTIALIAS)
+
+
+def generate_moire_alpha(out_size, mask_dim, thickness, gap, opacity, angle,
+                         spread, offset):
+    """Compute the opacity of a transformed Moire mask.
 
-    Source:
-        https://stackoverflow.com/questions/14177744/
+    Equivalent to the alpha channel of transform_mask applied to
+    generate_base_mask((mask_dim, mask_dim), ...), evaluated band by band
+    so that no array larger than BAND_HEIGHT rows is allocated besides the
+    output. Lines thinner than a pixel are rendered with the fraction of
+    each pixel they cover rather than sampled at its centre.
 
     Args:
-        pa (list): list of 4 (x, y) points to map to pb
-        pb (list): list of 4 (x, y) points to be mapped from pa
+        out_size (tuple): (width, height) of the output mask
+        mask_dim (int): side of the square base mask
+        thickness (float): width of mask lines in pixels
+        gap (float): gap between adjacent mask lines in pixels
+        opacity (float): opacity of mask lines in [0, 1]
+        angle (float): counterclockwise rotation of mask (in degrees)
+        spread (float): How much to warp lines to converge in [0, 1]
+        offset ((int, int)): (x, y) offset of mask in pixels
 
     Returns:
-        (np.ndarray): parameters for PIL perspective transform
+        (np.ndarray): uint8 opacity of shape (height, width)
 
     """
-    matrix = []
-    for p1, p2 in zip(pa, pb):
-        matrix.append([p1[0], p1[1], 1, 0, 0, 0, -p2[0]*p1[0], -p2[0]*p1[1]])
-        matrix.append([0, 0, 0, p1[0], p1[1], 1, -p2[1]*p1[0], -p2[1]*p1[1]])
+    width, height = out_size
+    # Perspective warp, mapping warped mask pixels to base mask pixels
+    coeffs = find_coeffs([(0, 0), (mask_dim, 0),
+                          (mask_dim, mask_dim), (0, mask_dim)],
+                         [(0, mask_dim * (0.5 - spread / 2)),
+                          (mask_dim, 0), (mask_dim, mask_dim),
+                          (0, mask_dim * (0.5 + spread / 2))])
+    # Rotation about the mask centre, mapping rotated mask pixels to warped
+    # mask pixels
+    matrix = rotation_matrix(angle, (mask_dim, mask_dim))
+    # Crop, mapping output pixels to rotated mask pixels
+    left = (mask_dim - width) // 2 + int(round(offset[0]))
+    upper = (mask_dim - height) // 2 + int(round(offset[1]))
+
+    period = thickness + gap
+    alpha = np.zeros((height, width), dtype=np.uint8)
+    xs = np.arange(left, left + width)
+    for band_start in range(0, height, BAND_HEIGHT):
+        band_end = min(band_start + BAND_HEIGHT, height)
+        ys = np.arange(upper + band_start, upper + band_end)[:, None]
+        # Nearest rotated mask pixel, then nearest warped mask pixel
+        warped_x, warped_y = rotate_nearest(matrix, xs, ys,
+                                            (mask_dim, mask_dim))
+        warped_x = warped_x + 0.5
+        warped_y = warped_y + 0.5
+        inside = ((warped_x >= 0) & (warped_x < mask_dim) &
+                  (warped_y >= 0) & (warped_y < mask_dim))
+        denominator = coeffs[6] * warped_x + coeffs[7] * warped_y + 1
+        base_x = np.floor((coeffs[0] * warped_x + coeffs[1] * warped_y +
+                           coeffs[2]) / denominator)
+        base_y = np.floor((coeffs[3] * warped_x + coeffs[4] * warped_y +
+                           coeffs[5]) / denominator)
+        inside &= ((base_x >= 0) & (base_x < mask_dim) &
+                   (base_y >= 0) & (base_y < mask_dim))
+        if thickness < 1:
+            coverage = line_coverage(xs + 0.5, ys + 0.5, matrix, coeffs,
+                                     period, thickness)
+            alpha[band_start:band_end] = np.where(
+                inside, np.round(coverage * int(opacity * 255)), 0)
+            continue
+        # Same as np.remainder(base_y, period), which is slower on floats
+        dark = inside & (base_y - period * np.floor(base_y / period) <
+                         thickness)
+        alpha[band_start:band_end][dark] = int(opacity * 255)
+    return alpha
+
+
+def rotation_matrix(angle, size):
+    """Compute the affine matrix Image.rotate resamples an image with.
 
-    A = np.matrix(matrix, dtype=np.float)
-    B = np.array(pb).reshape(8)
+    Args:
+        angle (float): counterclockwise rotation (in degrees)
+        size (tuple): (width, height) of the image to rotate
 
-    res = np.dot(np.linalg.inv(A.T * A) * A.T, B)
-    return np.array(res).reshape(8)
+    Returns:
+        (list): affine coefficients (a, b, c, d, e, f) mapping each pixel
+            (x, y) of the rotated image to (a x + b y + c, d x + e y + f)
+            in the original image
+
+    """
+    theta = -math.radians(angle % 360.0)
+    cos = round(math.cos(theta), 15)
+    sin = round(math.sin(theta), 15)
+    center_x, center_y = size[0] / 2.0, size[1] / 2.0
+    return [cos, sin, cos * -center_x + sin * -center_y + center_x,
+            -sin, cos, -sin * -center_x + cos * -center_y + center_y]
+
+
+def rotate_nearest(matrix, xs, ys, size):
+    """Find the pixels Image.rotate samples with nearest neighbours.
+
+    Pillow evaluates the affine matrix in 16.16 fixed point when every
+    corner of the rotated image maps within FIXED_POINT_LIMIT, and in floating
+    point otherwise, so pixels whose centres map close to a pixel edge are
+    only assigned to the same side when the same arithmetic is used.
+
+    Args:
+        matrix (list): affine coefficients computed by rotation_matrix
+        xs (np.ndarray): integer x coordinates in the rotated image
+        ys (np.ndarray): integer y coordinates in the rotated image
+        size (tuple): (width, height) of the rotated image
+
+    Returns:
+        src_x (np.ndarray): x coordinates of the sampled pixels, broadcast
+            over ys and xs
+        src_y (np.ndarray): y coordinates of the sampled pixels
+
+    """
+    a, b, c, d, e, f = matrix
+    width, height = size
+    if all(abs(a * x + b * y + c) < FIXED_POINT_LIMIT and
+           abs(d * x + e * y + f) < FIXED_POINT_LIMIT
+           for x, y in ((0, 0), (width, height), (0, height), (width, 0))):
+        def fix(v):
+            return int(math.floor(v * 65536.0 + 0.5))
+
+        xs = np.asarray(xs, dtype=np.int64)
+        ys = np.asarray(ys, dtype=np.int64)
+        src_x = (fix(c + b * 0.5 + a * 0.5) + ys * fix(b) + xs * fix(a)) >> 16
+        src_y = (fix(f + e * 0.5 + d * 0.5) + ys * fix(e) + xs * fix(d)) >> 16
+        return src_x, src_y
+    src_x = np.floor(a * (xs + 0.5) + b * (ys + 0.5) + c)
+    src_y = np.floor(d * (xs + 0.5) + e * (ys + 0.5) + f)
+    return src_x, src_y
+
+
+def line_coverage(xs, ys, matrix, coeffs, period, thickness):
+    """Compute the fraction of each output pixel covered by mask lines.
+
+    Each pixel is mapped to the base mask without rounding, and its
+    footprint there is approximated by the interval of base rows spanned by
+    the pixel square under the local linearization of the mapping. Lines
+    are the rows whose remainder by period is below thickness, so the area
+    they cover is found in closed form from its antiderivative.
+
+    Args:
+        xs (np.ndarray): x coordinates of pixel centres in the rotated mask
+        ys (np.ndarray): y coordinates of pixel centres in the rotated mask
+        matrix (list): affine coefficients of the rotation, computed by
+            rotation_matrix
+        coeffs (np.ndarray): PIL perspective coefficients of the warp
+        period (float): distance between the starts of adjacent lines
+        thickness (float): width of mask lines in pixels
+
+    Returns:
+        (np.ndarray): coverage in [0, 1], broadcast over ys and xs
+
+    """
+    cos, sin = matrix[0], matrix[1]
+    warped_x = cos * xs + sin * ys + matrix[2]
+    warped_y = -sin * xs + cos * ys + matrix[5]
+    denominator = coeffs[6] * warped_x + coeffs[7] * warped_y + 1
+    base_y = (coeffs[3] * warped_x + coeffs[4] * warped_y +
+              coeffs[5]) / denominator
+    # Derivatives of base_y along the warped mask, then the output, axes
+    d_warped_x = (coeffs[3] - base_y * coeffs[6]) / denominator
+    d_warped_y = (coeffs[4] - base_y * coeffs[7]) / denominator
+    extent = np.abs(cos * d_warped_x - sin * d_warped_y) + \
+        np.abs(sin * d_warped_x + cos * d_warped_y)
+    extent = np.maximum(extent, 1e-6)
+
+    def covered(y):
+        # Length of the lines between base row 0 and y
+        cycles = np.floor(y / period)
+        return cycles * thickness + np.minimum(y - cycles * period,
+                                               thickness)
+
+    return (covered(base_y + extent / 2) -
+            covered(base_y - extent / 2)) / extent
 
 
 def transform_mask(mask, out_size, angle, spread, offset):
     """Apply a transformation to a mask to enhance realism.
 
     Args:
-        mask (Image): RGBA mask image
+        mask (Image): RGBA mask image, or L mask of its alpha channel
         out_size (tuple): (width, height) of the output mask
         angle (float): counterclockwise rotation of mask (in degrees)
         spread (float): How much to warp lines to converge in [0, 1]
@@ -148,7 +430,8 @@ def transform_mask(mask, out_size, angle, spread, offset):
     return mask
 
 
-def generate_base_mask(mask_size, thickness, gap, opacity, darkness):
+def generate_base_mask(mask_size, thickness, gap, opacity, darkness,
+                       alpha_only=False):
     """Generate a base mask that can be later transformed.
 
     The base mask consists of semi-transparent horizontal parallel lines
@@ -160,12 +443,20 @@ def generate_base_mask(mask_size, thickness, gap, opacity, darkness):
         gap (int): gap between adjacent mask lines in pixels
         opacity (float): opacity of mask lines in [0, 1]
         darkness (float): darkness of mask lines in [0, 1]
+        alpha_only (bool): whether to only generate the alpha channel, for
+            blending into grayscale images
 
     Returns:
-        (Image): RGBA base mask of size mask_size
+        (Image): RGBA base mask of size mask_size, or L mask of its alpha
+            channel if alpha_only
 
     """
     width, height = mask_size
+    if alpha_only:
+        remainders = np.remainder(np.arange(height), thickness + gap)
+        rows = np.where(remainders < thickness, int(opacity * 255), 0)
+        mask = np.repeat(rows.astype(np.uint8)[:, None], width, axis=1)
+        return Image.fromarray(mask)
     mask = np.zeros((height, width, 4), dtype=np.uint8)
     # Compute the dark (semi-transparent) and light (transparent) rows
     remainders = np.remainder(np.arange(height), thickness + gap)
@@ -2,6 +2,15 @@
 import numpy as np
 import cv2
 from PIL import Image
+from scipy import signal
+
+# Length of blur from which a horizontal or vertical blur is computed with
+# running sums. Shorter blurs convolve directly, which rounds exactly as the
+# original dense kernel did
+BOX_MIN_LENGTH = 16
+# Length of blur from which an oblique kernel is applied as a product in the
+# frequency domain rather than by direct convolution
+FFT_MIN_LENGTH = 64
 
 
 def motion_mapping(level, src_img):
@@ -12,12 +21,58 @@ def motion_mapping(level, src_img):
         src_img (Image): PIL Image to perturb
 
     Returns:
-        (Image): the Image perturbed by the blur
+        (Image): the Image perturbed by the blur. Grayscale images stay
+            single-channel
+
+    """
+    return motion_apply(src_img, motion_params(level, None, src_img.size))
+
+
+def motion_params(level, rng, size):
+    """Return the parameters of the motion blur effect, which draws none.
+
+    Args:
+        level (int): level of perturbation
+        rng (np.random.RandomState): random state to draw from
+        size (tuple): (width, height) of the image to perturb
+
+    Returns:
+        (dict): the length of the blur in pixels, under 'size'
 
     """
-    pil_img = src_img.convert('RGB')
-    open_cv = np.array(pil_img)
-    img = open_cv[:, :, ::-1].copy()
+    return {'size': get_motion_size(level)}
+
+
+def motion_apply(src_img, params):
+    """Apply the horizontal motion blur effect with given parameters."""
+    size = params['size']
+    mode = 'L' if src_img.mode == 'L' else 'RGB'
+    img = np.asarray(src_img.convert(mode))
+    output = align_rows(motion_blur(img, size), size)
+    return Image.fromarray(output, mode)
+
+
+def motion_scale(params, scale):
+    """Scale the length of the blur to a downscaled image.
+
+    The length is rounded to the nearest odd number, so that the blur stays
+    centred. Odd lengths keep their parity, and the one row align_rows shifts
+    even lengths by is less than a row of the downscaled image.
+
+    Args:
+        params (dict): parameters drawn by motion_params
+        scale (float): ratio of the size of the resized image to the size
+            the parameters were drawn for, at most 1
+
+    Returns:
+        (dict): parameters with the length of the blur scaled
+
+    """
+    return {'size': int(params['size'] * scale / 2) * 2 + 1}
+
+
+def get_motion_size(level):
+    """Get the length in pixels of the motion blur at a level."""
     if level == 1:
         size = 2
     elif level == 2:
@@ -26,14 +81,86 @@ def motion_mapping(level, src_img):
         size = 25
     elif level == 4:
         size = 45
+    return size
+
 
-    # generating the kernel
-    kernel_motion_blur = np.zeros((size, size))
-    kernel_motion_blur[int((size-1)/2), :] = np.ones(size)
-    kernel_motion_blur = kernel_motion_blur / size
+def align_rows(output, size, axis=0):
+    """Align a horizontal blur with the original dense kernel.
 
-    # applying the kernel to the input image
-    output = cv2.filter2D(img, -1, kernel_motion_blur)
-    output = cv2.cvtColor(output.astype(np.uint8), cv2.COLOR_BGR2RGB)
+    The line of the original size x size kernel sat one row above its anchor
+    for even sizes, so the result is shifted down one row, reflecting the
+    top row.
 
-    return Image.fromarray(output)
+    Args:
+        output (np.ndarray): image blurred by motion_blur
+        size (int): length of the blur in pixels
+        axis (int): axis of the image rows
+
+    Returns:
+        (np.ndarray): the aligned image
+
+    """
+    if size % 2:
+        return output
+    rows = np.moveaxis(output, axis, 0)
+    return np.moveaxis(np.concatenate([rows[1:2], rows[:-1]]), 0, axis)
+
+
+def line_kernel(length, angle):
+    """Build the normalized kernel of a straight line through its centre.
+
+    Args:
+        length (int): length of the line in pixels
+        angle (float): counterclockwise angle of the line (in degrees)
+
+    Returns:
+        (np.ndarray): float32 kernel of shape (length, length)
+
+    """
+    kernel = np.zeros((length, length), dtype=np.float32)
+    kernel[length // 2, :] = 1
+    center = ((length - 1) / 2, (length - 1) / 2)
+    matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
+    kernel = cv2.warpAffine(kernel, matrix, (length, length))
+    return kernel / kernel.sum()
+
+
+def motion_blur(img, length, angle=0):
+    """Blur an image along a straight line.
+
+    Horizontal and vertical blurs are 1-D box filters, computed with running
+    sums from BOX_MIN_LENGTH on, so their cost does not depend on length.
+    Other angles convolve with a line kernel, switching to FFT convolution
+    for lengths of at least FFT_MIN_LENGTH. Borders are reflected as
+    cv2.filter2D reflects them.
+
+    Args:
+        img (np.ndarray): uint8 image of shape (height, width) or
+            (height, width, channels)
+        length (int): length of the blur in pixels
+        angle (float): counterclockwise angle of the blur (in degrees)
+
+    Returns:
+        (np.ndarray): the blurred uint8 image, of the same shape
+
+    """
+    angle = angle % 180
+    if angle in (0, 90):
+        ksize = (length, 1) if angle == 0 else (1, length)
+        if length >= BOX_MIN_LENGTH:
+            return cv2.blur(img, ksize, borderType=cv2.BORDER_REFLECT_101)
+        kernel = np.full(ksize[::-1], 1 / length, dtype=np.float32)
+        return cv2.filter2D(img, -1, kernel,
+                            borderType=cv2.BORDER_REFLECT_101)
+    kernel = line_kernel(length, angle)
+    if length < FFT_MIN_LENGTH:
+        return cv2.filter2D(img, -1, kernel,
+                            borderType=cv2.BORDER_REFLECT_101)
+    before, after = length // 2, length - 1 - length // 2
+    pad = [(before, after), (before, after)] + [(0, 0)] * (img.ndim - 2)
+    padded = np.pad(img.astype(np.float32), pad, mode='reflect')
+    if img.ndim == 3:
+        kernel = kernel[:, :, None]
+    output = signal.fftconvolve(padded, kernel[::-1, ::-1], mode='valid',
+                                axes=(0, 1))
+    return np.clip(np.rint(output), 0, 255).astype(np.uint8)
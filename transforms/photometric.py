@@ -0,0 +1,172 @@
+"""Fuse photometric perturbations into a single lookup table.
+
+Brightness, contrast and exposure map every pixel value independently, so a
+sequence of them is a function of the pixel value alone. Rather than running
+one full pass over the image per operation, the sequence is composed into a
+256-entry lookup table and applied with a single Image.point.
+
+Operations are (name, argument) tuples:
+    ('brightness', factor): as ImageEnhance.Brightness(img).enhance(factor)
+    ('contrast', factor): as ImageEnhance.Contrast(img).enhance(factor)
+    ('sigmoid', (cutoff, gain)): as skimage.exposure.adjust_sigmoid
+
+Contrast pivots around the mean of the image it is applied to, which is
+computed from the histogram of the source mapped through the table composed
+so far. For grayscale images this is exact. For RGB images the mean of the
+intermediate luminance is taken as the weighted mean of the channels, which
+can move the pivot by one gray level.
+
+"""
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image
+from skimage import exposure
+
+# Weights of PIL's RGB to L conversion
+LUMA_WEIGHTS = (0.299, 0.587, 0.114)
+
+GRADIENT = Image.fromarray(np.arange(256, dtype=np.uint8)[None])
+
+
+def blend_lut(base, factor):
+    """Compute the table of blending each value with a constant.
+
+    Uses Image.blend itself, so the rounding matches ImageEnhance exactly.
+
+    Args:
+        base (int): the constant value of the degenerate image
+        factor (float): blend factor, 1 leaves values unchanged
+
+    Returns:
+        (np.array): uint8 table of 256 entries
+
+    """
+    degenerate = Image.new('L', GRADIENT.size, base)
+    return np.asarray(Image.blend(degenerate, GRADIENT, factor))[0]
+
+
+@lru_cache(maxsize=None)
+def sigmoid_lut(cutoff, gain):
+    """Compute the table of skimage's sigmoid correction."""
+    lut = exposure.adjust_sigmoid(np.arange(256, dtype=np.uint8),
+                                  cutoff=cutoff, gain=gain)
+    lut.setflags(write=False)
+    return lut
+
+
+def histogram_mean(histogram, lut):
+    """Mean luminance of an image after mapping it through lut.
+
+    Args:
+        histogram (list): PIL histogram of the source, 256 entries per band
+        lut (np.array): uint8 table mapping source values
+
+    Returns:
+        (int): the mean rounded as ImageEnhance.Contrast rounds it
+
+    """
+    bands = np.asarray(histogram, dtype=np.float64).reshape(-1, 256)
+    means = bands @ lut.astype(np.float64) / bands[0].sum()
+    if len(means) == 3:
+        mean = float(np.dot(LUMA_WEIGHTS, means))
+    else:
+        mean = float(means[0])
+    return int(mean + 0.5)
+
+
+def photometric_lut(ops, histogram=None):
+    """Compose a sequence of operations into one lookup table.
+
+    Args:
+        ops (list): (name, argument) operations, applied in order
+        histogram (list): PIL histogram of the source image, only needed
+            when ops contain a contrast operation
+
+    Returns:
+        (np.array): uint8 table of 256 entries
+
+    """
+    lut = np.arange(256, dtype=np.uint8)
+    for name, arg in ops:
+        if name == 'brightness':
+            step = blend_lut(0, arg)
+        elif name == 'contrast':
+            step = blend_lut(histogram_mean(histogram, lut), arg)
+        elif name == 'sigmoid':
+            step = sigmoid_lut(*arg)
+        else:
+            raise ValueError(f'Unknown photometric operation "{name}"')
+        lut = step[lut]
+    return lut
+
+
+def apply_photometric(img, ops):
+    """Apply a sequence of operations in a single pass over the image.
+
+    Args:
+        img (Image): PIL Image to perturb
+        ops (list): (name, argument) operations, applied in order
+
+    Returns:
+        (Image): the perturbed Image. Grayscale images stay single-channel,
+            other modes are converted to RGB
+
+    """
+    if img.mode not in ('L', 'RGB'):
+        img = img.convert('RGB')
+    histogram = None
+    if any(name == 'contrast' for name, _ in ops):
+        histogram = img.histogram()
+    lut = photometric_lut(ops, histogram).tolist()
+    return img.point(lut * len(img.getbands()))
+
+
+def photometric_apply(img, params):
+    """Apply the operations drawn by a photometric perturbation.
+
+    Args:
+        img (Image): PIL Image to perturb
+        params (dict): parameters holding the operations under 'ops'
+
+    Returns:
+        (Image): the perturbed Image
+
+    """
+    return apply_photometric(img, params['ops'])
+
+
+class DeferredPhotometric:
+    """An image with photometric operations not yet applied.
+
+    Consecutive photometric steps of a pipeline accumulate their operations
+    here, so the whole run is applied as one table when a later step or the
+    caller needs the pixels.
+
+    """
+
+    def __init__(self, img, ops):
+        self.img = img
+        self.ops = list(ops)
+        self._result = None
+
+    @property
+    def size(self):
+        """Size of the image, which point operations do not change."""
+        return self.img.size
+
+    @property
+    def resolved(self):
+        """Whether the operations have been applied already."""
+        return self._result is not None
+
+    def then(self, ops):
+        """Return a new deferred image with ops appended."""
+        return DeferredPhotometric(self.img, self.ops + list(ops))
+
+    def resolve(self):
+        """Apply the accumulated operations, once."""
+        if self._result is None:
+            self._result = apply_photometric(self.img, self.ops)
+        return self._result
+
@@ -1,14 +1,34 @@
 """Randomly increase or reduce brightness and contrast on a set of images."""
 import numpy as np
-from transforms.brightness_up import brightness_up_mapping
-from transforms.brightness_down import brightness_down_mapping
-from transforms.contrast_up import contrast_up_mapping
-from transforms.contrast_down import contrast_down_mapping
-import random
+from transforms.brightness_up import brightness_up_params
+from transforms.brightness_down import brightness_down_params
+from transforms.contrast_up import contrast_up_params
+from transforms.contrast_down import contrast_down_params
+from transforms.photometric import photometric_apply
+
+
+def random_digital_params(level, rng, size):
+    """Draw the contrast and brightness operations of the digital effects.
+
+    Args:
+        level (int): level of perturbation
+        rng (np.random.RandomState): random state to draw from
+        size (tuple): (width, height) of the image to perturb
+
+    Returns:
+        (dict): the photometric operations to apply, under 'ops'
+
+    """
+    contrast = contrast_up_params(level, rng, size) if rng.randint(2) else contrast_down_params(level, rng, size)
+    brightness = brightness_up_params(level, rng, size) if rng.randint(2) else brightness_down_params(level, rng, size)
+    return {'ops': contrast['ops'] + brightness['ops']}
+
 
 def random_digital_mapping(level, src_img):
     """Perform the successive digital effects.
 
+    Both effects are fused into one pass over the image.
+
     Args:
         level (int): level of perturbation
         src_img (Image): PIL Image to perturb
@@ -17,6 +37,6 @@ def random_digital_mapping(level, src_img):
         (Image): the Image perturbed by the two transformations
 
     """
-    contrast_img = contrast_up_mapping(level, src_img) if bool(random.getrandbits(1)) else contrast_down_mapping(level, src_img)
-    img = brightness_up_mapping(level, contrast_img) if bool(random.getrandbits(1)) else brightness_down_mapping(level, contrast_img)
-    return img
+    return photometric_apply(src_img,
+                             random_digital_params(level, np.random,
+                                                   src_img.size))
@@ -2,27 +2,45 @@
 import numpy as np
 from PIL import Image
 import cv2
-import random
+from transforms.homography import affine_to_matrix, matrix_to_affine
+
+
+def rotation_params(level, rng, size):
+    """Draw the parameters of a black background rotation.
 
-def rotation_mapping(level, src_img):
-    """Perform a black background rotation transformation.
     Args:
         level (int): level of perturbation
-        src_img (Image): PIL Image to perturb
+        rng (np.random.RandomState): random state to draw from
+        size (tuple): (width, height) of the image to perturb
 
     Returns:
-        (Image): the Image perturbed by the rotation
+        (dict): the counterclockwise angle in degrees, under 'angle'
 
     """
-    pil_img = src_img.convert('RGB')
-    open_cv = np.array(pil_img)
-    img = open_cv[:, :, ::-1].copy()
-    width, height = src_img.size
     rot = 5 * level # min 15, max 60
-    if bool(random.getrandbits(1)): rot *= -1
+    if rng.randint(2): rot *= -1
+    return {'angle': rot}
+
+
+def rotation_warp(params, size):
+    """Compute the homography of a black background rotation.
+
+    The output is enlarged to hold the whole rotated image.
+
+    Args:
+        params (dict): parameters drawn by rotation_params
+        size (tuple): (width, height) of the image to perturb
+
+    Returns:
+        matrix (np.ndarray): 3x3 homography mapping output to input pixels
+        size (tuple): (width, height) of the output
+
+    """
+    width, height = size
     border_buffer = 0
 
-    matrix = cv2.getRotationMatrix2D((width//2, height//2), rot, 1.0)
+    matrix = cv2.getRotationMatrix2D((width//2, height//2), params['angle'],
+                                     1.0)
     cos, sin = np.abs(matrix[0, 0]), np.abs(matrix[0, 1])
 
     nW = int((height * sin) + (width * cos)) + border_buffer
@@ -30,7 +48,48 @@ def rotation_mapping(level, src_img):
 
     matrix[0, 2] += (nW / 2) - (width//2)
     matrix[1, 2] += (nH / 2) - (height//2)
+    return affine_to_matrix(matrix), (nW, nH)
 
-    output = cv2.warpAffine(img, matrix, (nW, nH))
+
+def rotate_image(src_img, matrix, size):
+    """Resample an image through a rotation with OpenCV.
+
+    Args:
+        src_img (Image): PIL Image to rotate
+        matrix (np.ndarray): 3x3 homography mapping output to input pixels
+        size (tuple): (width, height) of the output
+
+    Returns:
+        (Image): the rotated Image. Grayscale images stay single-channel
+
+    """
+    if src_img.mode == 'L':
+        img = np.array(src_img)
+    else:
+        pil_img = src_img.convert('RGB')
+        open_cv = np.array(pil_img)
+        img = open_cv[:, :, ::-1].copy()
+
+    output = cv2.warpAffine(img, matrix_to_affine(matrix), size)
 
     return Image.fromarray(output)
+
+
+def rotation_apply(img, params):
+    """Apply a black background rotation with given parameters."""
+    return rotate_image(img, *rotation_warp(params, img.size))
+
+
+def rotation_mapping(level, src_img):
+    """Perform a black background rotation transformation.
+    Args:
+        level (int): level of perturbation
+        src_img (Image): PIL Image to perturb
+
+    Returns:
+        (Image): the Image perturbed by the rotation. Grayscale images stay
+            single-channel
+
+    """
+    return rotation_apply(src_img, rotation_params(level, np.random,
+                                                   src_img.size))
@@ -1,31 +1,54 @@
 """Implement 3-D tilt perturbation on a set of images."""
 import numpy as np
-from PIL import Image
+from transforms.homography import coeffs_to_matrix, find_coeffs, warp_image
 
 
-def find_coeffs(pa, pb):
-    """Calculate parameters for PIL perspective transform.
+def tilt_params(level, rng, size):
+    """Draw the parameters of a 3-D tilt.
 
-    Source:
-        https://stackoverflow.com/questions/14177744/
+    Args:
+        level (int): level of perturbation
+        rng (np.random.RandomState): random state to draw from
+        size (tuple): (width, height) of the image to perturb
+
+    Returns:
+        (dict): the output points to which the image corners are mapped,
+            under 'corners'
+
+    """
+    width, height = size
+    degree = level * 0.05
+    return {'corners': [(width * rng.uniform(0, degree),
+                         height * rng.uniform(0, degree)),
+                        (width * rng.uniform(1 - degree, 1),
+                         height * rng.uniform(0, degree)),
+                        (width * rng.uniform(1 - degree, 1),
+                         height * rng.uniform(1 - degree, 1)),
+                        (width * rng.uniform(0, degree),
+                         height * rng.uniform(1 - degree, 1))]}
+
+
+def tilt_warp(params, size):
+    """Compute the homography of a 3-D tilt.
 
     Args:
-        pa (list): list of 4 (x, y) points to map to pb
-        pb (list): list of 4 (x, y) points to be mapped from pa
+        params (dict): parameters drawn by tilt_params
+        size (tuple): (width, height) of the image to perturb
 
     Returns:
-        (np.ndarray): parameters for PIL perspective transform
+        matrix (np.ndarray): 3x3 homography mapping output to input pixels
+        size (tuple): (width, height) of the output
+
     """
-    matrix = []
-    for p1, p2 in zip(pa, pb):
-        matrix.append([p1[0], p1[1], 1, 0, 0, 0, -p2[0]*p1[0], -p2[0]*p1[1]])
-        matrix.append([0, 0, 0, p1[0], p1[1], 1, -p2[1]*p1[0], -p2[1]*p1[1]])
+    width, height = size
+    coeffs = find_coeffs(params['corners'],
+                         [(0, 0), (width, 0), (width, height), (0, height)])
+    return coeffs_to_matrix(coeffs), (width, height)
 
-    A = np.matrix(matrix, dtype=np.float)
-    B = np.array(pb).reshape(8)
 
-    res = np.dot(np.linalg.inv(A.T * A) * A.T, B)
-    return np.array(res).reshape(8)
+def tilt_apply(img, params):
+    """Apply a 3-D tilt with given parameters."""
+    return warp_image(img, *tilt_warp(params, img.size))
 
 
 def tilt_mapping(level, src_img):
@@ -39,21 +62,4 @@ def tilt_mapping(level, src_img):
         (Image): the Image perturbed by the tilt
 
     """
-    width, height = src_img.size
-    degree = level * 0.05
-    coeffs = find_coeffs(
-        [(width * np.random.uniform(0, degree),
-          height * np.random.uniform(0, degree)),
-         (width * np.random.uniform(1 - degree, 1),
-          height * np.random.uniform(0, degree)),
-         (width * np.random.uniform(1 - degree, 1),
-          height * np.random.uniform(1 - degree, 1)),
-         (width * np.random.uniform(0, degree),
-          height * np.random.uniform(1 - degree, 1))],
-        [(0, 0), (width, 0), (width, height), (0, height)])
-
-    img = src_img.transform((width, height),
-                            Image.PERSPECTIVE,
-                            coeffs,
-                            Image.BICUBIC)
-    return img
+    return tilt_apply(src_img, tilt_params(level, np.random, src_img.size))
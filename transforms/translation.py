@@ -1,57 +1,70 @@
 """Implement black background translation perturbation on a set of images."""
 import numpy as np
-from PIL import Image
-import random
+from transforms.homography import coeffs_to_matrix, find_coeffs, warp_image
 
-def find_coeffs(pa, pb):
-    """Calculate parameters for PIL perspective transform.
 
-    Source:
-        https://stackoverflow.com/questions/14177744/
+def translation_params(level, rng, size):
+    """Draw the parameters of a black background translation.
 
     Args:
-        pa (list): list of 4 (x, y) points to map to pb
-        pb (list): list of 4 (x, y) points to be mapped from pa
+        level (int): level of perturbation
+        rng (np.random.RandomState): random state to draw from
+        size (tuple): (width, height) of the image to perturb
 
     Returns:
-        (np.ndarray): parameters for PIL perspective transform
+        (dict): the shift in pixels, under 'dx' and 'dy', and the margin in
+            pixels by which the image is shrunk on every side, under 'buffer'
+
     """
-    matrix = []
-    for p1, p2 in zip(pa, pb):
-        matrix.append([p1[0], p1[1], 1, 0, 0, 0, -p2[0]*p1[0], -p2[0]*p1[1]])
-        matrix.append([0, 0, 0, p1[0], p1[1], 1, -p2[1]*p1[0], -p2[1]*p1[1]])
+    dx = level * 20  # positive values shift right
+    dy = level * 20  # positive values shift down
+    if rng.randint(2): dx *= -1
+    if rng.randint(2): dy *= -1
+    return {'dx': dx, 'dy': dy, 'buffer': 100}
 
-    A = np.matrix(matrix, dtype=np.float)
-    B = np.array(pb).reshape(8)
 
-    res = np.dot(np.linalg.inv(A.T * A) * A.T, B)
-    return np.array(res).reshape(8)
+def translation_scale(params, scale):
+    """Scale the shift and margin of a translation to a resized image."""
+    return {key: value * scale for key, value in params.items()}
 
 
-def translation_mapping(level, src_img):
-    """Perform a black background translation transformation.
+def translation_warp(params, size):
+    """Compute the homography of a black background translation.
 
     Args:
-        level (int): level of perturbation
-        src_img (Image): PIL Image to perturb
+        params (dict): parameters drawn by translation_params
+        size (tuple): (width, height) of the image to perturb
 
     Returns:
-        (Image): the Image perturbed by the tilt
+        matrix (np.ndarray): 3x3 homography mapping output to input pixels
+        size (tuple): (width, height) of the output
 
     """
-    width, height = src_img.size
-
-    dx = level * 20  # positive values shift right
-    dy = level * 20  # positive values shift down
-    if bool(random.getrandbits(1)): dx *= -1
-    if bool(random.getrandbits(1)): dy *= -1
-    buffer = 100
+    width, height = size
+    dx, dy, buffer = params['dx'], params['dy'], params['buffer']
 
     coeffs = find_coeffs(
         [(dx + buffer, dy + buffer), (width - buffer + dx, buffer+dy),
          (width - buffer + dx, height - buffer + dy), (buffer + dx, height - buffer + dy)],  # after
         [(0, 0), (width, 0), (width, height), (0, height)])  # before
+    return coeffs_to_matrix(coeffs), (width, height)
+
 
-    img = src_img.transform((width, height), Image.PERSPECTIVE, coeffs, Image.BICUBIC)
+def translation_apply(img, params):
+    """Apply a black background translation with given parameters."""
+    return warp_image(img, *translation_warp(params, img.size))
 
-    return img
+
+def translation_mapping(level, src_img):
+    """Perform a black background translation transformation.
+
+    Args:
+        level (int): level of perturbation
+        src_img (Image): PIL Image to perturb
+
+    Returns:
+        (Image): the Image perturbed by the tilt
+
+    """
+    return translation_apply(src_img, translation_params(level, np.random,
+                                                         src_img.size))